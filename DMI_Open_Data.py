@@ -4,7 +4,8 @@ from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtWidgets import QAction
 
 from .resources import *
-from .DMI_Open_Data_dialog import DMIOpenDataDialog
+from .DMI_Open_Data_dialog import DMIOpenDataDialog, open_file_cache, open_observation_cache
+from .layer_updater import LayerUpdater
 import os.path
 
 
@@ -38,6 +39,8 @@ class DMIOpenData(object):
         # Declare instance attributes
         self.actions = []
         self.menu = self.tr(u'&DMI Open Data')
+        # Updates observation layers with newer observations, on demand or on a timer
+        self.layer_updater = None
 
         # Check if plugin was started the first time in current QGIS session
         # Must be set in initGui() to survive plugin reloads
@@ -143,6 +146,34 @@ class DMIOpenData(object):
             callback=self.run,
             parent=self.iface.mainWindow())
 
+        self.layer_updater = LayerUpdater()
+        self.add_action(
+            icon_path,
+            text=self.tr(u'Update observation layers'),
+            callback=lambda: self.layer_updater.update_layers(self.layer_updater.selected_layers()),
+            add_to_toolbar=False,
+            status_tip=self.tr(u'Adds the newest observations to the selected observation layers'),
+            parent=self.iface.mainWindow())
+        automatic_update_action = self.add_action(
+            icon_path,
+            text=self.tr(u'Update observation layers automatically'),
+            callback=self.layer_updater.set_automatic,
+            add_to_toolbar=False,
+            parent=self.iface.mainWindow())
+        automatic_update_action.setCheckable(True)
+        self.add_action(
+            icon_path,
+            text=self.tr(u'Clear downloaded radar and forecast files'),
+            callback=self.clear_file_cache,
+            add_to_toolbar=False,
+            parent=self.iface.mainWindow())
+        self.add_action(
+            icon_path,
+            text=self.tr(u'Clear cached observations'),
+            callback=self.clear_observation_cache,
+            add_to_toolbar=False,
+            parent=self.iface.mainWindow())
+
         # will be set False in run()
         self.first_start = True
 
@@ -154,6 +185,22 @@ class DMIOpenData(object):
                 self.tr(u'&DMI Open Data'),
                 action)
             self.iface.removeToolBarIcon(action)
+        if self.layer_updater is not None:
+            self.layer_updater.stop()
+
+
+    def clear_file_cache(self):
+        removed = open_file_cache().clear()
+        self.iface.messageBar().pushInfo(
+            self.tr(u'DMI Open Data'), self.tr(u'Removed {:.1f} MB of downloaded files').format(removed / 1024 ** 2)
+        )
+
+
+    def clear_observation_cache(self):
+        removed = open_observation_cache().clear()
+        self.iface.messageBar().pushInfo(
+            self.tr(u'DMI Open Data'), self.tr(u'Removed {:.1f} MB of cached observations').format(removed / 1024 ** 2)
+        )
 
 
     def reload_ui_on_settings_change(self):
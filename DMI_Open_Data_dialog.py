@@ -1,23 +1,35 @@
 # -*- coding: utf-8 -*-
 import os
-from typing import Tuple, Dict, Set
+from bisect import bisect
+from functools import partial
+from typing import Dict, List, Iterable
 from qgis.PyQt import QtWidgets, uic
-import requests
 import pandas as pd
-from pandas import json_normalize
 import warnings
-from tempfile import mkdtemp
-from qgis.core import QgsVectorLayer, QgsProcessing, QgsProcessingFeedback, QgsRasterLayer, QgsContrastEnhancement, QgsRasterMinMaxOrigin, QgsFeature, QgsGeometry, QgsField, QgsPointXY, QgsProject, QgsRasterLayerTemporalProperties, QgsDateTimeRange, QgsColorRampShader, QgsRasterShader, QgsSingleBandPseudoColorRenderer, QgsSingleBandGrayRenderer, QgsRasterBandStats
+from qgis.core import QgsApplication, QgsTask, QgsProcessing, QgsProcessingFeedback, QgsRasterLayer, QgsContrastEnhancement, QgsRasterMinMaxOrigin, QgsProject, QgsRasterLayerTemporalProperties, QgsDateTimeRange, QgsColorRampShader, QgsRasterShader, QgsSingleBandPseudoColorRenderer, QgsSingleBandGrayRenderer, QgsRasterBandStats
 from qgis.PyQt.QtGui import (
     QColor)
 from qgis.utils import iface
 from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
-from qgis.PyQt.QtCore import QVariant
 import webbrowser
-from .forecast_para import depth_para_dkss, salinity_nsbs, salinity_idw, salinity_if, salinity_lb, salinity_lf, salinity_ws, water_temp_nsbs, water_temp_if, water_temp_lb, water_temp_lf, water_temp_ws, water_temp_idw, v_current_nsbs, v_current_idw, v_current_if, v_current_lb, v_current_lf, v_current_ws, u_current_nsbs, u_current_idw, u_current_if,u_current_lb, u_current_lf, u_current_ws
+from .forecast_para import wam_para, nsbs_para, depth_para_dkss, forecast_bands
 import processing
-from .api.station import get_stations, StationApi, StationId, Station, Parameter
+from .api.client import OPEN_DATA_URL
+from .api.download import DEFAULT_DOWNLOAD_WORKERS, grib_complete
+from .api.features import format_times, join_coordinates
+from .api.file_cache import FileCache, DEFAULT_FILE_CACHE_SIZE
+from .api.fetch import DEFAULT_CONCURRENCY
+from .api.schemas import collection_schema, station_schema, time_column
+from .api.tail import LayerQuery
+from .fetch_tasks import FetchTask, StationObservationsTask, FeaturesTask, FileDownloadTask
+from .layer_builder import build_table_layer, build_point_layer, feature_geometry, schema_fields
+from .layer_updater import set_layer_query
+from .raster_bands import cached_bands, find_cached_bands
+from .station_list_model import create_checkable_list, replace_with_checkable_combo_box, ListItem, ButtonSelection
+from .api.observation_cache import ObservationCache
+from .api.planner import plan_station_queries, DEFAULT_BULK_STATION_THRESHOLD
+from .api.station import get_stations, get_stations_concurrently, StationApi, StationId, Station, Parameter, StationCache, DEFAULT_STATION_CACHE_TTL
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
 # The lists that will be used for parameters, stations, municipalities, 10 and 20km grids in the API calls.
@@ -32,15 +44,44 @@ FORM_CLASS, _ = uic.loadUiType(os.path.join(
 ########### DELETE ##############
 
 
+def open_file_cache() -> FileCache:
+    """
+    The cache of downloaded radar and forecast files in the QGIS profile, DMI_Open_Data/file_cache_size is in MB
+    """
+    return FileCache(
+        os.path.join(QgsApplication.qgisSettingsDirPath(), 'dmi_open_data', 'files'),
+        QSettings().value('DMI_Open_Data/file_cache_size', DEFAULT_FILE_CACHE_SIZE // 1024 ** 2, type=int) * 1024 ** 2
+    )
+
+
+def open_observation_cache() -> ObservationCache:
+    """
+    The cache of downloaded observation and climate values in the QGIS profile
+    """
+    return ObservationCache(os.path.join(QgsApplication.qgisSettingsDirPath(), 'dmi_open_data', 'observations.sqlite'))
+
+
 # This is where you import and inherit your PY UI class
 class DMIOpenDataDialog(QtWidgets.QDialog, FORM_CLASS):
     def __init__(self, parent=None):
         """Constructor."""
         super(DMIOpenDataDialog, self).__init__(parent)
         load_ui_options = {}
-        self.stations_ocean, self.oceanobs_parameters = self.get_stations_and_parameters_if_settings_allow(StationApi.OCEAN_OBS)
-        self.stations_climate, self.climatedata_parameters = self.get_stations_and_parameters_if_settings_allow(StationApi.CLIMATE_STATION_VALUE)
-        self.stations_metobs, self.metobs_parameters = self.get_stations_and_parameters_if_settings_allow(StationApi.MET_OBS)
+        # Station catalogues are cached in the QGIS profile, so the dialog opens from disk and revalidates in the background
+        self.station_cache = StationCache(
+            os.path.join(QgsApplication.qgisSettingsDirPath(), 'dmi_open_data'),
+            QSettings().value('DMI_Open_Data/station_cache_ttl', DEFAULT_STATION_CACHE_TTL, type=int)
+        )
+        # Running revalidation tasks, references are kept so they are not garbage collected while running
+        self.station_refresh_tasks = []
+        # Running downloads started by run()
+        self.fetch_tasks = []
+        # Observation and climate values already downloaded, so repeated and extended queries only fetch what's new
+        self.observation_cache = open_observation_cache()
+        # Radar and forecast files, kept across runs so the same file is only downloaded once
+        self.file_cache = open_file_cache()
+        for station_type in StationApi:
+            self.set_stations(station_type, {})
 
         super(DMIOpenDataDialog, self).setupUi(self)
         self.load_station_and_parameter_ui(**load_ui_options)
@@ -152,70 +193,188 @@ class DMIOpenDataDialog(QtWidgets.QDialog, FORM_CLASS):
 
         self.stat_radar.setEnabled(False)
 
-    def get_stations_and_parameters_if_settings_allow(self, station_type: StationApi) -> Tuple[Dict[StationId, Station], Set[str]]:
-        stations = []
-        parameters = {}
-        stations = get_stations(station_type)
-        parameters = {parameter for station in stations.values() for parameter in station.parameters }
-        return stations, parameters
+        # Selections of the fixed parameter and station buttons, kept up to date as they are toggled
+        self.ocean_parameter_selection = ButtonSelection(
+            {parameter: getattr(self, parameter) for parameter in ['sealev_dvr', 'sealev_ln', 'sea_reg', 'tw']})
+        self.wam_parameter_selection = ButtonSelection({parameter: getattr(self, parameter) for parameter in wam_para})
+        self.dkss_parameter_selection = ButtonSelection({parameter: getattr(self, parameter) for parameter in nsbs_para})
+        self.ocean_information_parameter_selection = ButtonSelection(
+            {parameter: getattr(self, parameter + '_info') for parameter in ['sea_reg', 'sealev_dvr', 'sealev_ln', 'tw']})
+        self.radar_station_selection = ButtonSelection(
+            {radar_station: getattr(self, '_' + radar_station) for radar_station in ['60960', '06036', '06194', '06177', '06103']})
+        # Several forecast parameters and depths can be checked, each file is downloaded once and becomes a layer per
+        # parameter and depth
+        self.forecast_depth_boxes = {
+            area: replace_with_checkable_combo_box(getattr(self, 'depth_box_' + area))
+            for area in ['nsbs', 'idw', 'ws', 'if', 'lf', 'lb']
+        }
+
+    def set_stations(self, station_type: StationApi, stations: Dict[StationId, Station]) -> Dict[StationId, Station]:
+        """
+        Replaces the catalogue of one station API and returns the previous one
+        """
+        parameters = {parameter for station in stations.values() for parameter in station.parameters}
+        old_stations = {}
+        if station_type is StationApi.MET_OBS:
+            old_stations = getattr(self, 'stations_metobs', {})
+            self.stations_metobs, self.metobs_parameters = stations, parameters
+        elif station_type is StationApi.CLIMATE_STATION_VALUE:
+            old_stations = getattr(self, 'stations_climate', {})
+            self.stations_climate, self.climatedata_parameters = stations, parameters
+        elif station_type is StationApi.OCEAN_OBS:
+            old_stations = getattr(self, 'stations_ocean', {})
+            self.stations_ocean, self.oceanobs_parameters = stations, parameters
+        return old_stations
+
+    def revalidate_stations_in_background(self, station_types: List[StationApi]):
+        def revalidate(task):
+            # Histories are kept, so requests can be planned from the parameters a station had in the queried period
+            return get_stations_concurrently(station_types, self.station_cache, partial(get_stations, keep_history=True))
+
+        def on_finished(exception, result=None):
+            self.station_refresh_tasks.remove(task)
+            catalogues, failures = result if exception is None and result is not None else ({}, dict.fromkeys(station_types))
+            for station_type, stations in catalogues.items():
+                self.update_stations(station_type, stations)
+            # A stale catalogue is kept on failure and revalidated again next time the dialog is opened, an API
+            # without any catalogue is fetched again when one of its tabs is activated
+            missing_station_apis = [station_type for station_type in failures if not self.get_loaded_stations(station_type)]
+            for station_type in missing_station_apis:
+                self.loaded_station_apis.discard(station_type)
+                for tab in [tab for tab, tab_station_types in self.tab_station_apis.items() if station_type in tab_station_types]:
+                    self.loaded_tabs.discard(tab)
+            if missing_station_apis:
+                iface.messageBar().pushWarning(
+                    "DMI Open Data",
+                    'Stations could not be loaded from ' + ', '.join(api.get_api_name() for api in missing_station_apis)
+                )
+
+        task = QgsTask.fromFunction('Updating DMI Open Data stations', revalidate, on_finished=on_finished)
+        self.station_refresh_tasks.append(task)
+        QgsApplication.taskManager().addTask(task)
+
+    def start_fetch_task(self, task: FetchTask):
+        """
+        Runs a download in the background, keeping a reference to the task until it is done
+        """
+        self.fetch_tasks.append(task)
+        task.taskCompleted.connect(lambda: self.fetch_tasks.remove(task))
+        task.taskTerminated.connect(lambda: self.fetch_tasks.remove(task))
+        QgsApplication.taskManager().addTask(task)
+
+    def evict_file_cache(self, keep: List[str]):
+        """
+        Removes the least recently used radar and forecast files once the cache is full, except the files of the current
+        run and the files layers in the project are made from
+        """
+        layer_sources = [layer.source() for layer in QgsProject.instance().mapLayers().values()]
+        self.file_cache.evict(keep=keep + layer_sources)
+
+    def get_loaded_stations(self, station_type: StationApi) -> Dict[StationId, Station]:
+        if station_type is StationApi.MET_OBS:
+            return self.stations_metobs
+        elif station_type is StationApi.CLIMATE_STATION_VALUE:
+            return self.stations_climate
+        elif station_type is StationApi.OCEAN_OBS:
+            return self.stations_ocean
+
+    def update_stations(self, station_type: StationApi, stations: Dict[StationId, Station]):
+        old_stations = self.set_stations(station_type, stations)
+        # Only rebuild the widgets if the catalogue actually changed
+        if {station_id: station.to_json() for station_id, station in old_stations.items()} != \
+                {station_id: station.to_json() for station_id, station in stations.items()}:
+            self.load_station_api_ui(station_type)
 
     def load_station_and_parameter_ui(self, invalid_metobs_api_key=False, invalid_oceanobs_api_key=False, invalid_climate_api_key=False):
-        # Creates the checkboxes for parameters in metObs
-        self.listCheckBox_para_stat_metObs = \
-            self.display_parameters(self.metobs_parameters, "DMISettingKeys.METOBS_API_KEY", self.scrollAreaWidgetContents_2)
-        # Creates checkboxes for stations in metobs
-        self.listCheckBox_stat_metObs = \
-            self.display_stations(self.stations_metobs, self.scrollAreaWidgetContents_3)
-        # Creates the checkboxes for parameters in climateData
-        self.listCheckBox_para_stat_climate = \
-            self.display_parameters(self.climatedata_parameters, "DMISettingKeys.CLIMATEDATA_API_KEY", self.scrollAreaWidgetContents_6)
-        # Creates the checkboxes for parameters used for grid, municipality and country
-        self.listCheckBox_para_grid = \
-            self.display_parameters(para_grid, "DMISettingKeys.CLIMATEDATA_API_KEY", self.scrollAreaWidgetContents_8)
-        # Creates the checkboxes for stations in climateData
-        self.listCheckBox_station_climate = \
-            self.display_stations(self.stations_climate, self.scrollAreaWidgetContents_5)
-        # Creates the checkboxes for cellIds in climateData
-        self.listCheckBox_grid10 = \
-            self.display_parameters(grid10, "DMISettingKeys.CLIMATEDATA_API_KEY", self.scrollAreaWidgetContents)
-        # Creates the checkboxes for cellids in climateData
-        self.listCheckBox_grid20 = \
-            self.display_parameters(grid20, "DMISettingKeys.CLIMATEDATA_API_KEY", self.scrollAreaWidgetContents_4)
-        # Creates the checkboxes for municipalities in climateData
-        self.listCheckBox_municipalityId = \
-            self.display_parameters(munic, "DMISettingKeys.CLIMATEDATA_API_KEY", self.scrollAreaWidgetContents_7)
-        # Creates the checkboxes for stations in oceanObs
-        self.listCheckBox_stat_ocean = \
-            self.display_stations(self.stations_ocean, self.scrollAreaWidgetContents_10)
+        """
+        Station and parameter lists, and the station catalogues behind them, are only filled when their tab is
+        first shown, since most sessions only use a single tab
+        """
+        # Parameters in metObs
+        self.listCheckBox_para_stat_metObs = create_checkable_list(self.scrollAreaWidgetContents_2)
+        # Stations in metObs
+        self.listCheckBox_stat_metObs = create_checkable_list(self.scrollAreaWidgetContents_3)
+        # Parameters in climateData
+        self.listCheckBox_para_stat_climate = create_checkable_list(self.scrollAreaWidgetContents_6)
+        # Stations in climateData
+        self.listCheckBox_station_climate = create_checkable_list(self.scrollAreaWidgetContents_5)
+        # Parameters for station information, only one can be chosen
         self.listCheckBox_station_climate_information = \
-            self.display_parameters(self.climatedata_parameters, "DMISettingKeys.METOBS_API_KEY",
-                                    self.scrollAreaWidgetContents_9, use_radio_button=True)
-
-    def display_stations(self, stations: Dict[StationId, Station], checkbox_container: QtWidgets.QScrollArea) -> Dict[StationId, QtWidgets.QCheckBox]:
-        checkboxes = {}
-        station_layout = checkbox_container.findChildren(QtWidgets.QVBoxLayout)[0]
-        for station_id, station in sorted(stations.items()):
-            station_checkbox_widget = QtWidgets.QCheckBox(checkbox_container)
-            station_checkbox_widget.setObjectName(station_id)
-            station_checkbox_widget.setText(f'{station_id} {station.station_name}')
-            checkboxes[station_id] = station_checkbox_widget
-            station_layout.addWidget(station_checkbox_widget)
-        return checkboxes
-
-    def display_parameters(self, parameters: Set[Parameter], settings_key: str, checkbox_container: QtWidgets.QScrollArea, use_radio_button=False) -> Dict[Parameter, QtWidgets.QCheckBox]:
-        checkboxes = {}
-        parameter_layout = checkbox_container.findChildren(QtWidgets.QVBoxLayout)[0]
-        for parameter in sorted(parameters):
-            if use_radio_button:
-                parameter_widget = QtWidgets.QRadioButton(checkbox_container)
-            else:
-                parameter_widget = QtWidgets.QCheckBox(checkbox_container)
-            # Parameters are only unique per API, mixing in settings key to make globally unique object name
-            parameter_widget.setObjectName(f"{settings_key}-{parameter}")
-            parameter_widget.setText(parameter)
-            checkboxes[parameter] = parameter_widget
-            parameter_layout.addWidget(parameter_widget)
-        return checkboxes
+            create_checkable_list(self.scrollAreaWidgetContents_9, exclusive=True)
+        # Stations in oceanObs
+        self.listCheckBox_stat_ocean = create_checkable_list(self.scrollAreaWidgetContents_10)
+        # Parameters used for grid, municipality and country
+        self.listCheckBox_para_grid = create_checkable_list(self.scrollAreaWidgetContents_8)
+        # CellIds in climateData
+        self.listCheckBox_grid10 = create_checkable_list(self.scrollAreaWidgetContents)
+        # CellIds in climateData
+        self.listCheckBox_grid20 = create_checkable_list(self.scrollAreaWidgetContents_4)
+        # Municipalities in climateData
+        self.listCheckBox_municipalityId = create_checkable_list(self.scrollAreaWidgetContents_7)
+        # The station APIs whose catalogues are needed by each tab
+        self.tab_station_apis = {
+            self.tab: [StationApi.MET_OBS],
+            self.tab_2: [StationApi.CLIMATE_STATION_VALUE],
+            self.tab_5: [StationApi.OCEAN_OBS],
+            self.tab_8: [StationApi.CLIMATE_STATION_VALUE],
+        }
+        self.loaded_tabs = set()
+        self.loaded_station_apis = set()
+        self.tabWidget.currentChanged.connect(self.load_tab_ui)
+        self.load_tab_ui(self.tabWidget.currentIndex())
+
+    def load_tab_ui(self, index: int):
+        tab = self.tabWidget.widget(index)
+        if tab in self.loaded_tabs:
+            return
+        self.loaded_tabs.add(tab)
+        if tab is self.tab_2 and self.listCheckBox_para_grid.rowCount() == 0:
+            self.listCheckBox_para_grid.set_items(self.parameter_items(para_grid))
+            self.listCheckBox_grid10.set_items(self.parameter_items(grid10))
+            self.listCheckBox_grid20.set_items(self.parameter_items(grid20))
+            self.listCheckBox_municipalityId.set_items(self.parameter_items(munic))
+        self.load_station_apis(self.tab_station_apis.get(tab, []))
+
+    def load_station_apis(self, station_types: List[StationApi]):
+        """
+        Shows cached catalogues right away, even expired ones, and fetches missing or expired ones in the background
+        """
+        revalidate_station_apis = []
+        for station_type in station_types:
+            if station_type in self.loaded_station_apis:
+                continue
+            self.loaded_station_apis.add(station_type)
+            cached = self.station_cache.load(station_type, keep_history=True)
+            if cached is None:
+                revalidate_station_apis.append(station_type)
+                continue
+            self.set_stations(station_type, cached.stations)
+            self.load_station_api_ui(station_type)
+            if cached.is_expired(self.station_cache.ttl):
+                revalidate_station_apis.append(station_type)
+        if revalidate_station_apis:
+            self.revalidate_stations_in_background(revalidate_station_apis)
+
+    def load_station_api_ui(self, station_type: StationApi):
+        """
+        Fills the station and parameter lists that depend on the catalogue of one station API.
+        Checked stations and parameters stay checked when the lists are refilled
+        """
+        if station_type is StationApi.MET_OBS:
+            self.listCheckBox_para_stat_metObs.set_items(self.parameter_items(self.metobs_parameters))
+            self.listCheckBox_stat_metObs.set_items(self.station_items(self.stations_metobs))
+        elif station_type is StationApi.CLIMATE_STATION_VALUE:
+            self.listCheckBox_para_stat_climate.set_items(self.parameter_items(self.climatedata_parameters))
+            self.listCheckBox_station_climate.set_items(self.station_items(self.stations_climate))
+            self.listCheckBox_station_climate_information.set_items(self.parameter_items(self.climatedata_parameters))
+        elif station_type is StationApi.OCEAN_OBS:
+            self.listCheckBox_stat_ocean.set_items(self.station_items(self.stations_ocean))
+
+    def station_items(self, stations: Dict[StationId, Station]) -> List[ListItem]:
+        return [(station_id, f'{station_id} {station.station_name}') for station_id, station in sorted(stations.items())]
+
+    def parameter_items(self, parameters: Iterable[Parameter]) -> List[ListItem]:
+        return [(parameter, parameter) for parameter in sorted(parameters)]
 
     def comp(self):
         self.stat_radar.setEnabled(False)
@@ -242,9 +401,9 @@ class DMIOpenDataDialog(QtWidgets.QDialog, FORM_CLASS):
     def dkssTab(self):
         self.para_stacked.setCurrentWidget(self.dkss_page)
     def depth_tab_dis(self):
-        self.groupBox_14.setEnabled(False)
+        self.groupBox_14.setEnabled(any(self.dkss_parameter_selection.is_checked(parameter) for parameter in depth_para_dkss))
     def depth_tab_enabled(self):
-        self.groupBox_14.setEnabled(True)
+        self.groupBox_14.setEnabled(any(self.dkss_parameter_selection.is_checked(parameter) for parameter in depth_para_dkss))
     def infoStat(self):
         self.stackedWidget_3.setCurrentWidget(self.met_stat_page)
     def infoGrid10(self):
@@ -406,141 +565,53 @@ class DMIOpenDataDialog(QtWidgets.QDialog, FORM_CLASS):
             elif self.little_belt.isChecked():
                 fore_area = 'lb'
 
-        # Oceanographic parameters
-        if dataName == 'Oceanographic Observations':
-            if self.sealev_dvr.isChecked():
-                parameters.append('sealev_dvr')
-                self.sealev_dvr.setChecked(False)
-            if self.sealev_ln.isChecked():
-                parameters.append('sealev_ln')
-                self.sealev_ln.setChecked(False)
-            if self.sea_reg.isChecked():
-                parameters.append('sea_reg')
-                self.sea_reg.setChecked(False)
-            if self.tw.isChecked():
-                parameters.append('tw')
-                self.tw.setChecked(False)
-
-        # Oceanographic stations
+        # The selections are read from what has been checked, without visiting every station and parameter
+        # Oceanographic parameters and stations
         if dataName == 'Oceanographic Observations':
-            for ocean_station_id in self.stations_ocean.keys():
-                qt_checkbox_widget = self.listCheckBox_stat_ocean[ocean_station_id]
-                if qt_checkbox_widget.isChecked():
-                    stations.append(ocean_station_id)
-                    qt_checkbox_widget.setChecked(False)
+            parameters += self.ocean_parameter_selection.take_checked()
+            stations += self.listCheckBox_stat_ocean.take_checked()
 
-        # Climate stations
+        # Climate stations and parameters
         if data_type2 == 'stationValue':
-            for climate_station_id in self.stations_climate.keys():
-                qt_checkbox_widget = self.listCheckBox_station_climate[climate_station_id]
-                if qt_checkbox_widget.isChecked():
-                    stations.append(climate_station_id)
-                    qt_checkbox_widget.setChecked(False)
-        
+            stations += self.listCheckBox_station_climate.take_checked()
+            parameters += self.listCheckBox_para_stat_climate.take_checked()
+
         # 10 km grid cells
         if data_type2 == '10kmGridValue':
-            for grid10_id in grid10:
-                qt_checkbox_widget = self.listCheckBox_grid10[grid10_id]
-                if qt_checkbox_widget.isChecked():
-                    stations.append(grid10_id)
-                    qt_checkbox_widget.setChecked(False)
+            stations += self.listCheckBox_grid10.take_checked()
 
         # 20 km grid cells
         if data_type2 == '20kmGridValue':
-            for grid20_id in grid20:
-                qt_checkbox_widget = self.listCheckBox_grid20[grid20_id]
-                if qt_checkbox_widget.isChecked():
-                    stations.append(grid20_id)
-                    qt_checkbox_widget.setChecked(False)
+            stations += self.listCheckBox_grid20.take_checked()
 
         # Municipality ID
         if data_type2 == 'municipalityValue':
-            for munic_id in munic:
-                qt_checkbox_widget = self.listCheckBox_municipalityId[munic_id]
-                if qt_checkbox_widget.isChecked():
-                    stations.append(munic_id)
-                    qt_checkbox_widget.setChecked(False)
+            stations += self.listCheckBox_municipalityId.take_checked()
 
         # Grid, municipality and country parameters
         if data_type2 == 'municipalityValue'or data_type2 == '20kmGridValue' or data_type2 == '10kmGridValue' or data_type2 == 'countryValue':
-            for p_g in para_grid:
-                qt_checkbox_widget = self.listCheckBox_para_grid[p_g]
-                if qt_checkbox_widget.isChecked():
-                    parameters.append(p_g)
-                    qt_checkbox_widget.setChecked(False)
+            parameters += self.listCheckBox_para_grid.take_checked()
 
-        # Climate stations parameters
-        if data_type2 == 'stationValue':
-            for parameter in self.climatedata_parameters:
-                qt_checkbox_widget = self.listCheckBox_para_stat_climate[parameter]
-                if qt_checkbox_widget.isChecked():
-                    parameters.append(parameter)
-                    qt_checkbox_widget.setChecked(False)
-            
-        # metObs stations
+        # metObs stations and parameters
         if dataName == 'Meteorological Observations':
-            for stationId in self.stations_metobs.keys():
-                qt_checkbox_widget = self.listCheckBox_stat_metObs[stationId]
-                if qt_checkbox_widget.isChecked():
-                    stations.append(stationId)
-                    qt_checkbox_widget.setChecked(False)
-
-        # metObs parameters
-        if dataName == 'Meteorological Observations':
-            for parameter in self.metobs_parameters:
-                qt_checkbox_widget = self.listCheckBox_para_stat_metObs[parameter]
-                if qt_checkbox_widget.isChecked():
-                    parameters.append(parameter)
-                    qt_checkbox_widget.setChecked(False)
+            stations += self.listCheckBox_stat_metObs.take_checked()
+            parameters += self.listCheckBox_para_stat_metObs.take_checked()
 
+        # Forecast parameters stay checked after a run
         if data_type2 == 'wam':
-            wam_para = ['wind_speed_10', 'wind_direction_10', 'sig_wave_height', 'dom_wave_period', 'mean_wave_period',
-                        'mean_zero_wave_period', 'mean_wave_dir', 'sig_height_wind_waves_sea', 'mean_period_wind_wave_sea',
-                        'mean_dir_wind_wave_sea', 'sig_height_swell', 'mean_period_swell', 'mean_dir_swell',
-                        'benjamin_index']
-            wam_para_band = list(range(1, 15))
-            para_fore_dict_wam = dict(zip(wam_para, wam_para_band))
-            for fore_para in para_fore_dict_wam:
-                qt_checkbox_widget = getattr(self, fore_para)
-                if qt_checkbox_widget.isChecked():
-                    parameters.append(fore_para)
-                    qt_checkbox_widget.setChecked(False)
+            parameters += self.wam_parameter_selection.checked_keys()
 
         if data_type2 == 'dkss':
-            nsbs_para = ['dev_sea_mean', 'u_comp_wind', 'v_comp_wind', 'u_comp_cur', 'v_comp_cur',
-                         'water_temp', 'salinity', 'ice_thick', 'ice_conc', 'u_comp_cur_',
-                         'v_comp_cur_', 'water_temp_', 'salinity_']
-            nsbs_para_band = list(range(1, 10))
-            para_fore_dict_nsbs = dict(zip(nsbs_para[0:9], nsbs_para_band))
-            for fore_para in nsbs_para:
-               qt_checkbox_widget = getattr(self, fore_para)
-               if qt_checkbox_widget.isChecked():
-                   parameters.append(fore_para)
-                   qt_checkbox_widget.setChecked(False)
-                    
+            parameters += self.dkss_parameter_selection.checked_keys()
+
         # Information for stations. The list of stations is based on climateData and NOT metObs
         if dataName == 'Stations and Parameters' and data_type2 == 'climateData':
-            for parameter in self.climatedata_parameters:
-                qt_checkbox_widget = self.listCheckBox_station_climate_information[parameter]
-                if qt_checkbox_widget.isChecked():
-                    parameters.append(parameter)
-                    qt_checkbox_widget.setChecked(False)
+            parameters += self.listCheckBox_station_climate_information.take_checked()
         if dataName == 'Stations and Parameters' and data_type2 == 'oceanObs':
-            ocean_parameters = ['sea_reg_info', 'sealev_dvr_info', 'sealev_ln_info', 'tw_info']
-            for oce_para in ocean_parameters:
-                qt_checkbox_widget = getattr(self, oce_para)
-                if qt_checkbox_widget.isChecked():
-                    parameters.append(oce_para[:-5])
-                    qt_checkbox_widget.setChecked(False)
+            parameters += self.ocean_information_parameter_selection.take_checked()
 
         if dataName == 'Radar Data' and data_type2 == 'pseudoCappi':
-            radar_stations_it  = []
-            radar_stations = ['_60960', '_06036', '_06194', '_06177', '_06103']
-            for radar_stat in radar_stations:
-                qt_checkbox_widget = getattr(self, radar_stat)
-                if qt_checkbox_widget.isChecked():
-                    radar_stations_it.append(radar_stat[1:])
-                    qt_checkbox_widget.setChecked(False)
+            radar_stations_it = self.radar_station_selection.take_checked()
         # Datetime
         # Changes the format of the datetime to make it compatible for the URL calls.
         # The format by QT is yyyy:m:d h:m:s and the format needed for URL is yyyy:mm:ddThh:mm:ssZ
@@ -586,9 +657,6 @@ class DMIOpenDataDialog(QtWidgets.QDialog, FORM_CLASS):
                                  self.tr('Start time is after end time.'))
                 return
 
-        # A list that holds all stations that doesnt meet the requirement set by the user.
-        error_stats = []
-
         # URL creation for metObs and climateData
         # Resolution
         if self.hour_climate.isChecked():
@@ -603,181 +671,138 @@ class DMIOpenDataDialog(QtWidgets.QDialog, FORM_CLASS):
         if data_type2 == 'countryValue':
             stations.append('Denmark')
             stat1 = 'Denmark'
-        # Errors if no stations or parameters chosen.
-        # When 0 is assigned to observations_count, it means that the program shouldnt run further, as there is an issue with data.
-        # num is only used in climateData, metObs and oceanObs.
+        # Errors if no stations or parameters chosen, nothing is requested then
         if dataName == 'Climate Data' or dataName == 'Meteorological Observations' or dataName == 'Oceanographic Observations':
             if len(stations) == 0:
                 QMessageBox.warning(self, self.tr("DMI Open Data"),
                                     self.tr('Please select a station.'))
-                observations_count = 0
             if len(parameters) == 0:
                 QMessageBox.warning(self, self.tr("DMI Open Data"),
                                     self.tr('Please select a parameter.'))
-                observations_count = 0
 
-        # A pandas DataFrame is created to easier manage the data, and to convert to csv.
-        station_table = pd.DataFrame()
         # Iterates over each station that has been checked by the user.
         # It is only possible to check stations in climateData, metObs and oceanObs. This section is therefor only for these 3.
-        for stat in stations:
-            station_total_observations = 0
-            url = 'https://opendataapi.dmi.dk/v2/' + data_type + '/collections/' + data_type2 + '/items'
-            # Will be initialized later, when the merge column is known
-            station_param_table = pd.DataFrame()
-            # Iterates over all the parameters that has been checked by the user.
-            for para in parameters:
-                params = {'datetime': datetime,
-                          'parameterId': para,
-                          'limit': '300000'}
-                if dataName == 'Climate Data' and data_type2 == 'stationValue':
-                    # If box is checked we filter on validity, if not we do NOT
-                    # filter, which means we allow both values. There is no way
-                    # of filtering only for invalid values
-                    if self.climate_station_value_validity_box.isChecked():
-                        params['validity'] = True
-                if dataName == 'Climate Data' and data_type2 != 'countryValue':
-                    stat_and_res = {stat1 : stat,
-                                    'timeResolution': res}
-                    params.update(stat_and_res)
+        url = OPEN_DATA_URL + '/v2/' + data_type + '/collections/' + data_type2 + '/items'
+
+        def station_parameter_params(stat, para):
+            params = {'datetime': datetime,
+                      'parameterId': para}
+            if dataName == 'Climate Data' and data_type2 == 'stationValue':
+                # If box is checked we filter on validity, if not we do NOT
+                # filter, which means we allow both values. There is no way
+                # of filtering only for invalid values
+                if self.climate_station_value_validity_box.isChecked():
+                    params['validity'] = True
+            if dataName == 'Climate Data' and data_type2 != 'countryValue':
+                stat_and_res = {stat1 : stat,
+                                'timeResolution': res}
+                params.update(stat_and_res)
 # No stations for country values.
-                elif dataName == 'Climate Data' and data_type2 == 'countryValue':
-                    res_country = {'timeResolution': res}
-                    params.update(res_country)
-                else:
-                    observed_w_stat = {stat1 : stat}
-                    params.update(observed_w_stat)
-                r = requests.get(url, params=params)  
-                print(r.url)
-                json = r.json()
-                #df = json_normalize(json['features'])
-                # Makes sure that data gets a return. If no numbers returned then shows a warning box.
-                # r_code represents the status code.
-                r_code = r.status_code
-                # if the call has the right API, then continue. This does not mean that the call will deliver data!
-                # The station could still not be measuring the wished parameter.
-                observations_count = json['numberReturned']
-                station_total_observations += observations_count
-                if observations_count > 0:
-                    df = json_normalize(json['features'])
-                    new_param_table = pd.DataFrame({para: df['properties.value']})
-                    if data_type2 == 'observation':
-                        new_param_table['observed'] = df['properties.observed']
-                        merge_column = ['observed']
-                    elif data_type == 'climateData':
-                        new_param_table['from'] = df['properties.from']
-                        new_param_table['to'] = df['properties.to']
-                        merge_column = ['from', 'to']
-                        if data_type2 == 'stationValue':
-                            new_param_table['validity'] = df['properties.validity']
-                            merge_column.append('validity')
-                    if stat1 == 'stationId':
-                        merge_column += [stat1]
-                        new_param_table[stat1] = df['properties.stationId']
-                    elif stat1 == 'cellId':
-                        merge_column += [stat1]
-                        new_param_table[stat1] = df['properties.cellId']
-                    elif stat1 == 'municipalityId':
-                        merge_column += [stat1]
-                        new_param_table[stat1] = df['properties.municipalityId']
-                    if station_param_table.empty:
-                        station_param_table = new_param_table
-                    else:
-                        station_param_table = station_param_table.merge(new_param_table, how='outer', on=merge_column)
-                # If the API is correct but the chosen parameter is not measured by the station.
-                elif observations_count == 0 and r_code != 403:
-                    error_stats.append(stat)
-            if station_total_observations > 0:
-                # Changes the name of the header and adds it to the new dataframe
-                if data_type2 == 'observation':
-                    df['properties.observed'] = pd.to_datetime(df['properties.observed'])
-                elif data_type == 'climateData':
-                    df['properties.from'] = pd.to_datetime(df['properties.from'])
-
-                if station_table.empty:
-                    station_table = station_param_table
-                else:
-                    station_table = station_table.merge(
-                        station_param_table,
-                        how='outer',
-                        on=list(set(station_table.columns) & set(station_param_table.columns))
-                    )
-                # QGIS geometry
-                # The coordinate for the station
-                coordinates = df['geometry.coordinates'].iloc[0]
-                # Name and geometry type for the layer
-                if stat1 == 'stationId':
-                    vl = QgsVectorLayer("Point", stat, "memory")
-                elif stat1 == 'municipalityId':
-                    vl = QgsVectorLayer("Point", stat + ' ' + df['properties.municipalityName'].iloc[0], "memory")
-                elif stat1 == 'cellId':
-                    vl = QgsVectorLayer("Polygon", stat, "memory")
-                elif stat1 == 'Denmark':
-                    vl = QgsVectorLayer('Point', stat1, 'memory')
-                pr = vl.dataProvider()
-                vl.startEditing()
-                # Gives headers in attribute table in QGIS
-                for head in station_param_table:
-                    if head in ['observed', 'from', 'to']:
-                        pr.addAttributes([QgsField(head, QVariant.DateTime)])
-                    elif head in parameters:
-                        pr.addAttributes([QgsField(head, QVariant.Double)])
-                    else:
-                        pr.addAttributes([QgsField(head, QVariant.String)])
-                vl.updateFields()
-                f = QgsFeature()
-                # Iterates over the rows in the df. This depends on the amount of parameters called.
-                # Maximum numbers of parameters available is 7 because of this.
-                # Cliamte data has 2 datetimes where metObs only has 1 which explains the following if statement.
-                if dataName == 'Climate Data' and data_type2 != 'countryValue':
-                    for row in station_param_table.itertuples():
-                        listee = list(row[1:len(station_param_table.columns) + 1])
-                        if stat1 == 'cellId':
-                            koordi = [QgsPointXY(coordinates[0][0][0], coordinates[0][0][1]),
-                                      QgsPointXY(coordinates[0][1][0], coordinates[0][1][1]), \
-                                      QgsPointXY(coordinates[0][2][0], coordinates[0][2][1]),
-                                      QgsPointXY(coordinates[0][3][0], coordinates[0][3][1]), \
-                                      QgsPointXY(coordinates[0][4][0], coordinates[0][4][1])]
-                            f.setGeometry(QgsGeometry.fromPolygonXY([koordi]))
-                        elif stat1 != 'cellId':
-                            f.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(coordinates[0], coordinates[1])))
-                        f.setAttributes(listee)
-                        vl.addFeature(f)
-                elif data_type2 == 'observation' or data_type2 == 'countryValue':
-                    for row in station_param_table.itertuples():
-                        listee = list(row[1:len(station_param_table.columns)+1])
-                        f.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(coordinates[0], coordinates[1])))
-                        f.setAttributes(listee)
-                        vl.addFeature(f)
-                vl.updateExtents()
-                vl.commitChanges()
-                QgsProject.instance().addMapLayer(vl)
-                iface.zoomToActiveLayer()
-        # The files are saved, if the user has chosen to write something in the "save as .csv" section
-        if dataName == 'Meteorological Observations':
-            if self.file_name_obs.text() == '':
-                pass
+            elif dataName == 'Climate Data' and data_type2 == 'countryValue':
+                res_country = {'timeResolution': res}
+                params.update(res_country)
             else:
-                station_table.to_csv(self.file_name_obs.text() + '.csv', index=False)
-                self.file_name_obs.clear()
-        elif dataName == 'Climate Data':
-            if self.file_name_cli.text() == '':
-                pass
+                observed_w_stat = {stat1 : stat}
+                params.update(observed_w_stat)
+            return params
+
+        if stations and parameters:
+            # The query parameters are made here, widgets can only be read on the main thread
+            # Combinations the station catalogue says have no data in the period are not requested
+            if data_type == 'metObs':
+                catalogue = self.stations_metobs
+            elif data_type == 'oceanObs':
+                catalogue = self.stations_ocean
+            elif data_type2 == 'stationValue':
+                catalogue = self.stations_climate
             else:
-                station_table.to_csv(self.file_name_cli.text() + '.csv', index=False)
-                self.file_name_cli.clear()
-        elif dataName == 'Oceanographic Observations':
-            if self.file_name_oce.text() == '':
-                pass
+                catalogue = {}
+            # Observations can be queried by bbox, so a parameter checked for many stations may be fetched in one query
+            if data_type in ['metObs', 'oceanObs']:
+                bulk_threshold = QSettings().value('DMI_Open_Data/bulk_station_threshold', DEFAULT_BULK_STATION_THRESHOLD, type=int)
             else:
-                station_table.to_csv(self.file_name_oce.text() + '.csv', index=False)
+                bulk_threshold = None
+            plan = plan_station_queries(stations, parameters, catalogue, datetime, bulk_threshold)
+            if plan.skipped:
+                iface.messageBar().pushInfo(
+                    "DMI Open Data",
+                    'Not requested, as the stations have no data for these parameters in the period: ' +
+                    '; '.join(stat + ' ' + ', '.join(paras) for stat, paras in plan.skipped.items())
+                )
+            station_jobs = [
+                ((stat,), para, station_parameter_params(stat, para))
+                for stat, station_parameters in plan.jobs.items() for para in station_parameters
+            ]
+            for para, bulk_query in plan.bulk.items():
+                bulk_params = {'datetime': datetime, 'parameterId': para}
+                if bulk_query.bbox is not None:
+                    bulk_params['bbox'] = bulk_query.bbox_param()
+                station_jobs.append((tuple(bulk_query.stations), para, bulk_params))
+            if dataName == 'Meteorological Observations':
+                csv_file_name = self.file_name_obs.text()
+                self.file_name_obs.clear()
+            elif dataName == 'Climate Data':
+                csv_file_name = self.file_name_cli.text()
+                self.file_name_cli.clear()
+            elif dataName == 'Oceanographic Observations':
+                csv_file_name = self.file_name_oce.text()
                 self.file_name_oce.clear()
+
+            def stations_fetched(task, completed):
+                if not completed:
+                    QMessageBox.warning(self, self.tr("DMI Open Data"),
+                                        self.tr('API request failed, try again or check for network issues'))
+                    return
+                # Layers are added in the order the stations are listed, whatever order they arrived in
+                for stat in [stat for stat in stations if stat in task.station_tables]:
+                    station_param_table, station_feature = task.station_tables[stat]
+                    # QGIS geometry
+                    # All rows of a station share the geometry of the station or cell
+                    station_geometry = feature_geometry(station_feature['geometry'])
+                    # Name and geometry type for the layer
+                    if stat1 == 'stationId':
+                        geometry_type, layer_name = 'Point', stat
+                    elif stat1 == 'municipalityId':
+                        geometry_type, layer_name = 'Point', stat + ' ' + station_feature['properties']['municipalityName']
+                    elif stat1 == 'cellId':
+                        geometry_type, layer_name = 'Polygon', stat
+                    elif stat1 == 'Denmark':
+                        geometry_type, layer_name = 'Point', stat1
+                    # Features are added to the provider in batches, without an edit session
+                    vl = build_table_layer(geometry_type, layer_name, station_param_table, station_geometry)
+                    # Observation layers remember their query, so they can be updated with newer observations in place
+                    if data_type in ['metObs', 'oceanObs']:
+                        layer_query = LayerQuery(url, {stat1: stat}, [para for para in parameters if para in station_param_table], time_column(task.schema))
+                        layer_query.advance(station_param_table)
+                        set_layer_query(vl, layer_query)
+                    QgsProject.instance().addMapLayer(vl)
+                    iface.zoomToActiveLayer()
+                # The files are saved, if the user has chosen to write something in the "save as .csv" section
+                if csv_file_name != '':
+                    if QSettings().value('DMI_Open_Data/csv_long_format', False, type=bool):
+                        # A row per value, with the parameter in a column
+                        station_table = task.observation_table.to_long()
+                    else:
+                        # The values of all stations are pivoted once
+                        station_table = task.observation_table.to_wide()
+                    format_times(station_table).to_csv(csv_file_name + '.csv', index=False)
+                # Stations that doesnt meet the requirement set by the user.
+                if len(task.error_stations) != 0:
+                    QMessageBox.warning(self, self.tr("DMI Open Data"),
+                                        self.tr('Following stations does not produce all the desired data.' + '\n' + 'Change parameters, time and/or resolution.' + '\n' + '\n' + '\n'.join(set(task.error_stations))))
+
+            # All station and parameter combinations are requested concurrently in the background, and each station is
+            # assembled as soon as all of its parameters have arrived
+            max_concurrent_requests = QSettings().value('DMI_Open_Data/max_concurrent_requests', DEFAULT_CONCURRENCY, type=int)
+            if station_jobs:
+                self.start_fetch_task(StationObservationsTask(
+                    'DMI Open Data ' + dataName, url, collection_schema(data_type, data_type2), parameters, station_jobs,
+                    stations_fetched, max_concurrent_requests,
+                    self.observation_cache if QSettings().value('DMI_Open_Data/observation_cache', True, type=bool) else None
+                ))
         # URL call radar data
         if dataName == 'Radar Data':
-            root = QgsProject.instance().layerTreeRoot()
-            layer_group = root.insertGroup(0, 'Radar ' + datetime)
-            temp = mkdtemp(suffix='_radar-files')
-            url = 'https://opendataapi.dmi.dk/v1/' + data_type + '/collections/' + data_type2 + '/items'
+            url = OPEN_DATA_URL + '/v1/' + data_type + '/collections/' + data_type2 + '/items'
             params = {'datetime' : datetime
                     }
             if self.composite.isChecked():
@@ -787,33 +812,38 @@ class DMIOpenDataDialog(QtWidgets.QDialog, FORM_CLASS):
                     params.update({'scanType': 'doppler'})
             elif self.pseudo.isChecked():
                 params.update({'stationId': radar_stations_it})
-            r = requests.get(url, params=params)
-            print(r.url)
-            r_code = r.status_code
-            json = r.json()
-            if r_code == 403:
-                observations_count = 0
-                QMessageBox.warning(self, self.tr("DMI Open Data"),
-                                    self.tr('API Key is not valid or is expired / revoked.'))
-            elif r_code != 403:
-                observations_count = json['numberReturned']
-            if observations_count == 0:
-                QMessageBox.warning(self, self.tr("DMI Open Data"), self.tr('Radar data is only available 6 months prior to current date, and has a delay in upload. \
-                Please change date and time.'))
-            elif observations_count > 0:
-                for feature in json['features']:
-                    downloadurl = feature['asset']['data']['href']
-                    downloaddata = requests.get(downloadurl)
-                    id = feature['id']
-                    tempfile = os.path.join(temp, id)
-                    if not os.path.isfile(tempfile):
-                        with open(tempfile, 'wb') as fd:
-                            for chunk in downloaddata.iter_content(chunk_size=128):
-                                fd.write(chunk)
-                    layer = QgsRasterLayer(tempfile)
+            both_types = self.both_types.isChecked()
+            max_concurrent_downloads = QSettings().value('DMI_Open_Data/max_concurrent_downloads', DEFAULT_DOWNLOAD_WORKERS, type=int)
+
+            def radar_files_listed(task, completed):
+                if not completed:
+                    QMessageBox.warning(self, self.tr("DMI Open Data"),
+                                        self.tr('API request failed, try again or check for network issues'))
+                    return
+                if task.status_code == 403:
+                    QMessageBox.warning(self, self.tr("DMI Open Data"),
+                                        self.tr('API Key is not valid or is expired / revoked.'))
+                    return
+                if task.status_code != 200:
+                    QMessageBox.warning(self, self.tr("DMI Open Data"),
+                                        self.tr('API request failed, try again or check for network issues'))
+                    return
+                if len(task.table) == 0:
+                    QMessageBox.warning(self, self.tr("DMI Open Data"), self.tr('Radar data is only available 6 months prior to current date, and has a delay in upload. \
+                    Please change date and time.'))
+                    return
+                files = {file['id']: file for file in task.table.to_dict('records')}
+                downloads = {id: (file['href'], self.file_cache.path('radar', id)) for id, file in files.items()}
+                root = QgsProject.instance().layerTreeRoot()
+                layer_group = root.insertGroup(0, 'Radar ' + datetime)
+                # Times of the layers in the group, which is kept in time order as files complete in any order
+                layer_times = []
+
+                def radar_file_downloaded(id, path):
+                    layer = QgsRasterLayer(path)
                     # Set layer tempral properties
                     layer.temporalProperties().setMode(QgsRasterLayerTemporalProperties.ModeFixedTemporalRange)
-                    d = feature['properties']['datetime']
+                    d = files[id]['datetime']
                     start_time = QDateTime.fromString(d, "yyyy-MM-ddThh:mm:ssZ")
                     time_range = QgsDateTimeRange(start_time, start_time)
                     layer.temporalProperties().setFixedTemporalRange(time_range)
@@ -823,21 +853,38 @@ class DMIOpenDataDialog(QtWidgets.QDialog, FORM_CLASS):
                                                      limits=QgsRasterMinMaxOrigin.MinMax)
                     layer.renderer().contrastEnhancement().setMinimumValue(1)
                     layer.renderer().contrastEnhancement().setMaximumValue(254)
-                    if data_type2 == 'composite' and self.both_types.isChecked() == False:
+                    if data_type2 == 'composite' and both_types == False:
                         layer.setName(data_type2 +  ' ' + params['scanType'] + ' ' +  d)
-                    elif self.both_types.isChecked() == True:
+                    elif both_types == True:
                         layer.setName(data_type2 + ' both types ' + d)
                     elif data_type2 == 'pseudoCappi':
                         layer.setName(data_type2 + ' ' + radar_stations_it[0] + ' ' + d)
                     project = QgsProject.instance()
                     project.addMapLayer(layer, addToLegend=False)
-                    layer_group.insertLayer(-1, layer)
+                    position = bisect(layer_times, d)
+                    layer_times.insert(position, d)
+                    layer_group.insertLayer(position, layer)
+
+                def radar_files_fetched(task, completed):
+                    self.evict_file_cache([path for _, path in downloads.values()])
+                    if not completed or task.failed:
+                        QMessageBox.warning(self, self.tr("DMI Open Data"),
+                                            self.tr('API request failed, try again or check for network issues'))
+
+                # The files are downloaded concurrently in the background, and each is added as soon as it is complete
+                download_task = FileDownloadTask('DMI Open Data ' + dataName, downloads, radar_files_fetched, max_concurrent_downloads)
+                download_task.file_downloaded.connect(radar_file_downloaded)
+                self.start_fetch_task(download_task)
+
+            # The files of the period are listed in the background, and downloaded once the list is complete
+            self.start_fetch_task(FeaturesTask(
+                'DMI Open Data ' + dataName, url, params, collection_schema(data_type, data_type2), radar_files_listed
+            ))
 
         # Lightning data URL creation
         if dataName == 'Lightning Data':
-            url = 'https://opendataapi.dmi.dk/v2/' + data_type + '/collections/' + data_type2 + '/items'
-            params = {'datetime' : datetime,
-                      'limit' : '300000'}
+            url = OPEN_DATA_URL + '/v2/' + data_type + '/collections/' + data_type2 + '/items'
+            params = {'datetime' : datetime}
             # Did the user choose the BBOX?
             if self.bbox_lightning.text() != '':
                 params.update({'bbox': self.bbox_lig.text()})
@@ -853,179 +900,161 @@ class DMIOpenDataDialog(QtWidgets.QDialog, FORM_CLASS):
                 name = 'Lightning cloud to cloud'
             else:
                 name = 'Lightning'
-            # URL creation
-            r = requests.get(url, params=params)
-            print(r.url)
-            json = r.json()
-            r_code = r.status_code
-            if r_code == 403:
-                QMessageBox.warning(self, self.tr("DMI Open Data"),
-                                    self.tr('API Key is not valid or is expired / revoked.'))
-                observations_count = 0
-            elif r_code != 403:
-                observations_count = json['numberReturned']
-                df = json_normalize(json['features'])
-            if observations_count == 0 and r_code != 403:
-                QMessageBox.warning(self, self.tr("DMI Open Data"),
-                                    self.tr('No lightnings observed. Change time or parameter.'))
-            elif observations_count > 0:
-                # QGIS geometry
-                df = df.drop(['id','type','geometry.type','properties.created'], axis=1)
-                vl = QgsVectorLayer("Point",name , "memory")
-                for row in df.itertuples():
-                    name = df['properties.observed']
-                    pr = vl.dataProvider()
-                    vl.startEditing()
-                    f = QgsFeature()
-                    f.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(row[1][0], row[1][1])))
-                    for head in df:
-                        if head == 'properties.observed':
-                            pr.addAttributes([QgsField(head, QVariant.DateTime)])
-                        elif head == 'properties.amp' or head == 'properties.strokes':
-                            pr.addAttributes([QgsField(head, QVariant.Double)])
-                        elif head != 'geometry.coordinates':
-                            pr.addAttributes([QgsField(head, QVariant.String)])
-                    vl.updateFields()
-                    f.setAttributes([row[2],row[3],row[4],row[5],row[6]])
-                    vl.addFeature(f)
-                    vl.updateExtents()
-                vl.commitChanges()
-                QgsProject.instance().addMapLayer(vl)
-                # Does the user want to save as csv?
-                if self.file_name_lig.text() == '':
-                    pass
+            csv_file_name = self.file_name_lig.text()
+            self.file_name_lig.clear()
+
+            def lightning_fetched(task, completed):
+                r_code = task.status_code
+                if not completed:
+                    QMessageBox.warning(self, self.tr("DMI Open Data"),
+                                        self.tr('API request failed, try again or check for network issues'))
+                elif r_code == 403:
+                    QMessageBox.warning(self, self.tr("DMI Open Data"),
+                                        self.tr('API Key is not valid or is expired / revoked.'))
+                elif len(task.table) == 0:
+                    QMessageBox.warning(self, self.tr("DMI Open Data"),
+                                        self.tr('No lightnings observed. Change time or parameter.'))
                 else:
-                    df.to_csv(self.file_name_lig.text() + '.csv', index=False)
-                    self.file_name_lig.clear()
+                    df = task.table
+                    # QGIS geometry
+                    # The fields are declared once from the schema, and features are added in batches
+                    vl = build_point_layer(name, df, schema_fields(task.schema))
+                    QgsProject.instance().addMapLayer(vl)
+                    # Does the user want to save as csv? The coordinates are a single column, as they have always been
+                    if csv_file_name != '':
+                        format_times(join_coordinates(df)).to_csv(csv_file_name + '.csv', index=False)
+
+            # URL creation
+            # Long periods are fetched as concurrent time windows in the background, each paged and decoded as it downloads
+            self.start_fetch_task(FeaturesTask(
+                'DMI Open Data ' + name, url, params, collection_schema(data_type, data_type2), lightning_fetched
+            ))
         # Forecast data
         if dataName == 'Forecast Data':
-            root = QgsProject.instance().layerTreeRoot()
-            layer_group = root.insertGroup(0, 'Forecast' + datetime)
-            temp = mkdtemp(suffix='_forecast-files')
-            url = 'https://opendataapi.dmi.dk/v1/' + data_type + '/collections/' + data_type2 + '_' + fore_area + '/items'
-            params = {'datetime': datetime,
-                    'limit': '300000'}
+            # The bands shown are the same for all files, and are resolved before any file arrives
+            if data_type2 == 'dkss':
+                depths = [int(depth) for depth in self.forecast_depth_boxes[fore_area].checkedItems()]
+            else:
+                depths = []
+            # Depth parameters have no layer without a depth
+            if not depths and any(parameter in depth_para_dkss for parameter in parameters):
+                QMessageBox.warning(self, self.tr("DMI Open Data"),
+                                    self.tr('Please select a depth.'))
+                return
+            # The name and band of each layer made from a file, the whole file if no parameter is checked
+            layer_bands = [
+                (parameter + (' ' + str(depth) + 'm' if depth is not None else ''), band)
+                for parameter, depth, band in forecast_bands(data_type2, fore_area, parameters, depths)
+            ] or [('All parameters', None)]
+            url = OPEN_DATA_URL + '/v1/' + data_type + '/collections/' + data_type2 + '_' + fore_area + '/items'
+            params = {'datetime': datetime}
             if self.bbox_fore.text() != '':
                 params.update({'bbox': self.bbox_fore.text()})
-            r = requests.get(url, params=params)
-            print(r, r.url)
-            json = r.json()
-            latest_model_run = sorted(json['features'], key=lambda feature: feature['properties']['modelRun'])[-1]['properties']['modelRun']
-            print(latest_model_run)
-            for feature in filter(lambda feature: feature['properties']['modelRun'] == latest_model_run, json['features']):
-                downloadurl = feature['asset']['data']['href']
-                downloaddata = requests.get(downloadurl)
-                id = feature['id']
-                print(id)
-                tempfile = os.path.join(temp, id)
-                if not os.path.isfile(tempfile):
-                    with open(tempfile, 'wb') as fd:
-                        for chunk in downloaddata.iter_content():
-                            fd.write(chunk)
-                layer = QgsRasterLayer(tempfile)
-                #if self.all_para_wam.isChecked() == False or self.all_para_dkss.isChecked() == False:
-                if data_type2 == 'wam':
-                    band_par = para_fore_dict_wam[parameters[0]]
-                    print(band_par)
-                elif data_type2 == 'dkss':
-                    if parameters[0] in depth_para_dkss:
-                        if fore_area == 'nsbs':
-                            depth = int(self.depth_box_nsbs.currentText())
-                            if parameters[0] == 'salinity_':
-                                band_par = salinity_nsbs[depth]
-                            elif parameters[0] == 'water_temp_':
-                                band_par = water_temp_nsbs[depth]
-                            elif parameters[0] == 'v_comp_cur_':
-                                band_par = u_current_nsbs[depth]
-                            elif parameters[0] == 'u_comp_cur_':
-                                band_par = v_current_nsbs[depth]
-                        elif fore_area == 'idw':
-                            depth = int(self.depth_box_idw.currentText())
-                            if parameters[0] == 'salinity_':
-                                band_par = salinity_idw[depth]
-                            elif parameters[0] == 'water_temp_':
-                                band_par = water_temp_idw[depth]
-                            elif parameters[0] == 'v_comp_cur_':
-                                band_par = u_current_idw[depth]
-                            elif parameters[0] == 'u_comp_cur_':
-                                band_par = v_current_idw[depth]
-                        elif fore_area == 'ws':
-                            depth = int(self.depth_box_ws.currentText())
-                            if parameters[0] == 'salinity_':
-                                band_par = salinity_ws[depth]
-                            elif parameters[0] == 'water_temp_':
-                                band_par = water_temp_ws[depth]
-                            elif parameters[0] == 'v_comp_cur_':
-                                band_par = u_current_ws[depth]
-                            elif parameters[0] == 'u_comp_cur_':
-                                band_par = v_current_ws[depth]
-                        elif fore_area == 'if':
-                            depth = int(self.depth_box_if.currentText())
-                            if parameters[0] == 'salinity_':
-                                band_par = salinity_if[depth]
-                            elif parameters[0] == 'water_temp_':
-                                band_par = water_temp_if[depth]
-                            elif parameters[0] == 'v_comp_cur_':
-                                band_par = u_current_if[depth]
-                            elif parameters[0] == 'u_comp_cur_':
-                                band_par = v_current_if[depth]
-                        elif fore_area == 'lf':
-                            depth = int(self.depth_box_lf.currentText())
-                            if parameters[0] == 'salinity_':
-                                band_par = salinity_lf[depth]
-                            elif parameters[0] == 'water_temp_':
-                                band_par = water_temp_lf[depth]
-                            elif parameters[0] == 'v_comp_cur_':
-                                band_par = u_current_lf[depth]
-                            elif parameters[0] == 'u_comp_cur_':
-                                band_par = v_current_lf[depth]
-                        elif fore_area == 'lb':
-                            depth = int(self.depth_box_lb.currentText())
-                            if parameters[0] == 'salinity_':
-                                band_par = salinity_lb[depth]
-                            elif parameters[0] == 'water_temp_':
-                                band_par = water_temp_lb[depth]
-                            elif parameters[0] == 'v_comp_cur_':
-                                band_par = u_current_lb[depth]
-                            elif parameters[0] == 'u_comp_cur_':
-                                band_par = v_current_lb[depth]
-                    elif parameters[0] not in depth_para_dkss:
-                        band_par = para_fore_dict_nsbs[parameters[0]]
-                # Provides the statistics for the layer. Used to find min and max
-                stats = layer.dataProvider().bandStatistics(band_par, QgsRasterBandStats.All)
-                # The layer will be mapped in a Gray symbology
-                renderer = QgsSingleBandGrayRenderer(layer.dataProvider(), band_par)
-                # Sets the color scale for the layer
-                myType = renderer.dataType(1)
-                myEnhancement = QgsContrastEnhancement(myType)
-                contrast_enhancement = QgsContrastEnhancement.StretchToMinimumMaximum
-                myEnhancement.setContrastEnhancementAlgorithm(contrast_enhancement, True)
-                myEnhancement.setMinimumValue(stats.minimumValue)
-                myEnhancement.setMaximumValue(stats.maximumValue)
-                d = feature['properties']['datetime']
-                start_time = QDateTime.fromString(d, 'yyyy-MM-ddThh:mm:ssZ')
-                end_time = start_time.addSecs(3600)
-                time_range = QgsDateTimeRange(start_time, end_time)
-                layer.temporalProperties().setFixedTemporalRange(time_range)
-                layer.temporalProperties().setIsActive(True)
-                layer.setRenderer(renderer)
-                layer.renderer().setContrastEnhancement(myEnhancement)
-
-
-                # Changes the name
-                if len(parameters) > 0:
-                    if self.wam_fore.isChecked():
-                        layer.setName(data_type2 + ' ' + fore_area + ' ' + parameters[0] + ' ' + feature['properties']['datetime'])
-                    elif self.dkss_fore.isChecked() and parameters[0] in depth_para_dkss:
-                        layer.setName(data_type2 + ' ' + fore_area + ' ' + parameters[0] + ' ' + str(depth) + 'm ' + feature['properties']['datetime'])
-                    elif self.dkss_fore.isChecked() and parameters[0] not in depth_para_dkss:
-                        layer.setName(data_type2 + ' ' + fore_area + ' ' + parameters[0] + ' ' + feature['properties']['datetime'])
-                elif len(parameters) == 0:
-                    layer.setName(data_type2 + ' ' + fore_area + ' ' + 'All parameters ' + feature['properties']['datetime'])
-                # Adds the layer to the map
-                project = QgsProject.instance()
-                project.addMapLayer(layer, addToLegend=False)
-                layer_group.insertLayer(-1, layer)
+            max_concurrent_downloads = QSettings().value('DMI_Open_Data/max_concurrent_downloads', DEFAULT_DOWNLOAD_WORKERS, type=int)
+
+            def forecast_files_listed(task, completed):
+                if not completed or task.status_code != 200:
+                    QMessageBox.warning(self, self.tr("DMI Open Data"),
+                                        self.tr('API request failed, try again or check for network issues'))
+                    return
+                if len(task.table) == 0:
+                    QMessageBox.warning(self, self.tr("DMI Open Data"),
+                                        self.tr('No forecast data in this period. Change time or area.'))
+                    return
+                # Only the files of the latest model run are used
+                latest_model_run = task.table['modelRun'].max()
+                forecast_files = {
+                    file['id']: file for file in task.table.to_dict('records') if file['modelRun'] == latest_model_run
+                }
+                root = QgsProject.instance().layerTreeRoot()
+                layer_group = root.insertGroup(0, 'Forecast' + datetime)
+                # Only the bands shown are rendered, each from a small compressed file instead of the whole forecast file
+                bands = [band for _, band in layer_bands if band is not None]
+                # Files whose bands are all cached are used without any request
+                cached_band_files = {}
+                if bands:
+                    for id, file in forecast_files.items():
+                        band_files = find_cached_bands(self.file_cache, bands, file['modelRun'], id)
+                        if None not in band_files.values():
+                            cached_band_files[id] = band_files
+                downloads = {
+                    id: (file['href'], self.file_cache.path('forecast', file['modelRun'], id))
+                    for id, file in forecast_files.items() if id not in cached_band_files
+                }
+                # A group per parameter and depth when there are several, each kept in time order as files complete in any order
+                if len(layer_bands) > 1:
+                    band_groups = {band: layer_group.addGroup(name) for name, band in layer_bands}
+                else:
+                    band_groups = {band: layer_group for _, band in layer_bands}
+                band_layer_times = {band: [] for _, band in layer_bands}
+                # Extracted band files of this run, kept when the cache is evicted
+                band_paths = [path for band_files in cached_band_files.values() for path in band_files.values()]
+
+                def prepare_forecast_file(id, tempfile):
+                    if not bands:
+                        return {None: tempfile}
+                    band_files = cached_bands(self.file_cache, tempfile, bands, forecast_files[id]['modelRun'], id)
+                    band_paths.extend(band_files.values())
+                    return band_files
+
+                def forecast_file_downloaded(id, band_files):
+                    for name, band in layer_bands:
+                        add_forecast_layer(forecast_files[id], name, band, band_files[band])
+
+                def add_forecast_layer(file, name, band, tempfile):
+                    layer = QgsRasterLayer(tempfile)
+                    # Provides the statistics for the layer. Used to find min and max
+                    stats = layer.dataProvider().bandStatistics(1, QgsRasterBandStats.All)
+                    # The layer will be mapped in a Gray symbology
+                    renderer = QgsSingleBandGrayRenderer(layer.dataProvider(), 1)
+                    # Sets the color scale for the layer
+                    myType = renderer.dataType(1)
+                    myEnhancement = QgsContrastEnhancement(myType)
+                    contrast_enhancement = QgsContrastEnhancement.StretchToMinimumMaximum
+                    myEnhancement.setContrastEnhancementAlgorithm(contrast_enhancement, True)
+                    myEnhancement.setMinimumValue(stats.minimumValue)
+                    myEnhancement.setMaximumValue(stats.maximumValue)
+                    d = file['datetime']
+                    start_time = QDateTime.fromString(d, 'yyyy-MM-ddThh:mm:ssZ')
+                    end_time = start_time.addSecs(3600)
+                    time_range = QgsDateTimeRange(start_time, end_time)
+                    layer.temporalProperties().setFixedTemporalRange(time_range)
+                    layer.temporalProperties().setIsActive(True)
+                    layer.setRenderer(renderer)
+                    layer.renderer().setContrastEnhancement(myEnhancement)
+
+
+                    # Changes the name
+                    layer.setName(data_type2 + ' ' + fore_area + ' ' + name + ' ' + file['datetime'])
+                    # Adds the layer to the map
+                    project = QgsProject.instance()
+                    project.addMapLayer(layer, addToLegend=False)
+                    layer_times = band_layer_times[band]
+                    position = bisect(layer_times, file['datetime'])
+                    layer_times.insert(position, file['datetime'])
+                    band_groups[band].insertLayer(position, layer)
+
+                def forecast_files_fetched(task, completed):
+                    # Forecast files stay cached for other bands, until the cache is full and they are the least recently
+                    # used. The extracted bands shown are kept
+                    self.evict_file_cache(band_paths)
+                    if not completed or task.failed:
+                        QMessageBox.warning(self, self.tr("DMI Open Data"),
+                                            self.tr('API request failed, try again or check for network issues'))
+
+                # Missing files are streamed in large chunks in the background, resuming downloads that break off, and each
+                # file is checked to be complete before its layer is made
+                for id, band_files in cached_band_files.items():
+                    forecast_file_downloaded(id, band_files)
+                download_task = FileDownloadTask('DMI Open Data ' + dataName, downloads, forecast_files_fetched, max_concurrent_downloads,
+                                                 validate=grib_complete, prepare=prepare_forecast_file)
+                download_task.file_downloaded.connect(forecast_file_downloaded)
+                self.start_fetch_task(download_task)
+
+            # The files of the period are listed in the background, and downloaded once the list is complete
+            self.start_fetch_task(FeaturesTask(
+                'DMI Open Data ' + dataName, url, params, collection_schema(data_type, data_type2), forecast_files_listed
+            ))
         # Information about stations and parameters
         if dataName == 'Stations and Parameters':
             if self.met_stat_info.isChecked():
@@ -1034,7 +1063,7 @@ class DMIOpenDataDialog(QtWidgets.QDialog, FORM_CLASS):
             elif self.tide_info.isChecked():
                 data_type = 'oceanObs'
                 data_type2 = 'station'
-            url = 'https://opendataapi.dmi.dk/v2/' + data_type + '/collections/' + data_type2 +'/items'
+            url = OPEN_DATA_URL + '/v2/' + data_type + '/collections/' + data_type2 +'/items'
             params = {}
             # metObs info
             if self.met_stat_info.isChecked():
@@ -1058,66 +1087,50 @@ class DMIOpenDataDialog(QtWidgets.QDialog, FORM_CLASS):
                     params.update({'status': 'Active'})
                 elif self.radioButton_19.isChecked() and self.radioButton_22.isChecked():
                     params.update({'datetime': datetime})
-            r = requests.get(url, params=params)
-            print(r.url)
-            json = r.json()
-            r_code = r.status_code
-            if r_code != 200:
-                QMessageBox.warning(self, self.tr("DMI Open Data"),
-                                 self.tr('API request failed, try again or check for network issues'))
-            else:
-                df = json_normalize(json['features'])
-                # Name and sort the data based on users preferences
-                if self.met_stat_info.isChecked():
-                    if self.radioButton_2.isChecked():
-                        df = df.loc[df['properties.country'] == 'DNK']
-                        name_stations_met = 'Meteorological Stations Denmark'
-                    elif self.radioButton_3.isChecked():
-                        df = df.loc[df['properties.country'] == 'GRL']
-                        name_stations_met = 'Meteorological Stations Greenland'
-                    elif self.radioButton_4.isChecked():
-                        name_stations_met = 'All Meteorological Stations'
-                if self.tide_info.isChecked():
-                    if self.radioButton_14.isChecked():
-                        name_stations_met = 'All stations'
-                    elif self.radioButton_12.isChecked():
-                        df = df.loc[df['properties.owner'] == 'DMI']
-                        name_stations_met = 'DMI'
-                    elif self.radioButton_13.isChecked():
-                        df = df.loc[df['properties.owner'] == 'Kystdirektoratet / Coastal Authority']
-                        name_stations_met = 'Coastal Authority'
-                # Names the layer as the station type and parameter if parameter is chosen.
-                if len(parameters) != 0:
+            # Name and sort the data based on users preferences, read before the stations arrive
+            station_filter = None
+            if self.met_stat_info.isChecked():
+                if self.radioButton_2.isChecked():
+                    station_filter = ('properties.country', 'DNK')
+                    name_stations_met = 'Meteorological Stations Denmark'
+                elif self.radioButton_3.isChecked():
+                    station_filter = ('properties.country', 'GRL')
+                    name_stations_met = 'Meteorological Stations Greenland'
+                elif self.radioButton_4.isChecked():
+                    name_stations_met = 'All Meteorological Stations'
+            if self.tide_info.isChecked():
+                if self.radioButton_14.isChecked():
+                    name_stations_met = 'All stations'
+                elif self.radioButton_12.isChecked():
+                    station_filter = ('properties.owner', 'DMI')
+                    name_stations_met = 'DMI'
+                elif self.radioButton_13.isChecked():
+                    station_filter = ('properties.owner', 'Kystdirektoratet / Coastal Authority')
+                    name_stations_met = 'Coastal Authority'
+            # Names the layer as the station type and parameter if parameter is chosen.
+            if len(parameters) != 0:
+                name_stations_met = name_stations_met + ' ' + parameters[0]
+
+            def stations_listed(task, completed):
+                if not completed or task.status_code != 200:
+                    QMessageBox.warning(self, self.tr("DMI Open Data"),
+                                     self.tr('API request failed, try again or check for network issues'))
+                    return
+                df = task.table
+                if len(df) > 0 and station_filter is not None:
+                    df = df.loc[df[station_filter[0]] == station_filter[1]]
+                if len(df) > 0 and len(parameters) != 0:
                     df = df[pd.DataFrame(df['properties.parameterId'].tolist()).isin(parameters).any(axis=1).values]
-                    name_stations_met = name_stations_met + ' ' + parameters[0]
                 if len(df) == 0:
                     QMessageBox.warning(self, self.tr("DMI Open Data"),
                                     self.tr('No stations meets this requirement.'))
-                elif len(df) > 0:
+                else:
                     # QGIS geometry
-                    vl = QgsVectorLayer("Point", name_stations_met, "memory")
-                    for row in df.itertuples():
-                        pr = vl.dataProvider()
-                        vl.startEditing()
-                        for head in df:
-                            if head != 'geometry.coordinates' and head != 'type':
-                                pr.addAttributes([QgsField(head, QVariant.String)])
-                        vl.updateFields()
-                        f = QgsFeature()
-                        f.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(row[4][0], row[4][1])))
-                        if data_type == 'climateData':
-                            f.setAttributes([row[1],row[2],row[3],row[5],row[6],row[7],\
-                                                row[8],row[9],row[10],row[11],str(row[12]),row[13],row[14],\
-                                                row[15],row[16],row[17],row[18],row[19],row[20],row[21],row[22]])
-                        elif data_type == 'oceanObs':
-                            f.setAttributes([row[1], row[2], row[3], row[5], row[6], str(row[7]), \
-                                             row[8], row[9], row[10], row[11], str(row[12]), row[13], row[14], \
-                                             row[15], row[16], row[17], row[18], row[19], row[20]])
-                        vl.addFeature(f)
-                        vl.updateExtents()
-                    vl.commitChanges()
+                    # All station properties are text fields, parameterId included
+                    df = df.assign(**{'properties.parameterId': df['properties.parameterId'].map(str)})
+                    vl = build_point_layer(name_stations_met, df, schema_fields(task.schema))
                     QgsProject.instance().addMapLayer(vl)
                 iface.zoomToActiveLayer()
-        if len(error_stats) != 0:
-            QMessageBox.warning(self, self.tr("DMI Open Data"),
-                                self.tr('Following stations does not produce all the desired data.' + '\n' + 'Change parameters, time and/or resolution.' + '\n' + '\n' + '\n'.join(set(error_stats))))
+
+            # The station properties differ between the APIs, the columns are taken from the first station
+            self.start_fetch_task(FeaturesTask('DMI Open Data ' + dataName, url, params, station_schema, stations_listed))
@@ -0,0 +1,60 @@
+from typing import List
+
+import pandas as pd
+
+from .schemas import FeatureSchema
+
+PARAMETER = 'parameterId'
+VALUE = 'value'
+
+
+class LongTable:
+    """
+    Collects the values of several parameters as (key columns, parameter, value) rows, and turns them into a table with a
+    column per parameter in a single pivot, instead of merging a table per parameter one at a time
+    """
+
+    def __init__(self, key_columns: List[str]):
+        """
+        :param key_columns: The columns identifying a row of the wide table, e.g. observed and stationId
+        """
+        self.key_columns = key_columns
+        self.frames: List[pd.DataFrame] = []
+        self.parameters: List[str] = []
+
+    @classmethod
+    def for_schema(cls, schema: FeatureSchema) -> 'LongTable':
+        """
+        A table keyed on all columns of a collection schema other than the value
+        """
+        return cls([column.name for column in schema if column.name != VALUE])
+
+    def __len__(self) -> int:
+        return sum(len(frame) for frame in self.frames)
+
+    def add(self, parameter: str, frame: pd.DataFrame):
+        """
+        :param parameter: The parameter of all values in frame
+        :param frame: The key columns and a value column, e.g. from FeatureColumns.to_frame()
+        """
+        if parameter not in self.parameters:
+            self.parameters.append(parameter)
+        self.frames.append(frame[self.key_columns + [VALUE]].assign(**{PARAMETER: parameter}))
+
+    def to_long(self) -> pd.DataFrame:
+        if not self.frames:
+            return pd.DataFrame(columns=self.key_columns + [PARAMETER, VALUE])
+        return pd.concat(self.frames, ignore_index=True)[self.key_columns + [PARAMETER, VALUE]]
+
+    def to_wide(self) -> pd.DataFrame:
+        """
+        :return: The key columns followed by a column per parameter in the order they were added, with a row per
+        distinct key. Should a key occur more than once for a parameter, its first value is kept
+        """
+        if not self.frames:
+            return pd.DataFrame(columns=self.key_columns + self.parameters)
+        values = self.to_long().set_index(self.key_columns + [PARAMETER])[VALUE]
+        values = values[~values.index.duplicated()]
+        wide = values.unstack(PARAMETER).reindex(columns=self.parameters)
+        wide.columns.name = None
+        return wide.reset_index()
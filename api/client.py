@@ -0,0 +1,121 @@
+import random
+import threading
+import time
+from typing import Optional, Dict, Any, Union, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+OPEN_DATA_URL = 'https://opendataapi.dmi.dk'
+# Seconds to wait for a connection, and for each read from the socket once connected
+DEFAULT_TIMEOUT = (10, 60)
+# Attempts after the first one, for connection errors and the status codes below
+DEFAULT_RETRIES = 3
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# The delay before retry n is drawn uniformly from [0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** n)] seconds
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+# Seconds within which a request and its retries must get a response, so an API that keeps failing is reported instead of
+# retried at length
+DEFAULT_DEADLINE = 120
+# Connections per host, and so the most requests in flight to a host across all fetches of the plugin. Requests beyond
+# it wait for a connection to be returned, so nested concurrency like shards fetched within concurrent station jobs
+# reuses connections instead of opening ones that are thrown away after a single request
+DEFAULT_POOL_SIZE = 16
+
+Timeout = Union[float, Tuple[float, float]]
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+class OpenDataAPIException(Exception):
+    def __init__(self):
+        super().__init__("API request failed, try again or check for network issues")
+
+
+def get_session() -> requests.Session:
+    """
+    The session shared by all calls to DMI Open Data, so connections and TLS sessions are reused between requests.
+    A streamed response holds its connection until it is read to the end or closed
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=DEFAULT_POOL_SIZE, pool_block=True)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update({'Accept-Encoding': 'gzip, deflate', 'User-Agent': 'DMI-Open-Data-QGIS-plugin'})
+            _session = session
+        return _session
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Exponential backoff with full jitter, so concurrent requests failing together don't retry together
+    """
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def retry_after_delay(response: requests.Response) -> Optional[float]:
+    try:
+        return min(BACKOFF_MAX, float(response.headers['Retry-After']))
+    except (KeyError, ValueError):
+        return None
+
+
+def attempt_timeout(timeout: Timeout, give_up_at: Optional[float]) -> Timeout:
+    """
+    The timeout of one attempt, with the connect timeout ending at give_up_at
+    """
+    if give_up_at is None:
+        return timeout
+    connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+    return max(0.1, min(connect, give_up_at - time.monotonic())), read
+
+
+def get(
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        stream=False,
+        timeout: Timeout = DEFAULT_TIMEOUT,
+        retries: int = DEFAULT_RETRIES,
+        deadline: Optional[float] = None
+) -> requests.Response:
+    """
+    GET request through the shared session, retrying connection errors, timeouts, 429 and 5xx responses
+    :param url: Full URL of the request
+    :param params: Query parameters
+    :param headers: Headers in addition to the session's
+    :param stream: Don't read the body before returning, see requests
+    :param timeout: Seconds to wait for the connection and for each read, see requests
+    :param retries: Maximum number of retries
+    :param deadline: Seconds from now after which no more retries are started, the connect timeout of an attempt is
+    shortened to end by then. Reads of a streamed body are only bounded by timeout
+    :return: The response, which may have any status code once retries are exhausted
+    """
+    session = get_session()
+    give_up_at = time.monotonic() + deadline if deadline is not None else None
+    attempt = 0
+    while True:
+        try:
+            response = session.get(
+                url, params=params, headers=headers, stream=stream, timeout=attempt_timeout(timeout, give_up_at)
+            )
+        except (requests.ConnectionError, requests.Timeout) as exception:
+            response = None
+            error = exception
+        last_attempt = attempt >= retries
+        if response is not None and (response.status_code not in RETRY_STATUS_CODES or last_attempt):
+            return response
+        delay = (response is not None and retry_after_delay(response)) or backoff_delay(attempt)
+        if last_attempt or (give_up_at is not None and time.monotonic() + delay > give_up_at):
+            if response is not None:
+                return response
+            raise OpenDataAPIException() from error
+        if response is not None:
+            response.close()
+        time.sleep(delay)
+        attempt += 1
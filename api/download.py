@@ -0,0 +1,170 @@
+import os
+from typing import Callable, Dict, Hashable, Iterator, Optional, Tuple
+
+import requests
+
+from . import client
+from .client import OpenDataAPIException
+from .fetch import fetch_by_group, FetchResult
+from .progress import FetchProgress
+
+# Bytes read from the socket and written to disk at a time, large enough that Python overhead per chunk is negligible
+DEFAULT_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Files downloaded at the same time
+DEFAULT_DOWNLOAD_WORKERS = 6
+# A file is written under this suffix and renamed once complete, so an interrupted download is never taken for a file,
+# and can be resumed
+PARTIAL_SUFFIX = '.part'
+# Times a download that breaks off is resumed
+DEFAULT_RESUME_ATTEMPTS = 3
+
+# The URL of a file and the path to save it to
+Download = Tuple[str, str]
+
+
+class IncompleteDownloadException(Exception):
+    def __init__(self, url: str, expected: int, received: int):
+        super().__init__(f'Download of {url} ended after {received} of {expected} bytes')
+
+
+class InvalidDownloadException(Exception):
+    def __init__(self, url: str):
+        super().__init__(f'Download of {url} is not a complete file')
+
+
+def content_length(headers) -> Optional[int]:
+    try:
+        return int(headers['Content-Length'])
+    except (KeyError, ValueError):
+        return None
+
+
+def content_range(headers) -> Tuple[Optional[int], Optional[int]]:
+    """
+    :return: The first byte and the size of the whole file, from e.g. 'bytes 1000-1999/2000' or 'bytes */2000'
+    """
+    try:
+        byte_range, total = headers['Content-Range'].split(' ', 1)[1].split('/')
+        start = None if byte_range == '*' else int(byte_range.split('-')[0])
+        return start, None if total == '*' else int(total)
+    except (KeyError, IndexError, ValueError):
+        return None, None
+
+
+def grib_complete(path: str) -> bool:
+    """
+    Whether a GRIB file ends with the end section of a message, files that aren't GRIB are not checked
+    """
+    with open(path, 'rb') as file:
+        if file.read(4) != b'GRIB':
+            return True
+        file.seek(-4, os.SEEK_END)
+        return file.read(4) == b'7777'
+
+
+def download_file(
+        url: str,
+        path: str,
+        progress: Optional[FetchProgress] = None,
+        chunk_size=DEFAULT_DOWNLOAD_CHUNK_SIZE,
+        resume_attempts=DEFAULT_RESUME_ATTEMPTS,
+        validate: Optional[Callable[[str], bool]] = None
+) -> str:
+    """
+    Streams a file to disk in large chunks. A download that breaks off is resumed with a Range request from the bytes
+    already on disk, also those left by an earlier run, and the file is only renamed into place once it is as large as
+    the server announced
+    :param progress: Receives the bytes and a page per file, and can cancel the download between chunks
+    :param resume_attempts: Range requests made after the download breaks off, before giving up
+    :param validate: Checks the content of the complete file, e.g. grib_complete
+    :return: path, which only exists once the file is complete
+    :raises IncompleteDownloadException: if the download kept breaking off before the whole file arrived
+    :raises InvalidDownloadException: if the complete file doesn't validate
+    """
+    partial_path = path + PARTIAL_SUFFIX
+    attempt = 0
+    while True:
+        try:
+            download_part(url, partial_path, progress, chunk_size)
+            break
+        except (requests.RequestException, IncompleteDownloadException):
+            if attempt >= resume_attempts:
+                raise
+            attempt += 1
+    if validate is not None and not validate(partial_path):
+        os.remove(partial_path)
+        raise InvalidDownloadException(url)
+    os.replace(partial_path, path)
+    if progress is not None:
+        progress.add(pages=1)
+    return path
+
+
+def download_part(url: str, partial_path: str, progress: Optional[FetchProgress], chunk_size: int):
+    """
+    Appends the rest of a file to the part already downloaded, or downloads it all if the server doesn't do ranges
+    """
+    if progress is not None:
+        progress.check()
+    offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+    # Without compression, Content-Length and ranges are in bytes of the file on disk
+    headers = {'Accept-Encoding': 'identity'}
+    if offset > 0:
+        headers['Range'] = f'bytes={offset}-'
+    response = client.get(url, headers=headers, stream=True, deadline=client.DEFAULT_DEADLINE)
+    try:
+        if response.status_code == 416:
+            # Nothing after offset, the part is complete if it is as large as the file
+            _, total = content_range(response.headers)
+            if total == offset:
+                return
+            os.remove(partial_path)
+            raise IncompleteDownloadException(url, total, offset)
+        if response.status_code == 206:
+            start, total = content_range(response.headers)
+            if start != offset:
+                os.remove(partial_path)
+                raise IncompleteDownloadException(url, total, offset)
+            mode = 'ab'
+        elif response.status_code == 200:
+            offset, total, mode = 0, content_length(response.headers), 'wb'
+        else:
+            raise OpenDataAPIException()
+        received = offset
+        with open(partial_path, mode) as file:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if progress is not None:
+                    progress.check()
+                file.write(chunk)
+                received += len(chunk)
+                if progress is not None:
+                    progress.add(bytes=len(chunk))
+        if total is not None and received != total:
+            raise IncompleteDownloadException(url, total, received)
+    finally:
+        response.close()
+
+
+def download_files(
+        downloads: Dict[Hashable, Download],
+        max_workers=DEFAULT_DOWNLOAD_WORKERS,
+        progress: Optional[FetchProgress] = None,
+        chunk_size=DEFAULT_DOWNLOAD_CHUNK_SIZE,
+        validate: Optional[Callable[[str], bool]] = None
+) -> Iterator[Tuple[Hashable, FetchResult]]:
+    """
+    Downloads files concurrently. Files that already exist are returned without any request
+    :param downloads: The URL and path of each file, by a key like the feature id
+    :param validate: Checks the content of each downloaded file, see download_file
+    :return: iterator of the key and result of each file in order of completion, the value of a result is the path
+    """
+    def download(key: Hashable) -> str:
+        url, path = downloads[key]
+        if os.path.isfile(path):
+            # Marked as used, see api.file_cache
+            os.utime(path)
+            return path
+        return download_file(url, path, progress, chunk_size, validate=validate)
+
+    for key, (result,) in fetch_by_group({key: [key] for key in downloads}, download, max_workers):
+        yield key, result
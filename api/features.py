@@ -0,0 +1,322 @@
+import codecs
+import json
+from typing import Iterable, Iterator, Dict, Any, List, Optional, Collection, Union
+
+import numpy as np
+import pandas as pd
+
+from .schemas import FeatureSchema, ColumnType, LONGITUDE, LATITUDE
+
+# Large enough that Python level work per chunk is negligible, small enough to keep the buffer small
+DEFAULT_CHUNK_SIZE = 64 * 1024
+JSON_WHITESPACE = ' \t\n\r'
+# How the API writes times, and how they are written to CSV files and layer attributes
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+# For times with fractions of a second
+PRECISE_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+class FeatureStreamException(Exception):
+    def __init__(self, message):
+        super().__init__(f"Invalid response from the API: {message}")
+
+
+class FeatureCollectionStream:
+    """
+    Decodes a GeoJSON FeatureCollection incrementally from chunks of bytes, yielding each feature as soon as it has
+    been read, so the whole response never has to be held in memory. Top level members other than features, like
+    numberReturned and links, are available in members once all features have been iterated
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        """
+        :param chunks: The raw response body, e.g. response.iter_content(DEFAULT_CHUNK_SIZE)
+        """
+        self.chunks = iter(chunks)
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        self.exhausted = False
+        self.members: Dict[str, Any] = {}
+
+    def __iter__(self) -> Iterator[dict]:
+        self.expect('{')
+        if self.peek() == '}':
+            self.position += 1
+            return
+        while True:
+            key = self.decode_value()
+            self.expect(':')
+            if key == 'features':
+                yield from self.decode_features()
+            else:
+                self.members[key] = self.decode_value()
+            if self.peek() == ',':
+                self.position += 1
+                continue
+            self.expect('}')
+            return
+
+    def decode_features(self) -> Iterator[dict]:
+        self.expect('[')
+        if self.peek() == ']':
+            self.position += 1
+            return
+        while True:
+            yield self.decode_value()
+            if self.peek() == ',':
+                self.position += 1
+                continue
+            self.expect(']')
+            return
+
+    def fill(self) -> bool:
+        """
+        Appends the next chunk to the buffer, dropping what has already been decoded
+        :return: False if the stream has no more data
+        """
+        text = ''
+        while not text and not self.exhausted:
+            try:
+                text = self.text_decoder.decode(next(self.chunks))
+            except StopIteration:
+                self.exhausted = True
+                text = self.text_decoder.decode(b'', final=True)
+        self.buffer = self.buffer[self.position:] + text
+        self.position = 0
+        return bool(text)
+
+    def peek(self) -> str:
+        """
+        Skips whitespace and returns the next character without consuming it
+        """
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in JSON_WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                raise FeatureStreamException('response ended unexpectedly')
+
+    def expect(self, character: str):
+        if self.peek() != character:
+            raise FeatureStreamException(f"expected '{character}' but found '{self.buffer[self.position]}'")
+        self.position += 1
+
+    def decode_value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.position)
+                # A number at the very end of the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.exhausted:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.exhausted:
+                    raise FeatureStreamException('response ended in the middle of a value')
+            self.fill()
+
+
+class FeatureColumns:
+    """
+    Column buffers filled one feature at a time, keeping only the values of each feature that are in the schema, and
+    converted to typed arrays once all features have been added
+    """
+
+    def __init__(self, schema: FeatureSchema):
+        """
+        :param schema: The columns to extract, see api.schemas
+        """
+        self.schema = schema
+        self.paths = [(column.name, parse_path(column.path)) for column in schema]
+        self.columns: Dict[str, List[Any]] = {column.name: [] for column in schema}
+        self.count = 0
+        # Kept whole, for values that are the same for all features, like the station position
+        self.first_feature: Optional[dict] = None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, feature: dict):
+        if self.first_feature is None:
+            self.first_feature = feature
+        for name, keys in self.paths:
+            self.columns[name].append(value_at(feature, keys))
+        self.count += 1
+
+    def extend(self, features: Iterable[dict]) -> 'FeatureColumns':
+        for feature in features:
+            self.append(feature)
+        return self
+
+    def extend_columns(self, other: 'FeatureColumns') -> 'FeatureColumns':
+        """
+        Appends the features already extracted by another instance with the same schema
+        """
+        for name in self.columns:
+            self.columns[name].extend(other.columns[name])
+        if self.first_feature is None:
+            self.first_feature = other.first_feature
+        self.count += other.count
+        return self
+
+    def rows(self) -> Iterator[tuple]:
+        """
+        The values of each feature, hashable so rows can be compared
+        """
+        return zip(*(map(hashable, self.columns[name]) for name in self.columns))
+
+    def distinct_from(self, other: 'FeatureColumns') -> 'FeatureColumns':
+        """
+        The features that aren't in other, like the features of a time window without those spanning its boundary with
+        the previous window
+        """
+        seen = set(other.rows())
+        distinct = FeatureColumns(self.schema)
+        distinct.first_feature = self.first_feature
+        for row, values in zip(self.rows(), zip(*self.columns.values())):
+            if row in seen:
+                continue
+            for name, value in zip(self.columns, values):
+                distinct.columns[name].append(value)
+            distinct.count += 1
+        return distinct
+
+    def to_arrays(self) -> Dict[str, Any]:
+        """
+        :return: A typed array per column, NumPy arrays for floats and datetimes, pandas arrays for categories and
+        nullable booleans
+        """
+        return {column.name: to_array(self.columns[column.name], column.column_type) for column in self.schema}
+
+    def to_frame(self) -> pd.DataFrame:
+        arrays = self.to_arrays()
+        for column in self.schema:
+            if column.column_type is ColumnType.DATETIME:
+                arrays[column.name] = pd.DatetimeIndex(arrays[column.name]).tz_localize('UTC')
+        return pd.DataFrame(arrays)
+
+
+class KeyedFeatureColumns:
+    """
+    Features split by the value at a path, e.g. a FeatureColumns per station of a query covering several stations
+    """
+
+    def __init__(self, schema: FeatureSchema, key_path: str, keys: Optional[Collection[Any]] = None):
+        """
+        :param schema: The columns to extract, see api.schemas
+        :param key_path: Dotted path of the value features are split by, e.g. 'properties.stationId'
+        :param keys: Keep only features with these values, all features if None
+        """
+        self.schema = schema
+        self.key_path = parse_path(key_path)
+        self.keys = set(keys) if keys is not None else None
+        self.by_key: Dict[Any, FeatureColumns] = {}
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, feature: dict):
+        key = value_at(feature, self.key_path)
+        if self.keys is not None and key not in self.keys:
+            return
+        columns = self.by_key.get(key)
+        if columns is None:
+            columns = self.by_key[key] = FeatureColumns(self.schema)
+        columns.append(feature)
+        self.count += 1
+
+    def extend(self, features: Iterable[dict]) -> 'KeyedFeatureColumns':
+        for feature in features:
+            self.append(feature)
+        return self
+
+    def extend_columns(self, other: 'KeyedFeatureColumns') -> 'KeyedFeatureColumns':
+        for key, columns in other.by_key.items():
+            self.by_key.setdefault(key, FeatureColumns(self.schema)).extend_columns(columns)
+        self.count += other.count
+        return self
+
+    def distinct_from(self, other: 'KeyedFeatureColumns') -> 'KeyedFeatureColumns':
+        """
+        The features that aren't in other, see FeatureColumns.distinct_from
+        """
+        distinct = KeyedFeatureColumns(self.schema, '', self.keys)
+        distinct.key_path = self.key_path
+        for key, columns in self.by_key.items():
+            distinct.by_key[key] = columns.distinct_from(other.by_key[key]) if key in other.by_key else columns
+            distinct.count += len(distinct.by_key[key])
+        return distinct
+
+
+def parse_path(path: str) -> List[Union[str, int]]:
+    """
+    Keys of a dotted path, with list indices as integers
+    """
+    return [int(key) if key.isdigit() else key for key in path.split('.')]
+
+
+def value_at(feature: dict, keys: List[Union[str, int]]) -> Any:
+    """
+    The value at a parsed path, None where the path doesn't exist
+    """
+    value = feature
+    for key in keys:
+        if isinstance(key, int):
+            value = value[key] if isinstance(value, list) and key < len(value) else None
+        else:
+            value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def hashable(value: Any) -> Any:
+    """
+    A value that can be hashed, lists and objects like coordinates are compared by their JSON
+    """
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, sort_keys=True)
+    return value
+
+
+def format_times(table: pd.DataFrame) -> pd.DataFrame:
+    """
+    Copy of table with datetime columns as text in the API's format, e.g. 2023-01-01T00:00:00Z, missing times as None
+    """
+    table = table.copy()
+    for head in table:
+        if pd.api.types.is_datetime64_any_dtype(table[head]):
+            times = table[head].dt.tz_convert('UTC') if table[head].dt.tz is not None else table[head]
+            time_format = PRECISE_TIME_FORMAT if (times.dt.microsecond.fillna(0) != 0).any() else TIME_FORMAT
+            table[head] = times.dt.strftime(time_format).astype(object).where(times.notna(), None)
+    return table
+
+
+def join_coordinates(table: pd.DataFrame) -> pd.DataFrame:
+    """
+    Copy of table with the longitude and latitude columns joined into the first column, geometry.coordinates, as in
+    flattened GeoJSON, like CSV files of lightning strokes have always had them
+    """
+    coordinates = [[x, y] for x, y in zip(table[LONGITUDE.name].tolist(), table[LATITUDE.name].tolist())]
+    table = table.drop(columns=[LONGITUDE.name, LATITUDE.name])
+    table.insert(0, 'geometry.coordinates', pd.Series(coordinates, index=table.index, dtype=object))
+    return table
+
+
+def to_array(values: List[Any], column_type: ColumnType) -> Any:
+    if column_type is ColumnType.FLOAT:
+        return np.array(values, dtype=np.float64)
+    if column_type is ColumnType.DATETIME:
+        # Parsed as UTC and stored without time zone, datetime64 can't hold one
+        return pd.to_datetime(values, utc=True).tz_convert(None).to_numpy(dtype='datetime64[ns]')
+    if column_type is ColumnType.CATEGORY:
+        return pd.Categorical(values)
+    if column_type is ColumnType.BOOL:
+        return pd.array(values, dtype='boolean')
+    array = np.empty(len(values), dtype=object)
+    # Assigned one by one, assigning a list of lists would make NumPy build a two dimensional array
+    for index, value in enumerate(values):
+        array[index] = str(value) if column_type is ColumnType.STRING and value is not None else value
+    return array
@@ -0,0 +1,140 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Iterator, Tuple, Callable, Any, Optional, Hashable, TypeVar, Collection, Union
+
+from .client import OpenDataAPIException
+from .features import FeatureColumns, KeyedFeatureColumns
+from .pagination import FeaturePages, DEFAULT_PAGE_SIZE
+from .progress import FetchProgress
+from .sharding import can_shard, plan_shards, DEFAULT_SHARD_SIZE, DEFAULT_SHARD_WORKERS
+from .schemas import FeatureSchema
+
+# Jobs run at the same time, high enough to hide latency without hammering the API. A job may make several requests at
+# once, e.g. for shards and prefetched pages, the requests in flight are bounded by client.DEFAULT_POOL_SIZE
+DEFAULT_CONCURRENCY = 8
+
+Job = TypeVar('Job')
+Group = TypeVar('Group', bound=Hashable)
+
+
+class FetchResult:
+    """
+    Outcome of one job, either its value or the exception it raised
+    """
+    job: Any
+    value: Any
+    error: Optional[Exception]
+
+    def __init__(self, job, value=None, error=None):
+        self.job = job
+        self.value = value
+        self.error = error
+
+
+def fetch_features(
+        url: str,
+        params: Dict[str, Any],
+        schema: FeatureSchema,
+        shard_size=DEFAULT_SHARD_SIZE,
+        max_workers=DEFAULT_SHARD_WORKERS,
+        page_size=DEFAULT_PAGE_SIZE,
+        progress: Optional[FetchProgress] = None,
+        split_by: Optional[str] = None,
+        keys: Optional[Collection[Any]] = None
+) -> Tuple[int, Union[FeatureColumns, KeyedFeatureColumns]]:
+    """
+    Requests all pages of a collection query and decodes the columns of the schema from the responses as they arrive.
+    A query whose first page reports more than shard_size matching features is split into time windows that are
+    fetched concurrently. Queries too short to be split are paged right away
+    :param params: Query parameters, without limit and offset
+    :param shard_size: Features per time window, see api.sharding
+    :param max_workers: Maximum number of time windows fetched at the same time
+    :param page_size: Features per request, see api.pagination
+    :param progress: Receives the matched rows, pages, bytes and rows, and cancels the fetch, see api.progress
+    :param split_by: Dotted path of a value to split the features by, returning KeyedFeatureColumns
+    :param keys: When splitting, keep only features with these values
+    :return: the status code and the extracted columns in time window order, which are empty unless the request
+    succeeded
+    """
+    if progress is not None:
+        progress.check()
+    def new_columns() -> Union[FeatureColumns, KeyedFeatureColumns]:
+        return KeyedFeatureColumns(schema, split_by, keys) if split_by is not None else FeatureColumns(schema)
+
+    def fetch_pages(page_params: Dict[str, Any], offset=0) -> Union[FeatureColumns, KeyedFeatureColumns]:
+        pages = FeaturePages(url, page_params, page_size, progress=progress, offset=offset)
+        page_columns = new_columns().extend(pages)
+        if pages.status_code != 200:
+            # The first page succeeded, leaving out the rest would silently return part of the result
+            raise OpenDataAPIException()
+        return page_columns
+
+    if not can_shard(params):
+        pages = FeaturePages(url, params, page_size, progress=progress)
+        columns = new_columns().extend(pages)
+        return pages.status_code, columns
+
+    first_page = FeaturePages(url, params, page_size, progress=progress, max_pages=1)
+    columns = new_columns().extend(first_page)
+    if first_page.status_code != 200 or first_page.complete:
+        return first_page.status_code, columns
+    number_matched = first_page.number_matched if isinstance(first_page.number_matched, int) else None
+    if progress is not None and number_matched is not None:
+        progress.add(expected_rows=number_matched)
+    shards = plan_shards(params, number_matched, shard_size)
+    if len(shards) == 1:
+        return 200, columns.extend_columns(fetch_pages(params, offset=page_size))
+
+    # The first page isn't from any one time window, its features are fetched again with their window
+    if progress is not None:
+        progress.add(rows=-len(columns))
+    columns = new_columns()
+    previous_columns = None
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(shards))) as executor:
+        for shard_columns in executor.map(fetch_pages, shards):
+            # Values spanning the boundary of two windows, like daily climate values, are returned by both
+            columns.extend_columns(
+                shard_columns.distinct_from(previous_columns) if previous_columns is not None else shard_columns
+            )
+            previous_columns = shard_columns
+    return 200, columns
+
+
+def fetch_by_group(
+        groups: Dict[Group, List[Job]],
+        fetch: Callable[[Job], Any],
+        max_workers: int = DEFAULT_CONCURRENCY
+) -> Iterator[Tuple[Group, List[FetchResult]]]:
+    """
+    Runs the jobs of all groups concurrently, and yields each group as soon as all of its jobs are done, so it can be
+    processed while the remaining jobs are still running. A failing job does not stop the others, its exception is
+    returned in its result
+    :param groups: The jobs, grouped e.g. by station
+    :param fetch: Function running one job, called from worker threads
+    :param max_workers: Maximum number of jobs running at the same time
+    :return: iterator of groups in order of completion, with results in the order of the group's jobs
+    """
+    pending = {group: len(jobs) for group, jobs in groups.items()}
+    results: Dict[Group, List[Optional[FetchResult]]] = {group: [None] * len(jobs) for group, jobs in groups.items()}
+    # Groups without jobs are complete from the start
+    for group, count in pending.items():
+        if count == 0:
+            yield group, []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(fetch, job): (group, position, job)
+            for group, jobs in groups.items() for position, job in enumerate(jobs)
+        }
+        try:
+            for future in as_completed(futures):
+                group, position, job = futures[future]
+                try:
+                    results[group][position] = FetchResult(job, future.result())
+                except Exception as exception:
+                    results[group][position] = FetchResult(job, error=exception)
+                pending[group] -= 1
+                if pending[group] == 0:
+                    yield group, results.pop(group)
+        finally:
+            # Stopping early, e.g. on cancellation, should not wait for jobs that haven't started yet
+            for future in futures:
+                future.cancel()
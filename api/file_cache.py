@@ -0,0 +1,116 @@
+import hashlib
+import os
+import time
+from typing import List, Optional, Tuple
+
+from .download import PARTIAL_SUFFIX
+
+# Bytes kept on disk before the least recently used files are removed
+DEFAULT_FILE_CACHE_SIZE = 2 * 1024 ** 3
+# Partial downloads untouched for this many seconds are abandoned, and removed on eviction
+PARTIAL_FILE_TTL = 24 * 60 * 60
+
+
+class FileCache:
+    """
+    Downloaded files kept in a directory across runs, named by a hash of what identifies their content, like the
+    feature id of a radar image or the model run and id of a forecast file. Using a file marks it as recently used, and
+    eviction removes the least recently used files once the cache holds more than max_bytes
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_FILE_CACHE_SIZE):
+        """
+        :param directory: Created if missing
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path(self, collection: str, *key: str) -> str:
+        """
+        Where the file identified by key is kept, whether it is cached or not. The extension of the last part of the key
+        is kept, so GDAL recognizes the format
+        :param collection: A directory per collection, e.g. radar or forecast
+        :param key: What identifies the content, e.g. the feature id
+        """
+        directory = os.path.join(self.directory, collection)
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256('/'.join(key).encode('utf-8')).hexdigest()
+        return os.path.join(directory, digest + os.path.splitext(key[-1])[1])
+
+    def get(self, collection: str, *key: str) -> Optional[str]:
+        """
+        :return: The path of a cached file, marked as used now, or None if it isn't cached
+        """
+        path = self.path(collection, *key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def files(self) -> List[Tuple[str, os.stat_result]]:
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    files.append((path, os.stat(path)))
+                except OSError:
+                    pass
+        return files
+
+    def size(self) -> int:
+        return sum(stat.st_size for _, stat in self.files())
+
+    def evict(self, keep: Optional[List[str]] = None) -> int:
+        """
+        Removes the least recently used files until the cache fits in max_bytes, and abandoned partial downloads
+        :param keep: Paths that must not be removed, like the files of the current run and of layers in the project.
+        Paths that aren't in the cache are ignored
+        :return: The number of bytes removed
+        """
+        keep = {normalize(path) for path in keep or []}
+        now = time.time()
+        files = []
+        removed = 0
+        for path, stat in self.files():
+            if path.endswith(PARTIAL_SUFFIX):
+                if now - stat.st_mtime > PARTIAL_FILE_TTL:
+                    removed += remove(path, stat)
+                continue
+            files.append((path, stat))
+        size = sum(stat.st_size for _, stat in files)
+        for path, stat in sorted(files, key=lambda file: file[1].st_mtime):
+            if size <= self.max_bytes:
+                break
+            if normalize(path) in keep:
+                continue
+            freed = remove(path, stat)
+            size -= freed
+            removed += freed
+        return removed
+
+    def clear(self) -> int:
+        """
+        Removes all files
+        :return: The number of bytes removed
+        """
+        return sum(remove(path, stat) for path, stat in self.files())
+
+
+def normalize(path: str) -> str:
+    """
+    The same path however it is written, e.g. as a layer source
+    """
+    return os.path.normcase(os.path.abspath(path))
+
+
+def remove(path: str, stat: os.stat_result) -> int:
+    """
+    :return: The size of the file, or 0 if it couldn't be removed, e.g. because a layer has it open on Windows
+    """
+    try:
+        os.remove(path)
+    except OSError:
+        return 0
+    return stat.st_size
@@ -0,0 +1,217 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from .features import FeatureColumns
+from .fetch import fetch_features
+from .progress import FetchProgress
+from .schemas import FeatureSchema, TO
+from .sharding import Interval, parse_interval, parse_datetime, format_datetime, SHARD_GAP
+
+# Values this recent may still be added or corrected by DMI, so they are returned but fetched again next time
+DEFAULT_SETTLE_DELAY = timedelta(days=1)
+# Query parameters that select the time, the area or the page, the rest identify the series a cache entry holds
+NON_SERIES_PARAMS = {'datetime', 'bbox', 'limit', 'offset'}
+# Stored in the database, a file of another version is emptied when opened
+SCHEMA_VERSION = 3
+
+
+class ObservationCache:
+    """
+    Cache of observation and climate values in SQLite, per series of values: a collection queried for a station, cell
+    or municipality, a parameter, a resolution and a validity filter. The time intervals fetched for a series are
+    stored with their rows, so a query only fetches the parts of its period that aren't cached yet
+    """
+
+    def __init__(self, path: str, settle_delay: timedelta = DEFAULT_SETTLE_DELAY):
+        """
+        :param path: The database file, created if missing
+        :param settle_delay: How long after the fact values are assumed final
+        """
+        self.path = path
+        self.settle_delay = settle_delay
+        # Fetches run in several threads, each gets its own connection
+        self.local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            # Readers don't wait for writers, so concurrent fetches only wait for each other's writes
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            if connection.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                # Earlier versions allowed several rows of a series at the same time, and didn't store when a value ends
+                connection.executescript(f'''
+                    DROP TABLE IF EXISTS intervals;
+                    DROP TABLE IF EXISTS rows;
+                    DROP TABLE IF EXISTS first_features;
+                    PRAGMA user_version = {SCHEMA_VERSION};
+                ''')
+            connection.executescript('''
+                CREATE TABLE IF NOT EXISTS intervals (series TEXT NOT NULL, start TEXT NOT NULL, end TEXT NOT NULL);
+                CREATE INDEX IF NOT EXISTS intervals_series ON intervals (series);
+                CREATE TABLE IF NOT EXISTS rows (
+                    series TEXT NOT NULL, time TEXT NOT NULL, end_time TEXT NOT NULL, row TEXT NOT NULL,
+                    PRIMARY KEY (series, time)
+                );
+                CREATE TABLE IF NOT EXISTS first_features (series TEXT PRIMARY KEY, feature TEXT NOT NULL);
+            ''')
+            self.local.connection = connection
+        return connection
+
+    @staticmethod
+    def series(url: str, params: Dict[str, Any]) -> str:
+        return url + '?' + json.dumps(
+            {key: str(value) for key, value in params.items() if key not in NON_SERIES_PARAMS}, sort_keys=True
+        )
+
+    def intervals(self, series: str) -> List[Interval]:
+        rows = self.connection().execute('SELECT start, end FROM intervals WHERE series = ? ORDER BY start', (series,))
+        return [(parse_datetime(start), parse_datetime(end)) for start, end in rows]
+
+    def missing(self, series: str, interval: Interval) -> List[Interval]:
+        """
+        The parts of interval that are not cached, in time order
+        """
+        start, end = interval
+        missing = []
+        for cached_start, cached_end in self.intervals(series):
+            if cached_end < start or cached_start > end:
+                continue
+            if cached_start > start:
+                missing.append((start, cached_start - SHARD_GAP))
+            start = max(start, cached_end + SHARD_GAP)
+        if start <= end:
+            missing.append((start, end))
+        return missing
+
+    def store(self, series: str, interval: Interval, columns: FeatureColumns, time_column: str):
+        """
+        Replaces the rows of a series in interval with columns, and records the settled part of the interval as cached.
+        A series has a single row per time, so rows refetched outside interval replace the cached ones
+        """
+        start, end = interval
+        names = [column.name for column in columns.schema]
+        times = stored_times(columns.columns[time_column])
+        # Climate values cover a period from-to, observations are a point in time
+        end_times = stored_times(columns.columns[TO.name]) if TO.name in columns.columns else times
+        rows = [json.dumps(row) for row in zip(*(columns.columns[name] for name in names))]
+        settled_end = min(end, datetime.now(timezone.utc) - self.settle_delay)
+        connection = self.connection()
+        with connection:
+            connection.execute(
+                'DELETE FROM rows WHERE series = ? AND time <= ? AND end_time >= ?',
+                (series, stored_time(end), stored_time(start))
+            )
+            connection.executemany(
+                'INSERT OR REPLACE INTO rows (series, time, end_time, row) VALUES (?, ?, ?, ?)',
+                [(series, time, end_time, row) for time, end_time, row in zip(times, end_times, rows)]
+            )
+            if columns.first_feature is not None:
+                connection.execute(
+                    'INSERT OR IGNORE INTO first_features (series, feature) VALUES (?, ?)',
+                    (series, json.dumps(columns.first_feature))
+                )
+            if settled_end >= start:
+                self.add_interval(connection, series, (start, settled_end))
+
+    def add_interval(self, connection: sqlite3.Connection, series: str, interval: Interval):
+        """
+        Records an interval as cached, merged with the cached intervals it overlaps or adjoins
+        """
+        start, end = interval
+        for cached_start, cached_end in self.intervals(series):
+            if cached_end + SHARD_GAP >= start and cached_start - SHARD_GAP <= end:
+                start, end = min(start, cached_start), max(end, cached_end)
+        connection.execute(
+            'DELETE FROM intervals WHERE series = ? AND start <= ? AND end >= ?',
+            (series, stored_time(end), stored_time(start))
+        )
+        connection.execute(
+            'INSERT INTO intervals (series, start, end) VALUES (?, ?, ?)',
+            (series, stored_time(start), stored_time(end))
+        )
+
+    def load(self, series: str, interval: Interval, schema: FeatureSchema) -> FeatureColumns:
+        """
+        The cached rows of a series that overlap interval, in time order. Like the API, a value whose period starts
+        before the interval is returned when it ends in it
+        """
+        columns = FeatureColumns(schema)
+        names = [column.name for column in schema]
+        connection = self.connection()
+        rows = connection.execute(
+            'SELECT row FROM rows WHERE series = ? AND time <= ? AND end_time >= ? ORDER BY time',
+            (series, stored_time(interval[1]), stored_time(interval[0]))
+        )
+        for (row,) in rows:
+            for name, value in zip(names, json.loads(row)):
+                columns.columns[name].append(value)
+            columns.count += 1
+        if columns.count > 0:
+            first_feature = connection.execute('SELECT feature FROM first_features WHERE series = ?', (series,)).fetchone()
+            columns.first_feature = json.loads(first_feature[0]) if first_feature is not None else None
+        return columns
+
+    def size(self) -> int:
+        """
+        Bytes of the database file and its write-ahead log
+        """
+        return sum(os.path.getsize(path) for path in [self.path, self.path + '-wal'] if os.path.exists(path))
+
+    def clear(self) -> int:
+        """
+        Removes all values and shrinks the database file
+        :return: The number of bytes removed
+        """
+        size = self.size()
+        connection = self.connection()
+        with connection:
+            connection.execute('DELETE FROM intervals')
+            connection.execute('DELETE FROM rows')
+            connection.execute('DELETE FROM first_features')
+        connection.execute('VACUUM')
+        connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return max(0, size - self.size())
+
+
+def stored_time(time: datetime) -> str:
+    """
+    Times are stored in a fixed width format, so they order correctly as text
+    """
+    return time.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def stored_times(times: List[Optional[str]]) -> List[str]:
+    return [stored_time(parse_datetime(time)) if time else '' for time in times]
+
+
+def fetch_features_cached(
+        cache: ObservationCache,
+        url: str,
+        params: Dict[str, Any],
+        schema: FeatureSchema,
+        time_column: str,
+        progress: Optional[FetchProgress] = None
+) -> Tuple[int, FeatureColumns]:
+    """
+    As api.fetch.fetch_features, but only fetches the parts of the period that aren't cached, and returns them merged
+    with the cached rows. Queries without a closed datetime interval are not cached
+    :param time_column: The schema column with the time of a row, observed or from
+    """
+    interval = parse_interval(params.get('datetime', ''))
+    if interval is None or 'bbox' in params:
+        return fetch_features(url, params, schema, progress=progress)
+    series = cache.series(url, params)
+    for missing_interval in cache.missing(series, interval):
+        missing_params = {**params, 'datetime': '/'.join(format_datetime(time) for time in missing_interval)}
+        status_code, columns = fetch_features(url, missing_params, schema, progress=progress)
+        if status_code != 200:
+            return status_code, FeatureColumns(schema)
+        cache.store(series, missing_interval, columns, time_column)
+    return 200, cache.load(series, interval, schema)
@@ -0,0 +1,142 @@
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Any, Iterator, Optional
+
+import requests
+
+from . import client
+from .client import OpenDataAPIException
+from .features import FeatureCollectionStream, DEFAULT_CHUNK_SIZE
+from .progress import FetchProgress
+
+# Features per request, small enough that a page is quick to produce and hold, large enough that few requests are needed
+DEFAULT_PAGE_SIZE = 10000
+
+
+class FeaturePages:
+    """
+    Iterates the features of a query across all of its pages, requesting limit and offset page by page, so no result is
+    cut off at a fixed limit and no single response has to hold everything. Once numberMatched shows there are more
+    features, the next page is downloaded in the background while the current one is being decoded. Paging stops at a
+    short page, or when the API doesn't link to a next page
+    """
+
+    def __init__(
+            self,
+            url: str,
+            params: Dict[str, Any],
+            page_size=DEFAULT_PAGE_SIZE,
+            prefetch=True,
+            progress: Optional[FetchProgress] = None,
+            offset=0,
+            max_pages: Optional[int] = None
+    ):
+        """
+        :param url: URL of the collection items
+        :param params: Query parameters, without limit and offset
+        :param page_size: Features requested per page
+        :param prefetch: Download the next page while the current one is decoded
+        :param progress: Receives the pages, bytes and rows, and can cancel the paging between chunks
+        :param offset: Offset of the first page, to continue paging where an earlier instance stopped
+        :param max_pages: Stop after this many pages, see complete
+        """
+        self.url = url
+        self.params = params
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self.progress = progress
+        self.offset = offset
+        self.max_pages = max_pages
+        # Status code of the first page, no features are returned unless it is 200
+        self.status_code: Optional[int] = None
+        # The URL of the first page, as sent
+        self.first_url: Optional[str] = None
+        self.pages = 0
+        # Features matching the query across all pages, once the API has reported it
+        self.number_matched: Optional[int] = None
+        # Whether the last page has been read, False if paging stopped at max_pages
+        self.complete = False
+
+    def request(self, offset: int, download=False) -> requests.Response:
+        if self.progress is not None:
+            self.progress.check()
+        response = client.get(
+            self.url, params={**self.params, 'limit': self.page_size, 'offset': offset}, stream=not download,
+            deadline=client.DEFAULT_DEADLINE
+        )
+        if download:
+            # Reads the body, which is what should overlap with decoding the current page
+            response.content
+        return response
+
+    def __iter__(self) -> Iterator[dict]:
+        executor = ThreadPoolExecutor(max_workers=1) if self.prefetch else None
+        prefetched: Optional[Future] = None
+        offset = self.offset
+        response = self.request(offset)
+        self.status_code = response.status_code
+        self.first_url = response.url
+        try:
+            if response.status_code != 200:
+                return
+            while True:
+                stream = FeatureCollectionStream(self.chunks(response))
+                count = 0
+                for feature in stream:
+                    # Members before the features have been read by now
+                    if count == 0 and executor is not None and self.more_after(offset, stream):
+                        prefetched = executor.submit(self.request, offset + self.page_size, True)
+                    count += 1
+                    yield feature
+                response.close()
+                self.number_matched = stream.members.get('numberMatched', self.number_matched)
+                self.pages += 1
+                if self.progress is not None:
+                    self.progress.add(pages=1, rows=count)
+                if not self.has_next_page(stream, count):
+                    self.complete = True
+                    return
+                if self.max_pages is not None and self.pages >= self.max_pages:
+                    return
+                offset += self.page_size
+                response = prefetched.result() if prefetched is not None else self.request(offset)
+                prefetched = None
+                if response.status_code != 200:
+                    # Stopping here would silently return part of the result
+                    raise OpenDataAPIException()
+        finally:
+            response.close()
+            if prefetched is not None:
+                prefetched.add_done_callback(close_prefetched)
+            if executor is not None:
+                executor.shutdown(wait=False)
+
+    def chunks(self, response: requests.Response) -> Iterator[bytes]:
+        if self.progress is None:
+            yield from response.iter_content(DEFAULT_CHUNK_SIZE)
+            return
+        for chunk in response.iter_content(DEFAULT_CHUNK_SIZE):
+            self.progress.check()
+            self.progress.add(bytes=len(chunk))
+            yield chunk
+
+    def more_after(self, offset: int, stream: FeatureCollectionStream) -> bool:
+        """
+        Whether features are known to follow the page at offset, so the next page can be requested before this one ends
+        """
+        if self.max_pages is not None and self.pages + 1 >= self.max_pages:
+            return False
+        number_matched = stream.members.get('numberMatched', self.number_matched)
+        return isinstance(number_matched, int) and number_matched > offset + self.page_size
+
+    def has_next_page(self, stream: FeatureCollectionStream, count: int) -> bool:
+        if count < self.page_size:
+            return False
+        links = stream.members.get('links')
+        if isinstance(links, list):
+            return any(isinstance(link, dict) and link.get('rel') == 'next' for link in links)
+        return True
+
+
+def close_prefetched(future: Future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
@@ -0,0 +1,159 @@
+from typing import Dict, List, Optional, Tuple
+
+from .sharding import Interval, parse_interval, parse_datetime
+from .station import Station, StationId, Parameter, Coordinates
+
+# Below this many selected stations a parameter is always requested station by station
+DEFAULT_BULK_STATION_THRESHOLD = 10
+# The fixed cost of a request, latency and server side setup, in terms of the rows of one station
+REQUEST_OVERHEAD_STATIONS = 0.5
+# Degrees added around the stations, so a station exactly on the edge of the bbox isn't lost to rounding
+BBOX_MARGIN = 0.01
+
+# minimum longitude, minimum latitude, maximum longitude, maximum latitude
+BoundingBox = Tuple[float, float, float, float]
+
+
+class BulkQuery:
+    """
+    A single query for a parameter covering several stations, by bbox or without any location filter. The response is
+    split by stationId, and stations that weren't selected are discarded
+    """
+    stations: List[StationId]
+    bbox: Optional[BoundingBox]
+    # Stations of the catalogue the query is expected to return, selected or not
+    covered_stations: int
+
+    def __init__(self, stations, bbox, covered_stations):
+        self.stations = stations
+        self.bbox = bbox
+        self.covered_stations = covered_stations
+
+    def bbox_param(self) -> Optional[str]:
+        return ','.join(str(value) for value in self.bbox) if self.bbox is not None else None
+
+
+class StationQueryPlan:
+    """
+    The parameters to request for each station, the parameters requested for many stations at once, and the
+    combinations left out because they can't return data
+    """
+    jobs: Dict[StationId, List[Parameter]]
+    skipped: Dict[StationId, List[Parameter]]
+    bulk: Dict[Parameter, BulkQuery]
+
+    def __init__(self, jobs, skipped, bulk=None):
+        self.jobs = jobs
+        self.skipped = skipped
+        self.bulk = bulk if bulk is not None else {}
+
+    def skipped_count(self) -> int:
+        return sum(len(parameters) for parameters in self.skipped.values())
+
+
+def measures(station: Station, parameter: Parameter, interval: Optional[Interval]) -> bool:
+    """
+    Whether a station may have values of a parameter in an interval. With a history, any record valid during the
+    interval counts, without one the station's current parameters are used
+    """
+    if station.history is None or interval is None:
+        if station.history is None:
+            return parameter in station.parameters
+        return any(parameter in parameters for _, _, parameters in station.history)
+    start, end = interval
+    for valid_from, valid_to, parameters in station.history:
+        if parameter not in parameters:
+            continue
+        if parse_datetime(valid_from) <= end and (valid_to is None or parse_datetime(valid_to) >= start):
+            return True
+    return False
+
+
+def plan_station_queries(
+        stations: List[StationId],
+        parameters: List[Parameter],
+        catalogue: Dict[StationId, Station],
+        datetime: str,
+        bulk_threshold: Optional[int] = None
+) -> StationQueryPlan:
+    """
+    Leaves out the station and parameter combinations the catalogue says have no data in the queried period.
+    Stations that are not in the catalogue, like grid cells and municipalities, are requested with all parameters
+    :param stations: Selected stations, in order
+    :param parameters: Selected parameters, in order
+    :param catalogue: Stations of the API queried, see api.station.get_stations
+    :param datetime: The datetime query parameter
+    :param bulk_threshold: Consider a single query per parameter once this many stations are selected, see
+    plan_bulk_queries. Only for collections that can be queried by bbox without a station
+    """
+    interval = parse_interval(datetime)
+    jobs = {}
+    skipped = {}
+    for station_id in stations:
+        station = catalogue.get(station_id)
+        if station is None:
+            jobs[station_id] = list(parameters)
+            continue
+        station_parameters = [parameter for parameter in parameters if measures(station, parameter, interval)]
+        if station_parameters:
+            jobs[station_id] = station_parameters
+        if len(station_parameters) < len(parameters):
+            skipped[station_id] = [parameter for parameter in parameters if parameter not in station_parameters]
+    plan = StationQueryPlan(jobs, skipped)
+    if bulk_threshold is not None:
+        plan_bulk_queries(plan, parameters, catalogue, interval, bulk_threshold)
+    return plan
+
+
+def plan_bulk_queries(
+        plan: StationQueryPlan,
+        parameters: List[Parameter],
+        catalogue: Dict[StationId, Station],
+        interval: Optional[Interval],
+        threshold: int
+):
+    """
+    Moves parameters selected for many stations from per station requests to a single query, where the catalogue
+    estimates that to be cheaper. Every station is assumed to have about as many rows of a parameter in the period, so
+    a bulk query costs the stations it covers, and per station requests cost the selected stations, plus the overhead
+    of each request
+    """
+    for parameter in parameters:
+        selected = [
+            station_id for station_id, station_parameters in plan.jobs.items()
+            if parameter in station_parameters and station_id in catalogue
+        ]
+        if len(selected) < threshold:
+            continue
+        measuring = [station for station in catalogue.values() if measures(station, parameter, interval)]
+        coordinates = [catalogue[station_id].coordinates for station_id in selected]
+        if all(coordinate is not None for coordinate in coordinates):
+            bbox = bounding_box(coordinates)
+            covered = [station for station in measuring if station.coordinates is not None and in_box(station.coordinates, bbox)]
+        else:
+            # Without positions of all stations, the only single query is one without any location filter
+            bbox = None
+            covered = measuring
+        bulk_cost = len(covered) + REQUEST_OVERHEAD_STATIONS
+        per_station_cost = len(selected) * (1 + REQUEST_OVERHEAD_STATIONS)
+        if bulk_cost >= per_station_cost:
+            continue
+        plan.bulk[parameter] = BulkQuery(selected, bbox, len(covered))
+        for station_id in selected:
+            plan.jobs[station_id].remove(parameter)
+            if not plan.jobs[station_id]:
+                del plan.jobs[station_id]
+
+
+def bounding_box(coordinates: List[Coordinates]) -> BoundingBox:
+    longitudes = [longitude for longitude, _ in coordinates]
+    latitudes = [latitude for _, latitude in coordinates]
+    return (
+        round(min(longitudes) - BBOX_MARGIN, 4), round(min(latitudes) - BBOX_MARGIN, 4),
+        round(max(longitudes) + BBOX_MARGIN, 4), round(max(latitudes) + BBOX_MARGIN, 4)
+    )
+
+
+def in_box(coordinates: Coordinates, bbox: BoundingBox) -> bool:
+    longitude, latitude = coordinates
+    return bbox[0] <= longitude <= bbox[2] and bbox[1] <= latitude <= bbox[3]
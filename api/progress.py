@@ -0,0 +1,57 @@
+import threading
+from typing import Callable, Optional
+
+
+class FetchCancelled(Exception):
+    def __init__(self):
+        super().__init__("The download was cancelled")
+
+
+class FetchProgress:
+    """
+    Pages, bytes and rows received by the requests of one fetch, which may run in several threads, and the flag that
+    cancels them. Requests check the flag between chunks, so a cancelled fetch stops within a chunk
+    """
+
+    def __init__(self, on_change: Optional[Callable[['FetchProgress'], None]] = None):
+        """
+        :param on_change: Called after every update, from the thread making the update
+        """
+        self.on_change = on_change
+        self.lock = threading.Lock()
+        self.pages = 0
+        self.bytes = 0
+        self.rows = 0
+        # Rows the queries are known to match, from numberMatched
+        self.expected_rows = 0
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def check(self):
+        """
+        :raises FetchCancelled: if the fetch has been cancelled
+        """
+        if self.cancelled:
+            raise FetchCancelled()
+
+    def add(self, pages=0, bytes=0, rows=0, expected_rows=0):
+        with self.lock:
+            self.pages += pages
+            self.bytes += bytes
+            self.rows += rows
+            self.expected_rows += expected_rows
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def fraction(self) -> Optional[float]:
+        """
+        :return: The part of the expected rows received so far, or None while no rows are expected
+        """
+        if not self.expected_rows:
+            return None
+        return min(1.0, self.rows / self.expected_rows)
+
+    def summary(self) -> str:
+        return f'{self.rows} rows in {self.pages} pages, {self.bytes / 1024 / 1024:.1f} MB'
@@ -0,0 +1,123 @@
+from enum import Enum
+from typing import List
+
+Collection = str
+
+
+class ColumnType(Enum):
+    # float64, missing values become NaN
+    FLOAT = 'float'
+    # datetime64[ns] in UTC
+    DATETIME = 'datetime'
+    # Categorical, for ids repeated on every row
+    CATEGORY = 'category'
+    # Nullable boolean
+    BOOL = 'bool'
+    # Text, values that are not already strings are converted with str()
+    STRING = 'string'
+    # Values are kept as decoded, e.g. lists
+    OBJECT = 'object'
+
+
+class Column:
+    name: str
+    path: str
+    column_type: ColumnType
+
+    def __init__(self, name, path, column_type):
+        """
+        :param name: Column name in the extracted table
+        :param path: Dotted path of the value in a feature, list elements are addressed by index,
+        e.g. 'geometry.coordinates.0'
+        :param column_type: Type of the extracted array
+        """
+        self.name = name
+        self.path = path
+        self.column_type = column_type
+
+
+FeatureSchema = List[Column]
+
+VALUE = Column('value', 'properties.value', ColumnType.FLOAT)
+FROM = Column('from', 'properties.from', ColumnType.DATETIME)
+TO = Column('to', 'properties.to', ColumnType.DATETIME)
+LONGITUDE = Column('longitude', 'geometry.coordinates.0', ColumnType.FLOAT)
+LATITUDE = Column('latitude', 'geometry.coordinates.1', ColumnType.FLOAT)
+
+# metObs and oceanObs
+OBSERVATION_SCHEMA: FeatureSchema = [
+    VALUE,
+    Column('observed', 'properties.observed', ColumnType.DATETIME),
+    Column('stationId', 'properties.stationId', ColumnType.CATEGORY),
+]
+# climateData
+STATION_VALUE_SCHEMA: FeatureSchema = [
+    VALUE, FROM, TO,
+    Column('validity', 'properties.validity', ColumnType.BOOL),
+    Column('stationId', 'properties.stationId', ColumnType.CATEGORY),
+]
+GRID_VALUE_SCHEMA: FeatureSchema = [VALUE, FROM, TO, Column('cellId', 'properties.cellId', ColumnType.CATEGORY)]
+MUNICIPALITY_VALUE_SCHEMA: FeatureSchema = [
+    VALUE, FROM, TO, Column('municipalityId', 'properties.municipalityId', ColumnType.CATEGORY)
+]
+COUNTRY_VALUE_SCHEMA: FeatureSchema = [VALUE, FROM, TO]
+# lightningdata, names follow the flattened GeoJSON the layers and CSV files have always used
+LIGHTNING_OBSERVATION_SCHEMA: FeatureSchema = [
+    Column('properties.amp', 'properties.amp', ColumnType.FLOAT),
+    Column('properties.observed', 'properties.observed', ColumnType.DATETIME),
+    Column('properties.sensors', 'properties.sensors', ColumnType.STRING),
+    Column('properties.strokes', 'properties.strokes', ColumnType.FLOAT),
+    Column('properties.type', 'properties.type', ColumnType.CATEGORY),
+    LONGITUDE,
+    LATITUDE,
+]
+
+# radardata and forecastdata, the files of a period and where they are downloaded from. Times are kept as the API's text,
+# which layer names and time ranges are made from
+FILE_SCHEMA: FeatureSchema = [
+    Column('id', 'id', ColumnType.STRING),
+    Column('href', 'asset.data.href', ColumnType.STRING),
+    Column('datetime', 'properties.datetime', ColumnType.STRING),
+    Column('modelRun', 'properties.modelRun', ColumnType.STRING),
+]
+
+
+def collection_schema(service: str, collection: Collection) -> FeatureSchema:
+    """
+    :param service: Service name used in the URL, e.g. 'metObs' or 'climateData'
+    :param collection: Collection name used in the URL, e.g. 'observation' or '10kmGridValue'
+    :return: The columns to extract from features of the collection
+    """
+    if service in ['radardata', 'forecastdata']:
+        return FILE_SCHEMA
+    if collection == 'observation':
+        return LIGHTNING_OBSERVATION_SCHEMA if service == 'lightningdata' else OBSERVATION_SCHEMA
+    if collection == 'stationValue':
+        return STATION_VALUE_SCHEMA
+    if collection in ['10kmGridValue', '20kmGridValue']:
+        return GRID_VALUE_SCHEMA
+    if collection == 'municipalityValue':
+        return MUNICIPALITY_VALUE_SCHEMA
+    if collection == 'countryValue':
+        return COUNTRY_VALUE_SCHEMA
+    raise ValueError(f'No schema for {service} collection {collection}')
+
+
+def time_column(schema: FeatureSchema) -> str:
+    """
+    The column with the time of a row, observed for observations and from for climate values
+    """
+    return next(column.name for column in schema if column.column_type is ColumnType.DATETIME)
+
+
+def station_schema(feature: dict) -> FeatureSchema:
+    """
+    The station collections of the APIs have different properties, so the schema is made from a station feature.
+    All properties are extracted as text, except parameterId which stays a list
+    :param feature: A feature of the station collection
+    """
+    schema = [Column('id', 'id', ColumnType.STRING)]
+    for key in feature['properties']:
+        column_type = ColumnType.OBJECT if key == 'parameterId' else ColumnType.STRING
+        schema.append(Column('properties.' + key, 'properties.' + key, column_type))
+    return schema + [LONGITUDE, LATITUDE]
@@ -0,0 +1,81 @@
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Tuple
+
+# Features per shard, a shard is a few pages so paging and sharding overlap well
+DEFAULT_SHARD_SIZE = 50000
+# Most shards fetched at the same time for one query
+DEFAULT_SHARD_WORKERS = 4
+# Shards are never shorter than this, so sparse data isn't split into many small requests
+MIN_SHARD_DURATION = timedelta(hours=1)
+# Datetime intervals are closed, each shard ends this long before the next one starts so no feature is returned twice
+SHARD_GAP = timedelta(microseconds=1)
+
+Interval = Tuple[datetime, datetime]
+
+
+def parse_interval(interval: str) -> Optional[Interval]:
+    """
+    :param interval: A closed datetime interval as used in queries, e.g. '2023-01-01T00:00:00Z/2023-02-01T00:00:00Z'
+    :return: start and end in UTC, or None for single datetimes and open intervals, which are not sharded
+    """
+    try:
+        start, end = interval.split('/')
+        return parse_datetime(start), parse_datetime(end)
+    except ValueError:
+        return None
+
+
+def parse_datetime(text: str) -> datetime:
+    return datetime.fromisoformat(text.replace('Z', '+00:00')).astimezone(timezone.utc)
+
+
+def format_datetime(time: datetime) -> str:
+    if time.microsecond:
+        return time.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def can_shard(params: Dict[str, Any]) -> bool:
+    """
+    Whether the datetime interval of a query is long enough to be split into at least two shards
+    """
+    interval = parse_interval(params.get('datetime', ''))
+    return interval is not None and interval[1] - interval[0] >= 2 * MIN_SHARD_DURATION
+
+
+def split_interval(start: datetime, end: datetime, shards: int) -> List[str]:
+    """
+    Splits a closed interval into shards of equal duration that don't overlap
+    :return: The shards as query intervals, in time order
+    """
+    shards = max(1, min(shards, int((end - start) / MIN_SHARD_DURATION)))
+    step = (end - start) / shards
+    boundaries = [start + step * shard for shard in range(shards)] + [end]
+    # Boundaries are rounded down to whole hours, the time step of most data, except the first and last which are kept
+    # as given. Values spanning a boundary, like daily climate values, are still returned by both
+    # shards and dropped from the second by api.fetch
+    boundaries = [boundaries[0]] + [
+        time.replace(minute=0, second=0, microsecond=0) for time in boundaries[1:-1]
+    ] + [boundaries[-1]]
+    return [
+        format_datetime(shard_start) + '/' + format_datetime(shard_end - SHARD_GAP if shard + 1 < shards else shard_end)
+        for shard, (shard_start, shard_end) in enumerate(zip(boundaries, boundaries[1:]))
+    ]
+
+
+def plan_shards(params: Dict[str, Any], number_matched: Optional[int], shard_size=DEFAULT_SHARD_SIZE) -> List[Dict[str, Any]]:
+    """
+    Splits the datetime interval of a query into enough shards that each is expected to match about shard_size
+    features, assuming features are spread evenly over time
+    :param params: Query parameters with a datetime interval
+    :param number_matched: Features matched by the whole query, from the first page. Not sharded if unknown
+    :return: The query parameters of each shard, in time order
+    """
+    interval = parse_interval(params.get('datetime', ''))
+    if interval is None or number_matched is None or number_matched <= shard_size:
+        return [params]
+    return [
+        {**params, 'datetime': shard}
+        for shard in split_interval(*interval, math.ceil(number_matched / shard_size))
+    ]
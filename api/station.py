@@ -1,12 +1,28 @@
-from itertools import groupby
-from typing import Tuple, Dict, List
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, Dict, List, Optional, Iterable, Callable, Any
 
-import requests
 from enum import Enum
 
+from . import client
+from .features import FeatureCollectionStream, DEFAULT_CHUNK_SIZE
+
 StationId = str
 StationName = str
 Parameter = str
+# A record of a station's history: validFrom, validTo (None while still valid) and the parameters measured
+StationValidity = Tuple[str, Optional[str], Tuple[Parameter, ...]]
+# Longitude and latitude
+Coordinates = Tuple[float, float]
+
+# Bump whenever the serialized catalogue format changes, so old cache files are ignored instead of misread
+STATION_CACHE_VERSION = 3
+# Station catalogues change rarely, one day is a reasonable default before revalidating against the API
+DEFAULT_STATION_CACHE_TTL = 24 * 60 * 60
+# One worker per StationApi, so loading all catalogues takes as long as the slowest one
+DEFAULT_CATALOGUE_WORKERS = 3
 
 
 class StationApi(Enum):
@@ -27,11 +43,35 @@ class Station:
     station_id: str
     station_name: str
     parameters: List[Parameter]
+    # All records of the station ordered by validFrom, only kept when asked for
+    history: Optional[List[StationValidity]]
+    # Position of the latest record, None if the API has no geometry for the station
+    coordinates: Optional[Coordinates]
 
-    def __init__(self, station_id, station_name, parameters):
+    def __init__(self, station_id, station_name, parameters, history=None, coordinates=None):
         self.station_id = station_id
         self.station_name = station_name
         self.parameters = parameters
+        self.history = history
+        self.coordinates = coordinates
+
+    def to_json(self) -> dict:
+        station_json = {'name': self.station_name, 'parameters': list(self.parameters)}
+        if self.coordinates is not None:
+            station_json['coordinates'] = list(self.coordinates)
+        if self.history is not None:
+            station_json['history'] = [[valid_from, valid_to, list(parameters)] for valid_from, valid_to, parameters in self.history]
+        return station_json
+
+    @staticmethod
+    def from_json(station_id: StationId, station_json: dict) -> 'Station':
+        history = station_json.get('history')
+        if history is not None:
+            history = [(valid_from, valid_to, tuple(parameters)) for valid_from, valid_to, parameters in history]
+        coordinates = station_json.get('coordinates')
+        if coordinates is not None:
+            coordinates = (coordinates[0], coordinates[1])
+        return Station(station_id, station_json['name'], station_json['parameters'], history, coordinates)
 
 
 class StationAPIGenericException(Exception):
@@ -39,29 +79,230 @@ class StationAPIGenericException(Exception):
         super().__init__("API request failed, try again or check for network issues")
 
 
+class StationCatalogueBuilder:
+    """
+    Builds a station catalogue from station features in a single pass. Features may arrive in any order, so the
+    catalogue can be built while the response is still being read
+    """
+
+    def __init__(self, keep_history=False):
+        """
+        :param keep_history: Keep every record of each station as Station.history, not only the latest one
+        """
+        self.keep_history = keep_history
+        self.latest: Dict[StationId, dict] = {}
+        self.coordinates: Dict[StationId, Optional[Coordinates]] = {}
+        self.histories: Dict[StationId, List[StationValidity]] = {}
+        # Many records measure the same parameters, they share a single tuple to keep the history compact
+        self.parameter_tuples: Dict[Tuple[Parameter, ...], Tuple[Parameter, ...]] = {}
+
+    def add(self, feature: dict):
+        properties = feature['properties']
+        station_id = properties['stationId']
+        latest = self.latest.get(station_id)
+        # ISO 8601 timestamps order correctly as strings. On ties the later record wins
+        if latest is None or properties['validFrom'] >= latest['validFrom']:
+            self.latest[station_id] = properties
+            self.coordinates[station_id] = feature_coordinates(feature)
+        if self.keep_history:
+            parameters = tuple(properties['parameterId'])
+            parameters = self.parameter_tuples.setdefault(parameters, parameters)
+            self.histories.setdefault(station_id, []).append((properties['validFrom'], properties.get('validTo'), parameters))
+
+    def build(self) -> Dict[StationId, Station]:
+        station_map = {}
+        for station_id, latest in self.latest.items():
+            history = sorted(self.histories[station_id], key=lambda validity: validity[0]) if self.keep_history else None
+            # Choose the latest station record to pick station name from
+            station_map[station_id] = Station(
+                station_id, latest['name'], latest['parameterId'], history, self.coordinates[station_id]
+            )
+        return station_map
+
+
+def feature_coordinates(feature: dict) -> Optional[Coordinates]:
+    geometry = feature.get('geometry')
+    if not isinstance(geometry, dict) or geometry.get('type') != 'Point':
+        return None
+    coordinates = geometry.get('coordinates')
+    if not isinstance(coordinates, list) or len(coordinates) < 2:
+        return None
+    return coordinates[0], coordinates[1]
 
-def get_stations(station_api: StationApi) -> Dict[StationId, Station]:
+
+class StationCatalogue:
+    """
+    A station catalogue as stored in the on-disk cache, together with the validators needed for revalidation
+    """
+    stations: Dict[StationId, Station]
+    fetched_at: float
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+    def __init__(self, stations, fetched_at, etag=None, last_modified=None):
+        self.stations = stations
+        self.fetched_at = fetched_at
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def is_expired(self, ttl: int) -> bool:
+        return time.time() - self.fetched_at > ttl
+
+
+class StationCache:
+    """
+    Versioned on-disk cache of station catalogues, one JSON file per StationApi
+    """
+
+    def __init__(self, cache_dir: str, ttl: int = DEFAULT_STATION_CACHE_TTL):
+        """
+        :param cache_dir: Directory the catalogue files are written to, created if missing
+        :param ttl: Seconds a cached catalogue is used without revalidating it against the API
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+
+    def path(self, station_api: StationApi) -> str:
+        return os.path.join(self.cache_dir, f"stations_{station_api.value.replace('/', '_')}.json")
+
+    def load(self, station_api: StationApi, keep_history=False) -> Optional[StationCatalogue]:
+        """
+        :param keep_history: Ignore a cached catalogue that was stored without station histories
+        """
+        try:
+            with open(self.path(station_api), encoding='utf-8') as cache_file:
+                cached = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+        if cached.get('version') != STATION_CACHE_VERSION or (keep_history and not cached.get('history')):
+            return None
+        stations = {station_id: Station.from_json(station_id, station_json)
+                    for station_id, station_json in cached['stations'].items()}
+        return StationCatalogue(stations, cached['fetched_at'], cached.get('etag'), cached.get('last_modified'))
+
+    def store(self, station_api: StationApi, catalogue: StationCatalogue):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        cached = {
+            'version': STATION_CACHE_VERSION,
+            'history': all(station.history is not None for station in catalogue.stations.values()),
+            'fetched_at': catalogue.fetched_at,
+            'etag': catalogue.etag,
+            'last_modified': catalogue.last_modified,
+            'stations': {station_id: station.to_json() for station_id, station in catalogue.stations.items()},
+        }
+        # Write next to the target and rename, so a concurrent reader never sees a half written file
+        temp_path = f'{self.path(station_api)}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as cache_file:
+            json.dump(cached, cache_file)
+        os.replace(temp_path, self.path(station_api))
+
+
+def get_stations(station_api: StationApi, cache: Optional[StationCache] = None, keep_history=False) -> Dict[StationId, Station]:
     """
     Generates station ids and corresponding names, picking current name for active stations, and latest used name for
     inactive ones
     :param station_api: ObsApi enum of which API should be used
-    :param api_key: API key for calls to the API
+    :param cache: Optional on-disk cache. A catalogue younger than the cache TTL is returned without any network
+    access, an older one is revalidated with a conditional request
+    :param keep_history: Also return every record of each station, with its validity period, as Station.history
     :return: dictionary of station id and name
     """
+    cached = cache.load(station_api, keep_history) if cache is not None else None
+    if cached is not None and not cached.is_expired(cache.ttl):
+        return cached.stations
+
+    headers = {}
+    if cached is not None:
+        if cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
+
     try:
-        obs_station_request = requests.get(
-            f'https://opendataapi.dmi.dk/{station_api.value}/collections/station/items'
+        obs_station_request = client.get(
+            f'{client.OPEN_DATA_URL}/{station_api.value}/collections/station/items',
+            headers=headers,
+            stream=True,
+            deadline=client.DEFAULT_DEADLINE
         )
     except Exception:
+        # An outdated catalogue is far more useful than none when the API can't be reached
+        if cached is not None:
+            return cached.stations
         raise StationAPIGenericException()
 
-    if obs_station_request.status_code != 200:
-        raise StationAPIGenericException()
+    # Streamed, the connection goes back to the pool only once the response is closed
+    try:
+        if obs_station_request.status_code == 304 and cached is not None:
+            cached.fetched_at = time.time()
+            cache.store(station_api, cached)
+            return cached.stations
+
+        if obs_station_request.status_code != 200:
+            if cached is not None:
+                return cached.stations
+            raise StationAPIGenericException()
 
-    json = obs_station_request.json()
-    station_map = {}
-    for station_id, stations in groupby(json['features'], key=lambda station: station['properties']['stationId']):
-        # Choose the latest station record to pick station name from
-        latest_station = sorted(stations, key=lambda station: station['properties']['validFrom'])[-1]
-        station_map[station_id] = Station(station_id, latest_station['properties']['name'], latest_station['properties']['parameterId'])
+        # The catalogue is built while the response is read, without holding the decoded response in memory
+        catalogue_builder = StationCatalogueBuilder(keep_history)
+        try:
+            for feature in FeatureCollectionStream(obs_station_request.iter_content(DEFAULT_CHUNK_SIZE)):
+                catalogue_builder.add(feature)
+        except Exception:
+            if cached is not None:
+                return cached.stations
+            raise StationAPIGenericException()
+        station_map = catalogue_builder.build()
+
+        if cache is not None:
+            cache.store(station_api, StationCatalogue(
+                station_map,
+                time.time(),
+                obs_station_request.headers.get('ETag'),
+                obs_station_request.headers.get('Last-Modified')
+            ))
+    finally:
+        obs_station_request.close()
     return station_map
+
+
+def get_stations_stale_while_revalidate(station_api: StationApi, cache: StationCache, keep_history=False) -> Tuple[Dict[StationId, Station], bool]:
+    """
+    Returns the cached catalogue immediately, even when it has outlived the cache TTL, so the caller can render it
+    and revalidate in the background by calling get_stations. Only blocks on the network when nothing is cached
+    :param station_api: ObsApi enum of which API should be used
+    :param cache: On-disk cache to read from
+    :param keep_history: Also return every record of each station, with its validity period, as Station.history
+    :return: dictionary of station id and name, and whether the caller should revalidate it
+    """
+    cached = cache.load(station_api, keep_history)
+    if cached is None:
+        return get_stations(station_api, cache, keep_history), False
+    return cached.stations, cached.is_expired(cache.ttl)
+
+
+def get_stations_concurrently(
+        station_apis: Iterable[StationApi],
+        cache: Optional[StationCache] = None,
+        fetch: Callable[[StationApi, Optional[StationCache]], Any] = get_stations,
+        max_workers: int = DEFAULT_CATALOGUE_WORKERS
+) -> Tuple[Dict[StationApi, Any], Dict[StationApi, Exception]]:
+    """
+    Fetches the catalogues of several station APIs in parallel. A failing API does not affect the others, its
+    exception is returned instead of its catalogue
+    :param station_apis: The APIs to fetch catalogues for
+    :param cache: Optional on-disk cache passed on to fetch
+    :param fetch: Function fetching one catalogue, get_stations or get_stations_stale_while_revalidate
+    :param max_workers: Maximum number of catalogues fetched at the same time
+    :return: results of fetch per API that succeeded, and the exception per API that failed
+    """
+    catalogues = {}
+    failures = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {station_api: executor.submit(fetch, station_api, cache) for station_api in station_apis}
+        for station_api, future in futures.items():
+            try:
+                catalogues[station_api] = future.result()
+            except Exception as exception:
+                failures[station_api] = exception
+    return catalogues, failures
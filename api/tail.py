@@ -0,0 +1,76 @@
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from .sharding import parse_datetime, format_datetime, SHARD_GAP
+from .station import Parameter
+
+# The end of an open datetime interval
+OPEN_END = '..'
+
+
+class LayerQuery:
+    """
+    The query an observation layer was made from, and the time of the latest value of each parameter in it, so the
+    layer can be brought up to date by asking only for values after those times
+    """
+    url: str
+    # Query parameters shared by all parameters, e.g. the stationId
+    params: Dict[str, Any]
+    parameters: List[Parameter]
+    # The column with the time of a row, observed for observations
+    time_column: str
+    # Time of the latest value of each parameter
+    latest: Dict[Parameter, str]
+
+    def __init__(self, url, params, parameters, time_column, latest=None):
+        self.url = url
+        self.params = params
+        self.parameters = parameters
+        self.time_column = time_column
+        self.latest = latest if latest is not None else {}
+
+    def to_json(self) -> dict:
+        return {
+            'url': self.url, 'params': self.params, 'parameters': list(self.parameters),
+            'time_column': self.time_column, 'latest': self.latest
+        }
+
+    @staticmethod
+    def from_json(query_json: dict) -> 'LayerQuery':
+        return LayerQuery(
+            query_json['url'], query_json['params'], query_json['parameters'], query_json['time_column'],
+            query_json.get('latest')
+        )
+
+    def latest_time(self) -> Optional[str]:
+        """
+        The time of the latest row of the layer, rows up to it may already exist
+        """
+        return max(self.latest.values(), key=parse_datetime) if self.latest else None
+
+    def tail_params(self) -> Dict[Parameter, Dict[str, Any]]:
+        """
+        Query parameters for the values of each parameter after its latest value
+        """
+        return {
+            parameter: {
+                **self.params, 'parameterId': parameter,
+                'datetime': format_datetime(parse_datetime(self.latest[parameter]) + SHARD_GAP) + '/' + OPEN_END
+            }
+            for parameter in self.parameters if parameter in self.latest
+        }
+
+    def advance(self, table: pd.DataFrame):
+        """
+        Moves the latest time of each parameter to its latest value in table, a wide table with a column per parameter
+        """
+        for parameter in self.parameters:
+            if parameter not in table:
+                continue
+            times = table.loc[table[parameter].notna(), self.time_column]
+            if len(times) == 0:
+                continue
+            latest = format_datetime(times.max().to_pydatetime())
+            if parameter not in self.latest or parse_datetime(latest) > parse_datetime(self.latest[parameter]):
+                self.latest[parameter] = latest
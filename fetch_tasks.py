@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+from qgis.PyQt.QtCore import pyqtSignal
+from qgis.core import Qgis, QgsMessageLog, QgsTask
+
+from .api.assembly import LongTable
+from .api.download import download_files, Download, DEFAULT_DOWNLOAD_WORKERS
+from .api.fetch import fetch_by_group, fetch_features, DEFAULT_CONCURRENCY
+from .api.features import FeatureColumns, KeyedFeatureColumns
+from .api.pagination import FeaturePages
+from .api.progress import FetchProgress, FetchCancelled
+from .api.observation_cache import ObservationCache, fetch_features_cached
+from .api.schemas import FeatureSchema, time_column
+
+# The stations, the parameter and the query parameters of a request
+StationJob = Tuple[Tuple[str, ...], str, Dict[str, Any]]
+
+
+class FetchTask(QgsTask):
+    """
+    Base of the tasks running downloads in the background. Progress is reported to the task manager, cancelling stops
+    the requests between chunks, and on_finished is called on the main thread, where layers can be added to the project
+    """
+
+    def __init__(self, description: str, on_finished: Callable[['FetchTask', bool], None]):
+        """
+        :param on_finished: Called with the task and whether it completed, not called if the task was cancelled
+        """
+        super().__init__(description, QgsTask.CanCancel)
+        self.on_finished = on_finished
+        self.progress = FetchProgress(self.progress_changed)
+        self.exception: Optional[Exception] = None
+
+    def fetch(self):
+        raise NotImplementedError
+
+    def progress_changed(self, progress: FetchProgress):
+        fraction = progress.fraction()
+        if fraction is not None:
+            self.setProgress(100 * fraction)
+
+    def run(self) -> bool:
+        try:
+            self.fetch()
+        except FetchCancelled:
+            return False
+        except Exception as exception:
+            self.exception = exception
+            return False
+        return not self.isCanceled()
+
+    def cancel(self):
+        self.progress.cancel()
+        super().cancel()
+
+    def finished(self, result: bool):
+        QgsMessageLog.logMessage(
+            f'{self.description()}: {self.progress.summary()}', 'DMI Open Data',
+            Qgis.Info if result else Qgis.Warning
+        )
+        if self.exception is not None:
+            QgsMessageLog.logMessage(f'{self.description()} failed: {self.exception}', 'DMI Open Data', Qgis.Critical)
+        if not self.isCanceled():
+            self.on_finished(self, result)
+
+
+class StationObservationsTask(FetchTask):
+    """
+    Fetches every station and parameter request concurrently, and assembles a table per station with a column per
+    parameter, and a long table of all stations. A request may cover several stations, its response is then split by
+    stationId
+    """
+
+    def __init__(
+            self,
+            description: str,
+            url: str,
+            schema: FeatureSchema,
+            parameters: List[str],
+            jobs: List[StationJob],
+            on_finished: Callable[['FetchTask', bool], None],
+            max_workers=DEFAULT_CONCURRENCY,
+            observation_cache: Optional[ObservationCache] = None
+    ):
+        """
+        :param parameters: The parameters in the order of the table columns
+        :param jobs: The requests, with query parameters made on the main thread beforehand
+        :param observation_cache: Only fetch the parts of the period of a station's request that aren't cached
+        """
+        super().__init__(description, on_finished)
+        self.url = url
+        self.schema = schema
+        self.parameters = parameters
+        self.jobs = jobs
+        self.max_workers = max_workers
+        self.observation_cache = observation_cache
+        self.jobs_done = 0
+        self.jobs_done_lock = threading.Lock()
+        # Results in order of completion, the wide table of each station with observations and its first feature
+        self.station_tables: Dict[str, Tuple[pd.DataFrame, dict]] = {}
+        self.observation_table = LongTable.for_schema(schema)
+        # Stations that don't produce all requested parameters
+        self.error_stations: List[str] = []
+
+    def progress_changed(self, progress: FetchProgress):
+        # Requests are numerous and short, so completed requests are a better measure than rows
+        pass
+
+    def fetch_job(self, job: StationJob) -> Tuple[int, Any]:
+        stations, _, params = job
+        try:
+            if len(stations) == 1 and self.observation_cache is not None:
+                return fetch_features_cached(
+                    self.observation_cache, self.url, params, self.schema, time_column(self.schema), self.progress
+                )
+            if len(stations) == 1:
+                return fetch_features(self.url, params, self.schema, progress=self.progress)
+            return fetch_features(
+                self.url, params, self.schema, progress=self.progress, split_by='properties.stationId', keys=stations
+            )
+        finally:
+            with self.jobs_done_lock:
+                self.jobs_done += 1
+                jobs_done = self.jobs_done
+            self.setProgress(100 * jobs_done / len(self.jobs))
+
+    def fetch(self):
+        pending = Counter(stat for stations, _, _ in self.jobs for stat in stations)
+        station_values: Dict[str, Dict[str, FeatureColumns]] = {}
+        # Each request is its own group, so it is handled as soon as it completes
+        for _, (result,) in fetch_by_group({index: [job] for index, job in enumerate(self.jobs)}, self.fetch_job, self.max_workers):
+            self.progress.check()
+            stations, para, _ = result.job
+            if result.error is not None:
+                if isinstance(result.error, FetchCancelled):
+                    raise result.error
+                QgsMessageLog.logMessage(f'{", ".join(stations)} {para}: {result.error}', 'DMI Open Data', Qgis.Warning)
+                self.error_stations.extend(stations)
+            else:
+                r_code, columns = result.value
+                columns_by_station = columns.by_key if isinstance(columns, KeyedFeatureColumns) else {stations[0]: columns}
+                for stat in stations:
+                    station_columns = columns_by_station.get(stat)
+                    if station_columns is not None and len(station_columns) > 0:
+                        station_values.setdefault(stat, {})[para] = station_columns
+                    # If the API is correct but the chosen parameter is not measured by the station.
+                    elif r_code != 403:
+                        self.error_stations.append(stat)
+            for stat in stations:
+                pending[stat] -= 1
+                if pending[stat] == 0 and stat in station_values:
+                    self.assemble_station(stat, station_values.pop(stat))
+
+    def assemble_station(self, stat: str, values: Dict[str, FeatureColumns]):
+        station_table = LongTable.for_schema(self.schema)
+        # Parameters are added in the order they were checked in, so the columns are too
+        for para in [para for para in self.parameters if para in values]:
+            param_values = values[para].to_frame()
+            station_table.add(para, param_values)
+            self.observation_table.add(para, param_values)
+        # Position and name are the same for all features of a station
+        station_feature = next(iter(values.values())).first_feature
+        # A column per parameter, made in a single pivot
+        self.station_tables[stat] = (station_table.to_wide(), station_feature)
+
+
+class FeaturesTask(FetchTask):
+    """
+    Fetches all features of a single query, like the lightning strokes of a period or the radar files to download
+    """
+
+    def __init__(
+            self,
+            description: str,
+            url: str,
+            params: Dict[str, Any],
+            schema: Union[FeatureSchema, Callable[[dict], FeatureSchema]],
+            on_finished: Callable[['FetchTask', bool], None]
+    ):
+        """
+        :param schema: The columns to extract, or a function making them from the first feature, for collections whose
+        properties differ, like api.schemas.station_schema
+        """
+        super().__init__(description, on_finished)
+        self.url = url
+        self.params = params
+        self.schema = schema
+        self.status_code: Optional[int] = None
+        self.table: Optional[pd.DataFrame] = None
+
+    def fetch(self):
+        if not callable(self.schema):
+            self.status_code, columns = fetch_features(self.url, self.params, self.schema, progress=self.progress)
+            self.table = columns.to_frame()
+            return
+        pages = FeaturePages(self.url, self.params, progress=self.progress)
+        features = iter(pages)
+        first_feature = next(features, None)
+        self.status_code = pages.status_code
+        if first_feature is None:
+            self.table = pd.DataFrame()
+            return
+        self.schema = self.schema(first_feature)
+        columns = FeatureColumns(self.schema)
+        columns.append(first_feature)
+        self.table = columns.extend(features).to_frame()
+
+
+class FileDownloadTask(FetchTask):
+    """
+    Downloads files concurrently, like the radar images of a period. Each file is announced with file_downloaded as
+    soon as it is complete, so its layer can be added while the other files are still downloading
+    """
+    # The key of a completed file and its path, or what prepare made of it, delivered on the main thread
+    file_downloaded = pyqtSignal(str, object)
+
+    def __init__(
+            self,
+            description: str,
+            downloads: Dict[str, Download],
+            on_finished: Callable[['FetchTask', bool], None],
+            max_workers=DEFAULT_DOWNLOAD_WORKERS,
+            validate: Optional[Callable[[str], bool]] = None,
+            prepare: Optional[Callable[[str, str], Any]] = None
+    ):
+        """
+        :param downloads: The URL and path of each file, by a key like the feature id. Files that exist are not
+        downloaded again
+        :param validate: Checks the content of each downloaded file, see api.download.download_file
+        :param prepare: Called in the background with the key and path of each complete file, e.g. to extract the
+        bands that are shown
+        """
+        super().__init__(description, on_finished)
+        self.downloads = downloads
+        self.max_workers = max_workers
+        self.validate = validate
+        self.prepare = prepare
+        self.files_done = 0
+        # Keys of the files that could not be downloaded
+        self.failed: List[str] = []
+
+    def progress_changed(self, progress: FetchProgress):
+        # The sizes of the files aren't known up front, so completed files are the measure
+        pass
+
+    def fetch(self):
+        for key, result in download_files(self.downloads, self.max_workers, self.progress, validate=self.validate):
+            self.progress.check()
+            if result.error is not None:
+                if isinstance(result.error, FetchCancelled):
+                    raise result.error
+                QgsMessageLog.logMessage(f'{key}: {result.error}', 'DMI Open Data', Qgis.Warning)
+                self.failed.append(key)
+            elif self.prepare is not None:
+                try:
+                    prepared = self.prepare(key, result.value)
+                except Exception as exception:
+                    QgsMessageLog.logMessage(f'{key}: {exception}', 'DMI Open Data', Qgis.Warning)
+                    self.failed.append(key)
+                else:
+                    self.file_downloaded.emit(key, prepared)
+            else:
+                self.file_downloaded.emit(key, result.value)
+            self.files_done += 1
+            self.setProgress(100 * self.files_done / len(self.downloads))
@@ -1,5 +1,20 @@
 depth_para_dkss = ['salinity_', 'water_temp_','v_comp_cur_','u_comp_cur_']
 
+################ Parameters #########################
+
+wam_para = ['wind_speed_10', 'wind_direction_10', 'sig_wave_height', 'dom_wave_period', 'mean_wave_period',
+            'mean_zero_wave_period', 'mean_wave_dir', 'sig_height_wind_waves_sea', 'mean_period_wind_wave_sea',
+            'mean_dir_wind_wave_sea', 'sig_height_swell', 'mean_period_swell', 'mean_dir_swell',
+            'benjamin_index']
+wam_para_band = list(range(1, 15))
+para_fore_dict_wam = dict(zip(wam_para, wam_para_band))
+# The last four parameters are the depth dependent ones in depth_para_dkss
+nsbs_para = ['dev_sea_mean', 'u_comp_wind', 'v_comp_wind', 'u_comp_cur', 'v_comp_cur',
+             'water_temp', 'salinity', 'ice_thick', 'ice_conc', 'u_comp_cur_',
+             'v_comp_cur_', 'water_temp_', 'salinity_']
+nsbs_para_band = list(range(1, 10))
+para_fore_dict_nsbs = dict(zip(nsbs_para[0:9], nsbs_para_band))
+
 ################ nsbs #########################
 
 band_depth_nsbs = [4,9,11,13,15,17,19,21,23,25,27,29,31,33,35,37,39,41,43,45,47,49,51,53,55,57,59,
@@ -94,4 +109,37 @@ band_num_u_current_lb = list(range(10,52))
 u_current_lb = dict(zip(band_depth_lb,band_num_u_current_lb))
 
 
-fore_para_names = []
\ No newline at end of file
+fore_para_names = []
+
+################ Band lookup #########################
+
+# Bands of the depth dependent parameters, by area and parameter
+depth_para_bands = {
+    'nsbs': {'salinity_': salinity_nsbs, 'water_temp_': water_temp_nsbs, 'v_comp_cur_': u_current_nsbs, 'u_comp_cur_': v_current_nsbs},
+    'idw': {'salinity_': salinity_idw, 'water_temp_': water_temp_idw, 'v_comp_cur_': u_current_idw, 'u_comp_cur_': v_current_idw},
+    'ws': {'salinity_': salinity_ws, 'water_temp_': water_temp_ws, 'v_comp_cur_': u_current_ws, 'u_comp_cur_': v_current_ws},
+    'if': {'salinity_': salinity_if, 'water_temp_': water_temp_if, 'v_comp_cur_': u_current_if, 'u_comp_cur_': v_current_if},
+    'lf': {'salinity_': salinity_lf, 'water_temp_': water_temp_lf, 'v_comp_cur_': u_current_lf, 'u_comp_cur_': v_current_lf},
+    'lb': {'salinity_': salinity_lb, 'water_temp_': water_temp_lb, 'v_comp_cur_': u_current_lb, 'u_comp_cur_': v_current_lb},
+}
+
+
+def forecast_bands(model, area, parameters, depths):
+    """
+    The bands of a forecast file holding each parameter, depth dependent DKSS parameters once per depth
+    :param model: 'wam' or 'dkss'
+    :param area: The forecast area, e.g. 'nsbs'
+    :param parameters: Selected parameters, in order
+    :param depths: Selected depths in meters, depths the area doesn't have are left out
+    :return: list of parameter, depth (None for parameters without depths) and band number
+    """
+    bands = []
+    for parameter in parameters:
+        if model == 'wam':
+            bands.append((parameter, None, para_fore_dict_wam[parameter]))
+        elif parameter in depth_para_dkss:
+            depth_bands = depth_para_bands[area][parameter]
+            bands += [(parameter, depth, depth_bands[depth]) for depth in depths if depth in depth_bands]
+        else:
+            bands.append((parameter, None, para_fore_dict_nsbs[parameter]))
+    return bands
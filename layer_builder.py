@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+import pandas as pd
+from qgis.PyQt.QtCore import Qt, QDateTime, QVariant
+from qgis.core import QgsFeature, QgsFeatureRequest, QgsField, QgsGeometry, QgsPointXY, QgsVectorLayer
+
+from .api.features import format_times
+from .api.schemas import FeatureSchema, ColumnType, LONGITUDE, LATITUDE
+
+# Features handed to the data provider at a time, bounding the memory of prepared features
+DEFAULT_BATCH_SIZE = 10000
+# Field types of schema column types, other columns become String fields
+COLUMN_FIELD_TYPES = {ColumnType.FLOAT: QVariant.Double, ColumnType.DATETIME: QVariant.DateTime}
+
+
+def qgis_attribute_table(table: pd.DataFrame) -> pd.DataFrame:
+    """
+    Copy of table that QGIS attribute values can be taken from, with datetimes as text in the API's format, as the
+    layers have always had them, and missing values as None
+    """
+    table = format_times(table)
+    return table.astype(object).where(table.notna(), None)
+
+
+def table_fields(table: pd.DataFrame, field_types: Optional[Dict[str, QVariant.Type]] = None) -> List[QgsField]:
+    """
+    A field per column of table, datetimes as DateTime, floats as Double and everything else as String
+    :param field_types: Types of columns that should not follow from their dtype
+    """
+    fields = []
+    for head in table:
+        if field_types and head in field_types:
+            field_type = field_types[head]
+        elif pd.api.types.is_datetime64_any_dtype(table[head]):
+            field_type = QVariant.DateTime
+        elif pd.api.types.is_float_dtype(table[head]):
+            field_type = QVariant.Double
+        else:
+            field_type = QVariant.String
+        fields.append(QgsField(head, field_type))
+    return fields
+
+
+def schema_fields(schema: FeatureSchema) -> List[QgsField]:
+    """
+    A field per column of a collection schema, except the coordinates which become the geometry
+    """
+    return [
+        QgsField(column.name, COLUMN_FIELD_TYPES.get(column.column_type, QVariant.String))
+        for column in schema if column.name not in (LONGITUDE.name, LATITUDE.name)
+    ]
+
+
+def create_memory_layer(geometry_type: str, name: str, fields: List[QgsField]) -> QgsVectorLayer:
+    """
+    :param geometry_type: 'Point' or 'Polygon'
+    """
+    layer = QgsVectorLayer(geometry_type, name, 'memory')
+    layer.dataProvider().addAttributes(fields)
+    layer.updateFields()
+    return layer
+
+
+def add_features(
+        layer: QgsVectorLayer,
+        rows: Iterable[List],
+        geometries: Iterable[QgsGeometry],
+        batch_size=DEFAULT_BATCH_SIZE
+) -> int:
+    """
+    Adds features straight to the data provider of layer in batches, without an edit buffer
+    :param rows: Attribute values of each feature, in field order
+    :param geometries: Geometry of each feature
+    :return: The number of features added
+    """
+    provider = layer.dataProvider()
+    fields = layer.fields()
+    count = 0
+    batch = []
+    for attributes, geometry in zip(rows, geometries):
+        feature = QgsFeature(fields)
+        feature.setGeometry(geometry)
+        feature.setAttributes(attributes)
+        batch.append(feature)
+        if len(batch) >= batch_size:
+            provider.addFeatures(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        provider.addFeatures(batch)
+        count += len(batch)
+    layer.updateExtents()
+    return count
+
+
+def attribute_rows(table: pd.DataFrame) -> Iterator[List]:
+    """
+    The rows of table as QGIS attribute values
+    """
+    return (list(row) for row in qgis_attribute_table(table).itertuples(index=False, name=None))
+
+
+def point_geometries(longitudes: Iterable[float], latitudes: Iterable[float]) -> Iterator[QgsGeometry]:
+    return (QgsGeometry.fromPointXY(QgsPointXY(x, y)) for x, y in zip(longitudes, latitudes))
+
+
+def feature_geometry(geometry: dict) -> QgsGeometry:
+    """
+    QGIS geometry of a GeoJSON Point or Polygon
+    """
+    coordinates = geometry['coordinates']
+    if geometry['type'] == 'Polygon':
+        return QgsGeometry.fromPolygonXY([[QgsPointXY(x, y) for x, y, *_ in ring] for ring in coordinates])
+    return QgsGeometry.fromPointXY(QgsPointXY(coordinates[0], coordinates[1]))
+
+
+def build_table_layer(
+        geometry_type: str,
+        name: str,
+        table: pd.DataFrame,
+        geometry: QgsGeometry,
+        field_types: Optional[Dict[str, QVariant.Type]] = None,
+        batch_size=DEFAULT_BATCH_SIZE
+) -> QgsVectorLayer:
+    """
+    A memory layer with a feature per row of table, all at the same location, like the observations of a station
+    :param geometry: Shared by all features, QGIS geometries are implicitly shared so it is not copied per feature
+    """
+    layer = create_memory_layer(geometry_type, name, table_fields(table, field_types))
+    add_features(layer, attribute_rows(table), (geometry for _ in range(len(table))), batch_size)
+    return layer
+
+
+def build_point_layer(
+        name: str,
+        table: pd.DataFrame,
+        fields: List[QgsField],
+        batch_size=DEFAULT_BATCH_SIZE
+) -> QgsVectorLayer:
+    """
+    A memory layer with a point feature per row of table, like lightning strokes or stations
+    :param table: The columns of fields, and longitude and latitude columns for the geometry
+    :param fields: The fields of the layer, declared once, see schema_fields
+    """
+    layer = create_memory_layer('Point', name, fields)
+    attributes = table[[field.name() for field in fields]]
+    geometries = point_geometries(table[LONGITUDE.name].tolist(), table[LATITUDE.name].tolist())
+    add_features(layer, attribute_rows(attributes), geometries, batch_size)
+    return layer
+
+
+def upsert_table(
+        layer: QgsVectorLayer,
+        table: pd.DataFrame,
+        key_field: str,
+        latest: Optional[pd.Timestamp],
+        geometry: QgsGeometry,
+        batch_size=DEFAULT_BATCH_SIZE
+) -> int:
+    """
+    Adds the rows of table to a layer made by build_table_layer, like new observations of a station. Rows after latest
+    are added as features, earlier rows set their values on the feature with the same key, so a parameter arriving
+    later than the others fills in its field instead of adding a second feature for the same time. Earlier rows no
+    feature has the key of are added too
+    :param key_field: Datetime field identifying a feature, e.g. observed
+    :param latest: The latest key in layer, None to add all rows
+    :return: The number of features added
+    """
+    fields = layer.fields()
+    table = table[[head for head in table if fields.indexOf(head) >= 0]]
+    known = table[key_field] <= latest if latest is not None else pd.Series(False, index=table.index)
+    if known.any():
+        unmatched = update_features(layer, table[known], key_field)
+        known &= ~pd.Series([key in unmatched for key in time_keys(table[key_field])], index=table.index)
+    new_rows = table[~known].reindex(columns=fields.names())
+    return add_features(layer, attribute_rows(new_rows), (geometry for _ in range(len(new_rows))), batch_size)
+
+
+def time_keys(times: pd.Series) -> List[Optional[int]]:
+    """
+    Milliseconds since the epoch of a datetime column, as QDateTime.toMSecsSinceEpoch, None for missing times
+    """
+    return [None if pd.isna(timestamp) else timestamp.value // 10**6 for timestamp in times]
+
+
+def update_features(layer: QgsVectorLayer, table: pd.DataFrame, key_field: str) -> Set[int]:
+    """
+    Sets the values of the rows of table on the features with the same key, values missing from table are kept
+    :return: The keys of the rows no feature has, see time_keys
+    """
+    fields = layer.fields()
+    key_index = fields.indexOf(key_field)
+    rows = {
+        key: row
+        for key, row in zip(time_keys(table[key_field]), qgis_attribute_table(table).to_dict('records'))
+        if key is not None
+    }
+    unmatched = set(rows)
+    # Only the key is read, so the scan doesn't materialize geometries or other attributes
+    request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry).setSubsetOfAttributes([key_index])
+    changes = {}
+    for feature in layer.getFeatures(request):
+        key = feature[key_index]
+        if isinstance(key, str):
+            key = QDateTime.fromString(key, Qt.ISODateWithMs)
+        key = key.toMSecsSinceEpoch() if isinstance(key, QDateTime) and key.isValid() else None
+        row = rows.get(key)
+        if row is not None:
+            unmatched.discard(key)
+            changes[feature.id()] = {
+                fields.indexOf(head): value for head, value in row.items() if head != key_field and value is not None
+            }
+    if changes:
+        layer.dataProvider().changeAttributeValues(changes)
+    return unmatched
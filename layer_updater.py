@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import json
+from typing import Dict, List, Optional
+
+import pandas as pd
+from qgis.PyQt.QtCore import QSettings, QTimer
+from qgis.core import Qgis, QgsApplication, QgsMapLayer, QgsMessageLog, QgsProject, QgsVectorLayer
+from qgis.utils import iface
+
+from .api.fetch import DEFAULT_CONCURRENCY
+from .api.schemas import OBSERVATION_SCHEMA
+from .api.tail import LayerQuery
+from .fetch_tasks import StationObservationsTask
+from .layer_builder import upsert_table, feature_geometry
+
+# Custom property of observation layers holding their LayerQuery as JSON
+LAYER_QUERY_PROPERTY = 'DMI_Open_Data/query'
+# Minutes between automatic updates
+DEFAULT_UPDATE_INTERVAL = 10
+
+
+def set_layer_query(layer: QgsMapLayer, query: LayerQuery):
+    layer.setCustomProperty(LAYER_QUERY_PROPERTY, json.dumps(query.to_json()))
+
+
+def layer_query(layer: QgsMapLayer) -> Optional[LayerQuery]:
+    """
+    The query of a layer made by the plugin, None for other layers
+    """
+    if not isinstance(layer, QgsVectorLayer):
+        return None
+    query_json = layer.customProperty(LAYER_QUERY_PROPERTY)
+    return LayerQuery.from_json(json.loads(query_json)) if query_json else None
+
+
+class LayerUpdater:
+    """
+    Brings observation layers up to date in place, fetching only the values after the latest value of each parameter
+    already in a layer. Updates can be repeated on a timer, so a layer kept open stays current at the cost of the new
+    values only
+    """
+
+    def __init__(self):
+        # Running updates, references are kept so they are not garbage collected while running
+        self.tasks: List[StationObservationsTask] = []
+        self.timer = QTimer()
+        self.timer.timeout.connect(lambda: self.update_layers(self.project_layers()))
+
+    @staticmethod
+    def project_layers() -> List[QgsVectorLayer]:
+        return [layer for layer in QgsProject.instance().mapLayers().values() if layer_query(layer) is not None]
+
+    def selected_layers(self) -> List[QgsVectorLayer]:
+        """
+        The observation layers selected in the layers panel, all observation layers of the project if none are
+        """
+        selected = [layer for layer in iface.layerTreeView().selectedLayers() if layer_query(layer) is not None]
+        return selected or self.project_layers()
+
+    def set_automatic(self, enabled: bool):
+        if enabled:
+            minutes = QSettings().value('DMI_Open_Data/layer_update_interval', DEFAULT_UPDATE_INTERVAL, type=int)
+            self.timer.start(max(1, minutes) * 60 * 1000)
+        else:
+            self.timer.stop()
+
+    def update_layers(self, layers: List[QgsVectorLayer]):
+        # Layers made from the same query and up to the same time are updated from the same requests, layers of a
+        # station with other parameters or times get requests of their own
+        layers_by_query: Dict[str, List[QgsVectorLayer]] = {}
+        for layer in layers:
+            layers_by_query.setdefault(json.dumps(layer_query(layer).to_json(), sort_keys=True), []).append(layer)
+        for query_layers in layers_by_query.values():
+            query = layer_query(query_layers[0])
+            stat = query.params['stationId']
+            jobs = [((stat,), para, params) for para, params in query.tail_params().items()]
+            if not jobs:
+                continue
+
+            def updates_fetched(task, completed, query_layers=query_layers):
+                if not completed:
+                    iface.messageBar().pushWarning('DMI Open Data', 'Updating layers failed, they are updated next time')
+                    return
+                for station_table, station_feature in task.station_tables.values():
+                    for layer in query_layers:
+                        self.append_to_layer(layer, station_table, station_feature)
+
+            max_concurrent_requests = QSettings().value('DMI_Open_Data/max_concurrent_requests', DEFAULT_CONCURRENCY, type=int)
+            self.start_task(StationObservationsTask(
+                'DMI Open Data layer update', query.url, OBSERVATION_SCHEMA, query.parameters, jobs, updates_fetched,
+                max_concurrent_requests
+            ))
+
+    @staticmethod
+    def append_to_layer(layer: QgsVectorLayer, table: pd.DataFrame, feature: dict):
+        # The layer may have been removed from the project while the update ran
+        if QgsProject.instance().mapLayer(layer.id()) is None:
+            return
+        query = layer_query(layer)
+        latest = query.latest_time()
+        added = upsert_table(
+            layer, table, query.time_column, pd.Timestamp(latest) if latest is not None else None,
+            feature_geometry(feature['geometry'])
+        )
+        query.advance(table)
+        set_layer_query(layer, query)
+        layer.triggerRepaint()
+        QgsMessageLog.logMessage(f'{layer.name()}: {added} observations added', 'DMI Open Data', Qgis.Info)
+
+    def start_task(self, task: StationObservationsTask):
+        self.tasks.append(task)
+        task.taskCompleted.connect(lambda: self.tasks.remove(task))
+        task.taskTerminated.connect(lambda: self.tasks.remove(task))
+        QgsApplication.taskManager().addTask(task)
+
+    def stop(self):
+        self.timer.stop()
+        for task in list(self.tasks):
+            task.cancel()
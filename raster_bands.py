@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import os
+from typing import Dict, List, Optional, Union
+
+from osgeo import gdal
+
+from .api.download import PARTIAL_SUFFIX
+from .api.file_cache import FileCache
+
+# Compressed and tiled, floats are written as differences to their neighbours, which compresses far better
+BAND_CREATION_OPTIONS = ['COMPRESS=DEFLATE', 'PREDICTOR=3', 'TILED=YES']
+# Reduced resolutions stored in the file, so a zoomed out map doesn't read the whole band
+OVERVIEW_LEVELS = [2, 4, 8, 16]
+
+
+def extract_band(source: Union[str, gdal.Dataset], band: int, path: str) -> str:
+    """
+    Writes a single band of a raster as a compressed GeoTIFF with overviews
+    :param source: A raster GDAL can open, like a GRIB forecast file, or the opened dataset
+    :param band: Band number in source, starting at 1
+    :return: path, which only exists once the file is complete
+    """
+    partial_path = path + PARTIAL_SUFFIX
+    try:
+        dataset = gdal.Translate(
+            partial_path, source, format='GTiff', bandList=[band], outputType=gdal.GDT_Float32,
+            creationOptions=BAND_CREATION_OPTIONS
+        )
+        if dataset is None:
+            raise RuntimeError(f'Band {band} of {source} could not be extracted: {gdal.GetLastErrorMsg()}')
+        dataset.BuildOverviews('AVERAGE', OVERVIEW_LEVELS)
+        # Closing the dataset writes it to disk
+        dataset = None
+        os.replace(partial_path, path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    return path
+
+
+def find_cached_bands(file_cache: FileCache, bands: List[int], *key: str) -> Dict[int, Optional[str]]:
+    """
+    The cached files of bands, so a source whose bands are all cached doesn't have to be downloaded
+    :param key: What identifies the content of the source, e.g. the model run and feature id
+    :return: The file of each band, None for bands that aren't cached
+    """
+    return {band: file_cache.get('bands', *key, f'band_{band}.tif') for band in bands}
+
+
+def cached_bands(file_cache: FileCache, source: str, bands: List[int], *key: str) -> Dict[int, str]:
+    """
+    The files of several bands of source, like several parameters and depths of a forecast file. Source is opened once
+    for all bands that aren't cached already
+    :param key: What identifies the content of source, e.g. the model run and feature id
+    :return: The file of each band
+    """
+    paths = find_cached_bands(file_cache, bands, *key)
+    missing = [band for band, path in paths.items() if path is None]
+    if missing:
+        dataset = gdal.Open(source)
+        if dataset is None:
+            raise RuntimeError(f'{source} could not be opened: {gdal.GetLastErrorMsg()}')
+        for band in missing:
+            paths[band] = extract_band(dataset, band, file_cache.path('bands', *key, f'band_{band}.tif'))
+        dataset = None
+    return paths
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+from functools import partial
+from typing import Dict, List, Tuple, Set
+
+from qgis.PyQt import QtWidgets
+from qgis.PyQt.QtCore import Qt, QAbstractListModel, QModelIndex, QSortFilterProxyModel
+from qgis.gui import QgsCheckableComboBox
+
+# An item in a checkable list, the key used in API calls and the text shown to the user
+ListItem = Tuple[str, str]
+
+
+class CheckableListModel(QAbstractListModel):
+    """
+    List model of checkable stations, cells, municipalities or parameters.
+    Check states are kept in a set of keys, so a list of thousands of items costs no widgets, and the view only
+    paints the rows that are visible
+    """
+
+    def __init__(self, items: List[ListItem] = (), exclusive=False, parent=None):
+        """
+        :param items: Keys and display texts, shown in the given order
+        :param exclusive: Only allow a single checked item at a time, like a group of radio buttons
+        """
+        super().__init__(parent)
+        self.exclusive = exclusive
+        self.items = list(items)
+        self.rows: Dict[str, int] = {key: row for row, (key, _) in enumerate(self.items)}
+        self.checked: Set[str] = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.items)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        key, text = self.items[index.row()]
+        if role == Qt.DisplayRole:
+            return text
+        if role == Qt.CheckStateRole:
+            return Qt.Checked if key in self.checked else Qt.Unchecked
+        if role == Qt.UserRole:
+            return key
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.CheckStateRole or not index.isValid():
+            return False
+        self.set_checked(self.items[index.row()][0], value == Qt.Checked)
+        return True
+
+    def set_items(self, items: List[ListItem]):
+        """
+        Replaces the items of the list. Items that are still present stay checked
+        """
+        self.beginResetModel()
+        self.items = list(items)
+        self.rows = {key: row for row, (key, _) in enumerate(self.items)}
+        self.checked &= self.rows.keys()
+        self.endResetModel()
+
+    def is_checked(self, key: str) -> bool:
+        return key in self.checked
+
+    def set_checked(self, key: str, checked: bool):
+        if key not in self.rows or (key in self.checked) == checked:
+            return
+        if checked and self.exclusive:
+            for other_key in list(self.checked):
+                self.set_checked(other_key, False)
+        if checked:
+            self.checked.add(key)
+        else:
+            self.checked.discard(key)
+        index = self.index(self.rows[key])
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+
+    def checked_keys(self) -> List[str]:
+        """
+        The checked keys in list order, found from the checked set without visiting unchecked items
+        """
+        return sorted(self.checked, key=self.rows.__getitem__)
+
+    def clear_checked(self):
+        if not self.checked:
+            return
+        self.checked.clear()
+        # A single change notification for the whole list instead of one per unchecked item
+        self.dataChanged.emit(self.index(0), self.index(len(self.items) - 1), [Qt.CheckStateRole])
+
+    def take_checked(self) -> List[str]:
+        """
+        Returns the checked keys and unchecks them, as done when a selection has been used for a run
+        """
+        checked_keys = self.checked_keys()
+        self.clear_checked()
+        return checked_keys
+
+
+class ButtonSelection:
+    """
+    Tracks which of a fixed group of check boxes or radio buttons are checked, from their toggled signals, with the
+    same interface as CheckableListModel
+    """
+
+    def __init__(self, buttons: Dict[str, QtWidgets.QAbstractButton]):
+        """
+        :param buttons: The buttons by the key they represent, in the order keys should be returned
+        """
+        self.buttons = buttons
+        self.order = {key: position for position, key in enumerate(buttons)}
+        self.checked: Set[str] = {key for key, button in buttons.items() if button.isChecked()}
+        for key, button in buttons.items():
+            button.toggled.connect(partial(self.button_toggled, key))
+
+    def button_toggled(self, key: str, checked: bool):
+        if checked:
+            self.checked.add(key)
+        else:
+            self.checked.discard(key)
+
+    def is_checked(self, key: str) -> bool:
+        return key in self.checked
+
+    def checked_keys(self) -> List[str]:
+        return sorted(self.checked, key=self.order.__getitem__)
+
+    def clear_checked(self):
+        for key in list(self.checked):
+            self.buttons[key].setChecked(False)
+
+    def take_checked(self) -> List[str]:
+        checked_keys = self.checked_keys()
+        self.clear_checked()
+        return checked_keys
+
+
+def create_checkable_list(container: QtWidgets.QWidget, exclusive=False) -> CheckableListModel:
+    """
+    Adds a filter field and a list view of a new, empty CheckableListModel to the layout of container
+    """
+    model = CheckableListModel(exclusive=exclusive, parent=container)
+    proxy_model = QSortFilterProxyModel(container)
+    proxy_model.setSourceModel(model)
+    proxy_model.setFilterCaseSensitivity(Qt.CaseInsensitive)
+
+    filter_edit = QtWidgets.QLineEdit(container)
+    filter_edit.setPlaceholderText('Filter')
+    filter_edit.setClearButtonEnabled(True)
+    filter_edit.textChanged.connect(proxy_model.setFilterFixedString)
+
+    list_view = QtWidgets.QListView(container)
+    # All rows have the same height, which lets the view skip measuring every row
+    list_view.setUniformItemSizes(True)
+    list_view.setModel(proxy_model)
+
+    layout = container.findChildren(QtWidgets.QVBoxLayout)[0]
+    layout.addWidget(filter_edit)
+    layout.addWidget(list_view)
+    return model
+
+
+def replace_with_checkable_combo_box(combo: QtWidgets.QComboBox) -> QgsCheckableComboBox:
+    """
+    Puts a combo box where several items can be checked in the place of combo in its layout, with the same items and
+    the current item checked
+    """
+    checkable = QgsCheckableComboBox(combo.parentWidget())
+    checkable.addItems([combo.itemText(index) for index in range(combo.count())])
+    checkable.setCheckedItems([combo.currentText()])
+    combo.parentWidget().layout().replaceWidget(combo, checkable)
+    combo.deleteLater()
+    return checkable
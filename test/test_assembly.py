@@ -0,0 +1,58 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from ..api.assembly import LongTable
+from ..api.features import FeatureColumns
+from ..api.schemas import OBSERVATION_SCHEMA
+
+
+def observation_frame(station_id, observations):
+    features = [
+        {'properties': {'stationId': station_id, 'observed': observed, 'value': value}}
+        for observed, value in observations
+    ]
+    return FeatureColumns(OBSERVATION_SCHEMA).extend(features).to_frame()
+
+
+class TestLongTable(unittest.TestCase):
+    def setUp(self):
+        self.table = LongTable.for_schema(OBSERVATION_SCHEMA)
+        self.table.add('temp_dry', observation_frame('06180', [('2023-01-01T00:00:00Z', 1.0), ('2023-01-01T00:10:00Z', 2.0)]))
+        self.table.add('wind_speed', observation_frame('06180', [('2023-01-01T00:10:00Z', 5.0)]))
+        self.table.add('temp_dry', observation_frame('06181', [('2023-01-01T00:00:00Z', 3.0)]))
+
+    def test_wide_table_has_a_column_per_parameter(self):
+        wide = self.table.to_wide()
+        self.assertEqual(list(wide.columns), ['observed', 'stationId', 'temp_dry', 'wind_speed'])
+        self.assertEqual(len(wide), 3)
+        row = wide[(wide['stationId'] == '06180') & (wide['observed'] == pd.Timestamp('2023-01-01T00:10:00Z'))]
+        self.assertEqual(row[['temp_dry', 'wind_speed']].values.tolist(), [[2.0, 5.0]])
+        self.assertTrue(np.isnan(wide[wide['stationId'] == '06181']['wind_speed']).all())
+
+    def test_wide_table_matches_outer_merges(self):
+        merged = observation_frame('06180', [('2023-01-01T00:00:00Z', 1.0), ('2023-01-01T00:10:00Z', 2.0)]) \
+            .rename(columns={'value': 'temp_dry'}) \
+            .merge(observation_frame('06180', [('2023-01-01T00:10:00Z', 5.0)]).rename(columns={'value': 'wind_speed'}),
+                   how='outer', on=['observed', 'stationId'])
+        table = LongTable.for_schema(OBSERVATION_SCHEMA)
+        table.add('temp_dry', observation_frame('06180', [('2023-01-01T00:00:00Z', 1.0), ('2023-01-01T00:10:00Z', 2.0)]))
+        table.add('wind_speed', observation_frame('06180', [('2023-01-01T00:10:00Z', 5.0)]))
+        pd.testing.assert_frame_equal(
+            table.to_wide().astype({'stationId': str}),
+            merged[['observed', 'stationId', 'temp_dry', 'wind_speed']].astype({'stationId': str})
+        )
+
+    def test_long_table_keeps_a_row_per_value(self):
+        long = self.table.to_long()
+        self.assertEqual(list(long.columns), ['observed', 'stationId', 'parameterId', 'value'])
+        self.assertEqual(len(long), len(self.table))
+        self.assertEqual(long['value'].tolist(), [1.0, 2.0, 5.0, 3.0])
+
+    def test_empty_table(self):
+        self.assertEqual(list(LongTable(['observed']).to_wide().columns), ['observed'])
+
+
+if __name__ == '__main__':
+    unittest.main()
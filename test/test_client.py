@@ -0,0 +1,77 @@
+import unittest
+from unittest import mock
+
+import requests
+
+from ..api import client
+from ..api.client import OpenDataAPIException
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestGet(unittest.TestCase):
+    def setUp(self):
+        self.session = mock.Mock()
+        patcher = mock.patch.object(client, 'get_session', return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sleep_patcher = mock.patch.object(client.time, 'sleep')
+        self.sleep = sleep_patcher.start()
+        self.addCleanup(sleep_patcher.stop)
+
+    def test_server_errors_are_retried(self):
+        unavailable = FakeResponse(503)
+        self.session.get.side_effect = [unavailable, FakeResponse(429, {'Retry-After': '2'}), FakeResponse(200)]
+        self.assertEqual(client.get('https://opendataapi.dmi.dk/v2/metObs').status_code, 200)
+        self.assertEqual(self.session.get.call_count, 3)
+        self.assertTrue(unavailable.closed)
+        self.assertEqual(self.sleep.call_args_list[1], mock.call(2.0))
+
+    def test_last_response_is_returned_when_retries_are_exhausted(self):
+        self.session.get.side_effect = [FakeResponse(500), FakeResponse(502)]
+        self.assertEqual(client.get('https://opendataapi.dmi.dk/v2/metObs', retries=1).status_code, 502)
+
+    def test_client_errors_are_not_retried(self):
+        self.session.get.return_value = FakeResponse(400)
+        self.assertEqual(client.get('https://opendataapi.dmi.dk/v2/metObs').status_code, 400)
+        self.session.get.assert_called_once()
+
+    def test_connection_errors_raise_when_retries_are_exhausted(self):
+        self.session.get.side_effect = requests.ConnectionError()
+        with self.assertRaises(OpenDataAPIException):
+            client.get('https://opendataapi.dmi.dk/v2/metObs', retries=2)
+        self.assertEqual(self.session.get.call_count, 3)
+
+    def test_no_retry_is_started_after_the_deadline(self):
+        self.session.get.side_effect = [FakeResponse(503, {'Retry-After': '20'}), FakeResponse(200)]
+        self.assertEqual(client.get('https://opendataapi.dmi.dk/v2/metObs', deadline=10).status_code, 503)
+        self.session.get.assert_called_once()
+        self.sleep.assert_not_called()
+
+    def test_connect_timeout_ends_at_the_deadline(self):
+        self.session.get.return_value = FakeResponse(200)
+        client.get('https://opendataapi.dmi.dk/v2/metObs', timeout=(10, 60), deadline=5)
+        connect, read = self.session.get.call_args.kwargs['timeout']
+        self.assertLessEqual(connect, 5)
+        self.assertEqual(read, 60)
+
+    def test_backoff_delay_is_bounded(self):
+        for attempt in range(20):
+            self.assertLessEqual(client.backoff_delay(attempt), client.BACKOFF_MAX)
+
+
+class TestSession(unittest.TestCase):
+    def test_requests_beyond_the_pool_wait_for_a_connection(self):
+        self.addCleanup(setattr, client, '_session', client._session)
+        client._session = None
+        adapter = client.get_session().get_adapter(client.OPEN_DATA_URL)
+        self.assertTrue(adapter._pool_block)
+        self.assertEqual(adapter._pool_maxsize, client.DEFAULT_POOL_SIZE)
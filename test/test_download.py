@@ -0,0 +1,128 @@
+import os
+import unittest
+from tempfile import mkdtemp
+from unittest import mock
+
+import requests
+
+from ..api import client
+from ..api.download import (
+    download_file, download_files, grib_complete, IncompleteDownloadException, InvalidDownloadException, PARTIAL_SUFFIX
+)
+from ..api.progress import FetchProgress, FetchCancelled
+
+CONTENT = bytes(range(256)) * 1000
+
+
+class FakeResponse:
+    def __init__(self, content, content_length=None, status_code=200, headers=None, break_after=None):
+        """
+        :param break_after: Bytes sent before the connection breaks
+        """
+        self.status_code = status_code
+        self.content = content
+        self.headers = {'Content-Length': str(content_length if content_length is not None else len(content)), **(headers or {})}
+        self.break_after = break_after
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            if self.break_after is not None and start >= self.break_after:
+                raise requests.exceptions.ChunkedEncodingError('Connection broken')
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class TestDownloadFile(unittest.TestCase):
+    def setUp(self):
+        self.directory = mkdtemp(suffix='_downloads')
+        self.path = os.path.join(self.directory, 'file.h5')
+
+    def test_file_is_written_in_chunks(self):
+        response = FakeResponse(CONTENT)
+        progress = FetchProgress()
+        with mock.patch.object(client, 'get', return_value=response):
+            download_file('https://example.com/file.h5', self.path, progress, chunk_size=100000)
+        with open(self.path, 'rb') as file:
+            self.assertEqual(file.read(), CONTENT)
+        self.assertEqual(progress.bytes, len(CONTENT))
+        self.assertEqual(progress.pages, 1)
+        self.assertTrue(response.closed)
+
+    def test_truncated_file_is_not_used(self):
+        with mock.patch.object(client, 'get', return_value=FakeResponse(CONTENT, content_length=len(CONTENT) + 1)):
+            with self.assertRaises(IncompleteDownloadException):
+                download_file('https://example.com/file.h5', self.path, resume_attempts=0)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_cancelled_download_is_kept_for_resuming(self):
+        progress = FetchProgress()
+        progress.add = lambda **counts: progress.cancel()
+        with mock.patch.object(client, 'get', return_value=FakeResponse(CONTENT)):
+            with self.assertRaises(FetchCancelled):
+                download_file('https://example.com/file.h5', self.path, progress, chunk_size=1000)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(os.path.getsize(self.path + PARTIAL_SUFFIX), 1000)
+
+    def test_broken_download_is_resumed_with_a_range_request(self):
+        ranges = []
+
+        def get(url, headers=None, stream=False, deadline=None):
+            ranges.append(headers.get('Range'))
+            if 'Range' not in headers:
+                return FakeResponse(CONTENT, break_after=100000)
+            start = int(headers['Range'][len('bytes='):-1])
+            return FakeResponse(CONTENT[start:], status_code=206,
+                                headers={'Content-Range': f'bytes {start}-{len(CONTENT) - 1}/{len(CONTENT)}'})
+
+        with mock.patch.object(client, 'get', side_effect=get):
+            download_file('https://example.com/file.h5', self.path, chunk_size=50000)
+        self.assertEqual(ranges, [None, 'bytes=100000-'])
+        with open(self.path, 'rb') as file:
+            self.assertEqual(file.read(), CONTENT)
+
+    def test_server_without_ranges_sends_the_whole_file(self):
+        with open(self.path + PARTIAL_SUFFIX, 'wb') as file:
+            file.write(CONTENT[:1000])
+        with mock.patch.object(client, 'get', return_value=FakeResponse(CONTENT)):
+            download_file('https://example.com/file.h5', self.path)
+        with open(self.path, 'rb') as file:
+            self.assertEqual(file.read(), CONTENT)
+
+    def test_complete_part_is_used(self):
+        with open(self.path + PARTIAL_SUFFIX, 'wb') as file:
+            file.write(CONTENT)
+        response = FakeResponse(b'', status_code=416, headers={'Content-Range': f'bytes */{len(CONTENT)}'})
+        with mock.patch.object(client, 'get', return_value=response):
+            download_file('https://example.com/file.h5', self.path)
+        self.assertEqual(os.path.getsize(self.path), len(CONTENT))
+
+    def test_invalid_file_is_discarded(self):
+        grib = b'GRIB' + CONTENT
+        with mock.patch.object(client, 'get', return_value=FakeResponse(grib)):
+            with self.assertRaises(InvalidDownloadException):
+                download_file('https://example.com/file.grib', self.path, validate=grib_complete)
+        self.assertEqual(os.listdir(self.directory), [])
+        with mock.patch.object(client, 'get', return_value=FakeResponse(grib + b'7777')):
+            download_file('https://example.com/file.grib', self.path, validate=grib_complete)
+        self.assertTrue(os.path.exists(self.path))
+
+
+class TestDownloadFiles(unittest.TestCase):
+    def test_existing_files_are_not_downloaded(self):
+        directory = mkdtemp(suffix='_downloads')
+        with open(os.path.join(directory, 'a'), 'wb') as file:
+            file.write(b'cached')
+        downloads = {key: ('https://example.com/' + key, os.path.join(directory, key)) for key in ['a', 'b', 'c']}
+        with mock.patch.object(client, 'get', side_effect=lambda url, **kwargs: FakeResponse(url.encode())) as get:
+            results = dict(download_files(downloads, max_workers=2))
+        self.assertEqual(get.call_count, 2)
+        self.assertEqual({key: result.value for key, result in results.items()}, {key: path for key, (_, path) in downloads.items()})
+        with open(os.path.join(directory, 'c'), 'rb') as file:
+            self.assertEqual(file.read(), b'https://example.com/c')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import json
+import unittest
+
+import numpy as np
+
+from ..api.features import (
+    FeatureCollectionStream, FeatureColumns, FeatureStreamException, KeyedFeatureColumns, format_times,
+    join_coordinates
+)
+from ..api.schemas import Column, ColumnType, OBSERVATION_SCHEMA, LIGHTNING_OBSERVATION_SCHEMA
+
+
+def chunked(data: bytes, size: int):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+class TestFeatureCollectionStream(unittest.TestCase):
+    collection = {
+        'type': 'FeatureCollection',
+        'features': [
+            {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [12.6528, 55.614]},
+             'properties': {'stationId': '06180', 'value': 12345.5, 'name': 'Københavns Lufthavn'}},
+            {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [9.8492, 57.0964]},
+             'properties': {'stationId': '06030', 'value': -3, 'name': 'Ålborg'}},
+        ],
+        'numberReturned': 123456,
+        'links': [{'rel': 'next', 'href': 'https://opendataapi.dmi.dk/next'}],
+    }
+
+    def test_features_and_members_are_decoded_from_any_chunking(self):
+        data = json.dumps(self.collection, indent=1, ensure_ascii=False).encode()
+        for size in [1, 2, 7, 64 * 1024]:
+            stream = FeatureCollectionStream(chunked(data, size))
+            self.assertEqual(list(stream), self.collection['features'])
+            self.assertEqual(stream.members['numberReturned'], 123456)
+            self.assertEqual(stream.members['links'], self.collection['links'])
+
+    def test_empty_feature_collection(self):
+        stream = FeatureCollectionStream([b'{"type": "FeatureCollection", "features": [], "numberReturned": 0}'])
+        self.assertEqual(list(stream), [])
+        self.assertEqual(stream.members['numberReturned'], 0)
+
+    def test_error_response_without_features(self):
+        stream = FeatureCollectionStream([b'{"code": 400, "description": "Bad request"}'])
+        self.assertEqual(list(stream), [])
+        self.assertEqual(stream.members['code'], 400)
+
+    def test_truncated_response_raises(self):
+        data = json.dumps(self.collection).encode()
+        with self.assertRaises(FeatureStreamException):
+            list(FeatureCollectionStream(chunked(data[:-40], 16)))
+
+
+class TestFeatureColumns(unittest.TestCase):
+    def test_only_requested_values_are_kept(self):
+        columns = FeatureColumns([Column('value', 'properties.value', ColumnType.FLOAT),
+                                  Column('longitude', 'geometry.coordinates.0', ColumnType.FLOAT),
+                                  Column('missing', 'properties.missing', ColumnType.OBJECT)])
+        columns.extend(TestFeatureCollectionStream.collection['features'])
+        self.assertEqual(len(columns), 2)
+        self.assertEqual(columns.columns['value'], [12345.5, -3])
+        self.assertEqual(columns.columns['longitude'], [12.6528, 9.8492])
+        self.assertEqual(columns.columns['missing'], [None, None])
+        self.assertEqual(columns.first_feature['properties']['stationId'], '06180')
+
+    def test_observations_are_extracted_to_typed_arrays(self):
+        features = [{'properties': {'value': 1.5, 'observed': '2023-01-01T00:00:00Z', 'stationId': '06180'}},
+                    {'properties': {'value': None, 'observed': '2023-01-01T00:10:00Z', 'stationId': '06180'}}]
+        arrays = FeatureColumns(OBSERVATION_SCHEMA).extend(features).to_arrays()
+        self.assertEqual(arrays['value'].dtype, np.float64)
+        self.assertTrue(np.isnan(arrays['value'][1]))
+        self.assertEqual(arrays['observed'].dtype, np.dtype('datetime64[ns]'))
+        self.assertEqual(arrays['observed'][1], np.datetime64('2023-01-01T00:10:00'))
+        self.assertEqual(list(arrays['stationId'].categories), ['06180'])
+        frame = FeatureColumns(OBSERVATION_SCHEMA).extend(features).to_frame()
+        self.assertEqual(str(frame['observed'].dt.tz), 'UTC')
+
+    def test_times_are_written_as_the_api_writes_them(self):
+        features = [{'properties': {'value': 1.5, 'observed': '2023-01-01T00:10:00Z', 'stationId': '06180'}},
+                    {'properties': {'value': 2.5, 'observed': None, 'stationId': '06180'}}]
+        frame = format_times(FeatureColumns(OBSERVATION_SCHEMA).extend(features).to_frame())
+        self.assertEqual(list(frame['observed']), ['2023-01-01T00:10:00Z', None])
+        self.assertEqual(list(frame['value']), [1.5, 2.5])
+        frame = format_times(FeatureColumns(OBSERVATION_SCHEMA).extend(
+            [{'properties': {'observed': '2023-01-01T00:10:00.250Z'}}]
+        ).to_frame())
+        self.assertEqual(list(frame['observed']), ['2023-01-01T00:10:00.250000Z'])
+
+    def test_coordinates_are_written_as_one_column(self):
+        features = [{'geometry': {'type': 'Point', 'coordinates': [12.5, 55.25]},
+                     'properties': {'amp': -9.8, 'observed': '2023-01-01T00:10:00Z', 'strokes': 1}}]
+        frame = join_coordinates(FeatureColumns(LIGHTNING_OBSERVATION_SCHEMA).extend(features).to_frame())
+        self.assertEqual(list(frame)[:3], ['geometry.coordinates', 'properties.amp', 'properties.observed'])
+        self.assertNotIn('longitude', frame)
+        self.assertTrue(frame.to_csv(index=False).splitlines()[1].startswith('"[12.5, 55.25]",-9.8,'))
+
+    def test_features_are_split_by_key(self):
+        features = [{'properties': {'value': value, 'observed': '2023-01-01T00:00:00Z', 'stationId': station_id}}
+                    for value, station_id in [(1, '06180'), (2, '06181'), (3, '06180'), (4, '06030')]]
+        columns = KeyedFeatureColumns(OBSERVATION_SCHEMA, 'properties.stationId', keys=['06180', '06181'])
+        columns.extend(features[:2]).extend_columns(KeyedFeatureColumns(OBSERVATION_SCHEMA, 'properties.stationId').extend(features[2:3]))
+        self.assertEqual(len(columns), 3)
+        self.assertEqual(set(columns.by_key), {'06180', '06181'})
+        self.assertEqual(columns.by_key['06180'].columns['value'], [1, 3])
+        self.assertEqual(columns.by_key['06181'].first_feature['properties']['value'], 2)
+
@@ -0,0 +1,53 @@
+import threading
+import time
+import unittest
+
+from ..api.fetch import fetch_by_group
+
+
+class TestFetchByGroup(unittest.TestCase):
+    def test_groups_are_yielded_with_results_in_job_order(self):
+        def fetch(job):
+            station_id, parameter = job
+            # Later jobs finish first
+            time.sleep(0.01 if parameter == 'temp_dry' else 0)
+            return parameter.upper()
+
+        groups = {station_id: [(station_id, 'temp_dry'), (station_id, 'wind_speed')] for station_id in ['06180', '06181']}
+        results = dict(fetch_by_group(groups, fetch, max_workers=4))
+        self.assertEqual(set(results), {'06180', '06181'})
+        self.assertEqual([result.value for result in results['06180']], ['TEMP_DRY', 'WIND_SPEED'])
+        self.assertEqual(results['06181'][1].job, ('06181', 'wind_speed'))
+
+    def test_failing_jobs_do_not_stop_others(self):
+        def fetch(job):
+            if job == 'bad':
+                raise ValueError(job)
+            return job
+
+        results = dict(fetch_by_group({'a': ['good', 'bad'], 'b': ['good']}, fetch))
+        self.assertIsInstance(results['a'][1].error, ValueError)
+        self.assertEqual(results['a'][0].value, 'good')
+        self.assertEqual(results['b'][0].value, 'good')
+
+    def test_concurrency_is_limited(self):
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def fetch(job):
+            with lock:
+                running[0] += 1
+                running[1] = max(running[1], running[0])
+            time.sleep(0.005)
+            with lock:
+                running[0] -= 1
+
+        list(fetch_by_group({'a': list(range(20))}, fetch, max_workers=3))
+        self.assertLessEqual(running[1], 3)
+
+    def test_groups_without_jobs_are_yielded(self):
+        self.assertEqual(list(fetch_by_group({'a': []}, lambda job: job)), [('a', [])])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import time
+import unittest
+from tempfile import mkdtemp
+
+from ..api.download import PARTIAL_SUFFIX
+from ..api.file_cache import FileCache, PARTIAL_FILE_TTL
+
+
+class TestFileCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = FileCache(mkdtemp(suffix='_file-cache'), max_bytes=250)
+
+    def write(self, *key, size=100, age=0):
+        path = self.cache.path('radar', *key)
+        with open(path, 'wb') as file:
+            file.write(b'x' * size)
+        used = time.time() - age
+        os.utime(path, (used, used))
+        return path
+
+    def test_paths_are_stable_and_keep_the_extension(self):
+        path = self.cache.path('forecast', '2023-01-01T00:00:00Z', 'dkss_nsbs.grib')
+        self.assertEqual(path, self.cache.path('forecast', '2023-01-01T00:00:00Z', 'dkss_nsbs.grib'))
+        self.assertNotEqual(path, self.cache.path('forecast', '2023-01-01T06:00:00Z', 'dkss_nsbs.grib'))
+        self.assertTrue(path.endswith('.grib'))
+
+    def test_only_cached_files_are_returned(self):
+        self.assertIsNone(self.cache.get('radar', 'a.h5'))
+        path = self.write('a.h5', age=60)
+        self.assertEqual(self.cache.get('radar', 'a.h5'), path)
+        # Using a file marks it as recently used
+        self.assertGreater(os.stat(path).st_mtime, time.time() - 10)
+
+    def test_least_recently_used_files_are_evicted(self):
+        oldest = self.write('a.h5', age=300)
+        kept = self.write('b.h5', age=200)
+        self.write('c.h5', age=100)
+        self.write('d.h5')
+        self.assertEqual(self.cache.evict(keep=[kept]), 200)
+        self.assertFalse(os.path.exists(oldest))
+        self.assertTrue(os.path.exists(kept))
+        self.assertEqual(self.cache.size(), 200)
+
+    def test_kept_paths_are_compared_however_they_are_written(self):
+        kept = self.write('a.h5', age=300)
+        self.write('b.h5', age=200)
+        self.write('c.h5')
+        directory, name = os.path.split(kept)
+        self.cache.evict(keep=[os.path.join(directory, '.', name), 'not in the cache'])
+        self.assertTrue(os.path.exists(kept))
+
+    def test_abandoned_partial_files_are_evicted(self):
+        path = self.write('a.h5')
+        os.rename(path, path + PARTIAL_SUFFIX)
+        self.assertEqual(self.cache.evict(), 0)
+        abandoned = time.time() - PARTIAL_FILE_TTL - 1
+        os.utime(path + PARTIAL_SUFFIX, (abandoned, abandoned))
+        self.assertEqual(self.cache.evict(), 100)
+
+    def test_clear(self):
+        self.write('a.h5')
+        self.write('b.h5')
+        self.assertEqual(self.cache.clear(), 200)
+        self.assertEqual(self.cache.size(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
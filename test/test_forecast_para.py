@@ -0,0 +1,24 @@
+import unittest
+
+from ..forecast_para import forecast_bands
+
+
+class TestForecastBands(unittest.TestCase):
+    def test_depth_parameters_have_a_band_per_depth(self):
+        self.assertEqual(forecast_bands('dkss', 'nsbs', ['dev_sea_mean', 'salinity_', 'water_temp_'], [4, 9, 10]), [
+            ('dev_sea_mean', None, 1),
+            ('salinity_', 4, 160), ('salinity_', 9, 161),
+            ('water_temp_', 4, 110), ('water_temp_', 9, 111),
+        ])
+
+    def test_wam_parameters(self):
+        self.assertEqual(forecast_bands('wam', 'dw', ['wind_speed_10', 'sig_wave_height'], [4]), [
+            ('wind_speed_10', None, 1), ('sig_wave_height', None, 3),
+        ])
+
+    def test_areas_have_their_own_depths(self):
+        self.assertEqual(forecast_bands('dkss', 'if', ['salinity_'], [1, 4]), [('salinity_', 1, 40), ('salinity_', 4, 42)])
+
+
+if __name__ == '__main__':
+    unittest.main()
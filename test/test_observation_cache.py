@@ -0,0 +1,145 @@
+import json
+import os
+import unittest
+from datetime import timedelta
+from tempfile import mkdtemp
+from unittest import mock
+
+from ..api import client
+from ..api.features import FeatureColumns
+from ..api.observation_cache import ObservationCache, fetch_features_cached
+from ..api.schemas import OBSERVATION_SCHEMA, STATION_VALUE_SCHEMA
+from ..api.sharding import parse_interval, parse_datetime
+
+URL = 'https://example.com/v2/metObs/collections/observation/items'
+
+
+class FakeResponse:
+    def __init__(self, features):
+        self.status_code = 200
+        self.url = URL
+        self.body = {'type': 'FeatureCollection', 'features': features, 'numberMatched': len(features)}
+        self.content = json.dumps(self.body).encode()
+
+    def json(self):
+        return self.body
+
+    def iter_content(self, chunk_size):
+        yield self.content
+
+    def close(self):
+        pass
+
+
+class FakeObservationApi:
+    """
+    An hourly series of observations in January 2023, recording the periods queried
+    """
+
+    def __init__(self):
+        self.times = ['2023-01-{:02}T{:02}:00:00Z'.format(day, hour) for day in range(1, 32) for hour in range(24)]
+        self.queried = []
+
+    def get(self, url, params=None, stream=False, deadline=None):
+        start, end = parse_interval(params['datetime'])
+        if params.get('offset', 0) == 0:
+            self.queried.append(params['datetime'])
+        matched = [time for time in self.times if start <= parse_datetime(time) <= end]
+        features = [
+            {'geometry': {'type': 'Point', 'coordinates': [12.65, 55.61]},
+             'properties': {'stationId': params['stationId'], 'observed': time, 'value': index}}
+            for index, time in enumerate(matched)
+        ][params.get('offset', 0):][:params['limit']]
+        return FakeResponse(features)
+
+
+class FakeClimateApi:
+    """
+    Monthly climate values in 2023, returned like the API when their period overlaps the queried one
+    """
+
+    def __init__(self):
+        self.months = [('2023-{:02}-01T00:00:00Z'.format(month), '2023-{:02}-01T00:00:00Z'.format(month + 1))
+                       for month in range(1, 12)]
+
+    def get(self, url, params=None, stream=False, deadline=None):
+        start, end = parse_interval(params['datetime'])
+        matched = [(time_from, time_to) for time_from, time_to in self.months
+                   if parse_datetime(time_from) <= end and parse_datetime(time_to) >= start]
+        features = [
+            {'properties': {'stationId': params['stationId'], 'from': time_from, 'to': time_to, 'value': index}}
+            for index, (time_from, time_to) in enumerate(matched)
+        ][params.get('offset', 0):][:params['limit']]
+        return FakeResponse(features)
+
+
+class TestObservationCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ObservationCache(os.path.join(mkdtemp(suffix='_observation-cache'), 'observations.sqlite'),
+                                      settle_delay=timedelta(0))
+        self.api = FakeObservationApi()
+
+    def fetch(self, datetime):
+        params = {'datetime': datetime, 'parameterId': 'temp_dry', 'stationId': '06180'}
+        with mock.patch.object(client, 'get', side_effect=self.api.get):
+            return fetch_features_cached(self.cache, URL, params, OBSERVATION_SCHEMA, 'observed')
+
+    def test_only_the_missing_part_of_a_period_is_fetched(self):
+        status_code, columns = self.fetch('2023-01-01T00:00:00Z/2023-01-10T23:00:00Z')
+        self.assertEqual((status_code, len(columns)), (200, 240))
+        status_code, columns = self.fetch('2023-01-05T00:00:00Z/2023-01-11T23:00:00Z')
+        self.assertEqual(len(columns), 7 * 24)
+        self.assertEqual(self.api.queried, [
+            '2023-01-01T00:00:00Z/2023-01-10T23:00:00Z',
+            '2023-01-10T23:00:00.000001Z/2023-01-11T23:00:00Z',
+        ])
+        self.assertEqual(columns.columns['observed'][0], '2023-01-05T00:00:00Z')
+        self.assertEqual(columns.columns['observed'], sorted(columns.columns['observed']))
+        self.assertEqual(columns.first_feature['geometry']['coordinates'], [12.65, 55.61])
+
+    def test_gaps_between_cached_periods_are_filled(self):
+        self.fetch('2023-01-01T00:00:00Z/2023-01-02T00:00:00Z')
+        self.fetch('2023-01-05T00:00:00Z/2023-01-06T00:00:00Z')
+        _, columns = self.fetch('2023-01-01T00:00:00Z/2023-01-06T00:00:00Z')
+        self.assertEqual(self.api.queried[-1], '2023-01-02T00:00:00.000001Z/2023-01-04T23:59:59.999999Z')
+        self.assertEqual(len(columns), 5 * 24 + 1)
+        self.assertEqual(len(self.cache.intervals(self.cache.series(URL, {'parameterId': 'temp_dry', 'stationId': '06180'}))), 1)
+
+    def test_recent_values_are_fetched_again(self):
+        self.cache.settle_delay = timedelta(days=365 * 100)
+        self.fetch('2023-01-01T00:00:00Z/2023-01-02T00:00:00Z')
+        _, columns = self.fetch('2023-01-01T00:00:00Z/2023-01-02T00:00:00Z')
+        self.assertEqual(len(self.api.queried), 2)
+        self.assertEqual(len(columns), 25)
+
+    def test_rows_refetched_outside_the_interval_are_not_duplicated(self):
+        series = self.cache.series(URL, {'parameterId': 'temp_dry', 'stationId': '06180'})
+        # The second interval doesn't contain the value, like a boundary value returned again by the API
+        for value, interval in [(1.0, '2023-01-01T00:00:00Z/2023-01-01T12:00:00Z'),
+                                (2.0, '2023-01-01T13:00:00Z/2023-01-01T14:00:00Z')]:
+            columns = FeatureColumns(OBSERVATION_SCHEMA).extend(
+                [{'properties': {'stationId': '06180', 'observed': '2023-01-01T12:00:00Z', 'value': value}}]
+            )
+            self.cache.store(series, parse_interval(interval), columns, 'observed')
+        columns = self.cache.load(series, parse_interval('2023-01-01T00:00:00Z/2023-01-02T00:00:00Z'), OBSERVATION_SCHEMA)
+        self.assertEqual(columns.columns['value'], [2.0])
+
+    def test_values_overlapping_the_start_are_returned(self):
+        params = {'datetime': '2023-01-15T00:00:00Z/2023-03-15T00:00:00Z', 'parameterId': 'mean_temp',
+                  'stationId': '06180', 'timeResolution': 'month'}
+        with mock.patch.object(client, 'get', side_effect=FakeClimateApi().get):
+            for _ in range(2):
+                status_code, columns = fetch_features_cached(self.cache, URL, params, STATION_VALUE_SCHEMA, 'from')
+                self.assertEqual(status_code, 200)
+                self.assertEqual(columns.columns['from'],
+                                 ['2023-01-01T00:00:00Z', '2023-02-01T00:00:00Z', '2023-03-01T00:00:00Z'])
+
+    def test_clear(self):
+        self.fetch('2023-01-01T00:00:00Z/2023-01-10T23:00:00Z')
+        self.assertGreater(self.cache.clear(), 0)
+        self.fetch('2023-01-01T00:00:00Z/2023-01-01T23:00:00Z')
+        self.assertEqual(len(self.api.queried), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import json
+import unittest
+from unittest import mock
+
+from ..api import pagination
+from ..api.client import OpenDataAPIException
+from ..api.pagination import FeaturePages
+from ..api.progress import FetchProgress, FetchCancelled
+
+
+class FakeResponse:
+    def __init__(self, status_code, features=(), next_link=True, number_matched=None):
+        self.status_code = status_code
+        self.url = 'https://example.com/items'
+        body = {'type': 'FeatureCollection', 'features': list(features), 'numberReturned': len(features)}
+        if number_matched is not None:
+            body['numberMatched'] = number_matched
+        body['links'] = [{'rel': 'next', 'href': 'https://example.com/next'}] if next_link else []
+        self.content = json.dumps(body).encode()
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+def paged_responses(total, status_codes=None, number_matched=True):
+    status_codes = status_codes or {}
+
+    def get(url, params=None, stream=False, deadline=None):
+        offset, limit = params['offset'], params['limit']
+        features = [{'properties': {'value': value}} for value in range(offset, min(total, offset + limit))]
+        return FakeResponse(status_codes.get(offset, 200), features, next_link=offset + limit < total,
+                            number_matched=total if number_matched else None)
+
+    return get
+
+
+class TestFeaturePages(unittest.TestCase):
+    def values(self, pages):
+        return [feature['properties']['value'] for feature in pages]
+
+    def test_all_pages_are_returned_in_order(self):
+        for prefetch in [True, False]:
+            with mock.patch.object(pagination.client, 'get', side_effect=paged_responses(25)) as get:
+                pages = FeaturePages('https://example.com/items', {'parameterId': 'temp_dry'}, 10, prefetch)
+                self.assertEqual(self.values(pages), list(range(25)))
+            self.assertEqual(pages.pages, 3)
+            self.assertEqual(get.call_args.kwargs['params']['parameterId'], 'temp_dry')
+            self.assertEqual(get.call_args.kwargs['deadline'], pagination.client.DEFAULT_DEADLINE)
+
+    def test_result_smaller_than_a_page_is_a_single_request(self):
+        for number_matched in [True, False]:
+            responses = paged_responses(3, number_matched=number_matched)
+            with mock.patch.object(pagination.client, 'get', side_effect=responses) as get:
+                pages = FeaturePages('https://example.com/items', {}, 10)
+                self.assertEqual(self.values(pages), [0, 1, 2])
+            self.assertEqual(get.call_count, 1)
+
+    def test_no_page_is_requested_after_the_last(self):
+        for number_matched in [True, False]:
+            responses = paged_responses(20, number_matched=number_matched)
+            with mock.patch.object(pagination.client, 'get', side_effect=responses) as get:
+                self.assertEqual(len(self.values(FeaturePages('https://example.com/items', {}, 10))), 20)
+            self.assertEqual(get.call_count, 2)
+
+    def test_missing_next_link_ends_paging(self):
+        with mock.patch.object(pagination.client, 'get', side_effect=paged_responses(20)):
+            pages = FeaturePages('https://example.com/items', {}, 10, prefetch=False)
+            self.assertEqual(len(self.values(pages)), 20)
+        self.assertEqual(pages.pages, 2)
+
+    def test_first_page_error_returns_no_features(self):
+        with mock.patch.object(pagination.client, 'get', side_effect=paged_responses(25, {0: 403})):
+            pages = FeaturePages('https://example.com/items', {}, 10)
+            self.assertEqual(self.values(pages), [])
+        self.assertEqual(pages.status_code, 403)
+
+    def test_later_page_error_is_not_silent(self):
+        with mock.patch.object(pagination.client, 'get', side_effect=paged_responses(25, {10: 500})):
+            with self.assertRaises(OpenDataAPIException):
+                self.values(FeaturePages('https://example.com/items', {}, 10))
+
+    def test_progress_counts_pages_and_rows(self):
+        progress = FetchProgress()
+        with mock.patch.object(pagination.client, 'get', side_effect=paged_responses(25)):
+            self.values(FeaturePages('https://example.com/items', {}, 10, progress=progress))
+        self.assertEqual((progress.pages, progress.rows), (3, 25))
+        self.assertGreater(progress.bytes, 0)
+
+    def test_cancelling_stops_paging(self):
+        progress = FetchProgress()
+        with mock.patch.object(pagination.client, 'get', side_effect=paged_responses(25)):
+            features = iter(FeaturePages('https://example.com/items', {}, 10, progress=progress))
+            next(features)
+            progress.cancel()
+            with self.assertRaises(FetchCancelled):
+                list(features)
+
+
+if __name__ == '__main__':
+    unittest.main()
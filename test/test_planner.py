@@ -0,0 +1,75 @@
+import unittest
+
+from ..api.planner import plan_station_queries, measures
+from ..api.sharding import parse_interval
+from ..api.station import Station
+
+
+class TestPlanStationQueries(unittest.TestCase):
+    def setUp(self):
+        self.catalogue = {
+            # Measured wind until 2020, temperature ever since
+            '06180': Station('06180', 'Københavns Lufthavn', ['temp_dry'], [
+                ('2000-01-01T00:00:00Z', '2020-01-01T00:00:00Z', ('temp_dry', 'wind_speed')),
+                ('2020-01-01T00:00:00Z', None, ('temp_dry',)),
+            ]),
+            '06181': Station('06181', 'Jægersborg', ['temp_dry']),
+        }
+
+    def test_combinations_without_data_are_skipped(self):
+        plan = plan_station_queries(
+            ['06180', '06181'], ['temp_dry', 'wind_speed'], self.catalogue, '2021-01-01T00:00:00Z/2021-02-01T00:00:00Z'
+        )
+        self.assertEqual(plan.jobs, {'06180': ['temp_dry'], '06181': ['temp_dry']})
+        self.assertEqual(plan.skipped, {'06180': ['wind_speed'], '06181': ['wind_speed']})
+        self.assertEqual(plan.skipped_count(), 2)
+
+    def test_history_is_matched_against_the_period(self):
+        station = self.catalogue['06180']
+        self.assertTrue(measures(station, 'wind_speed', parse_interval('2019-06-01T00:00:00Z/2021-01-01T00:00:00Z')))
+        self.assertFalse(measures(station, 'wind_speed', parse_interval('2021-01-01T00:00:00Z/2022-01-01T00:00:00Z')))
+        self.assertTrue(measures(station, 'wind_speed', None))
+
+    def test_stations_missing_from_the_catalogue_are_requested(self):
+        plan = plan_station_queries(['10km_611_59'], ['mean_temp'], self.catalogue, '')
+        self.assertEqual(plan.jobs, {'10km_611_59': ['mean_temp']})
+        self.assertEqual(plan.skipped, {})
+
+    def test_stations_without_any_parameter_are_left_out(self):
+        plan = plan_station_queries(['06181'], ['wind_speed'], self.catalogue, '')
+        self.assertEqual(plan.jobs, {})
+
+
+class TestPlanBulkQueries(unittest.TestCase):
+    def setUp(self):
+        # A row of stations along a line of longitude, the odd ones without wind measurements
+        self.catalogue = {
+            f'06{index:03}': Station(f'06{index:03}', f'Station {index}',
+                                     ['temp_dry', 'wind_speed'] if index % 2 == 0 else ['temp_dry'],
+                                     coordinates=(10.0 + index / 10, 55.0))
+            for index in range(40)
+        }
+
+    def test_parameter_of_many_stations_is_fetched_by_bbox(self):
+        selected = [f'06{index:03}' for index in range(20)]
+        plan = plan_station_queries(selected, ['temp_dry', 'wind_speed'], self.catalogue, '', bulk_threshold=10)
+        self.assertEqual(set(plan.bulk), {'temp_dry', 'wind_speed'})
+        self.assertEqual(plan.bulk['temp_dry'].stations, selected)
+        self.assertEqual(plan.bulk['temp_dry'].bbox, (9.99, 54.99, 11.91, 55.01))
+        self.assertEqual(plan.bulk['wind_speed'].covered_stations, 10)
+        self.assertEqual(plan.jobs, {})
+
+    def test_scattered_selection_is_fetched_per_station(self):
+        # The bbox of the first and last station covers all 40
+        selected = [f'06{index:03}' for index in [0, 1, 2, 3, 4, 5, 6, 7, 8, 39]]
+        plan = plan_station_queries(selected, ['temp_dry'], self.catalogue, '', bulk_threshold=10)
+        self.assertEqual(plan.bulk, {})
+        self.assertEqual(len(plan.jobs), 10)
+
+    def test_few_stations_are_fetched_per_station(self):
+        plan = plan_station_queries(['06000', '06002'], ['temp_dry'], self.catalogue, '', bulk_threshold=10)
+        self.assertEqual(plan.bulk, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
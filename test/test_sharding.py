@@ -0,0 +1,106 @@
+import json
+import unittest
+from unittest import mock
+
+from ..api import client
+from ..api.fetch import fetch_features
+from ..api.schemas import Column, ColumnType
+from ..api.sharding import split_interval, parse_interval, plan_shards, parse_datetime
+
+
+class FakeResponse:
+    def __init__(self, features, number_matched):
+        self.status_code = 200
+        self.url = 'https://example.com/items'
+        self.body = {'type': 'FeatureCollection', 'features': features, 'numberMatched': number_matched}
+        self.content = json.dumps(self.body).encode()
+
+    def json(self):
+        return self.body
+
+    def iter_content(self, chunk_size):
+        yield self.content
+
+    def close(self):
+        pass
+
+
+class TestSharding(unittest.TestCase):
+    def test_shards_cover_the_interval_without_overlap(self):
+        shards = split_interval(*parse_interval('2023-01-01T00:00:00Z/2023-01-04T00:00:00Z'), 3)
+        self.assertEqual(shards, [
+            '2023-01-01T00:00:00Z/2023-01-01T23:59:59.999999Z',
+            '2023-01-02T00:00:00Z/2023-01-02T23:59:59.999999Z',
+            '2023-01-03T00:00:00Z/2023-01-04T00:00:00Z',
+        ])
+
+    def test_short_intervals_are_not_split_below_minimum_duration(self):
+        self.assertEqual(len(split_interval(*parse_interval('2023-01-01T00:00:00Z/2023-01-01T02:00:00Z'), 10)), 2)
+
+    def test_shard_count_follows_number_matched(self):
+        params = {'datetime': '2023-01-01T00:00:00Z/2023-02-01T00:00:00Z', 'parameterId': 'temp_dry'}
+        self.assertEqual(plan_shards(params, 1000, shard_size=1000), [params])
+        self.assertEqual(plan_shards(params, None, shard_size=1000), [params])
+        shards = plan_shards(params, 3500, shard_size=1000)
+        self.assertEqual(len(shards), 4)
+        self.assertTrue(all(shard['parameterId'] == 'temp_dry' for shard in shards))
+
+    def test_fetch_features_concatenates_shards_in_time_order(self):
+        times = ['2023-01-0{}T12:00:00Z'.format(day) for day in range(1, 5)]
+
+        def get(url, params=None, stream=False, deadline=None):
+            start, end = parse_interval(params['datetime'])
+            matched = [time for time in times if start <= parse_datetime(time) <= end]
+            page = matched[params['offset']:params['offset'] + params['limit']]
+            return FakeResponse([{'properties': {'observed': time}} for time in page], len(matched))
+
+        schema = [Column('observed', 'properties.observed', ColumnType.STRING)]
+        with mock.patch.object(client, 'get', side_effect=get):
+            status_code, columns = fetch_features(
+                'https://example.com/items', {'datetime': '2023-01-01T00:00:00Z/2023-01-05T00:00:00Z'}, schema,
+                shard_size=1, page_size=1
+            )
+        self.assertEqual(status_code, 200)
+        self.assertEqual(list(columns.to_arrays()['observed']), times)
+
+    def test_short_queries_are_a_single_request(self):
+        schema = [Column('observed', 'properties.observed', ColumnType.STRING)]
+        features = [{'properties': {'observed': '2023-01-01T00:00:00Z'}}]
+        for datetime in ['2023-01-01T00:00:00Z/2023-01-01T01:00:00Z', '2023-01-01T00:00:00Z/..', None]:
+            params = {'datetime': datetime} if datetime is not None else {}
+            with mock.patch.object(client, 'get', return_value=FakeResponse(features, 1)) as get:
+                status_code, columns = fetch_features('https://example.com/items', params, schema)
+            self.assertEqual((status_code, len(columns)), (200, 1))
+            self.assertEqual(get.call_count, 1)
+            self.assertEqual(get.call_args.kwargs['params']['limit'], 10000)
+
+    def test_values_spanning_shards_are_returned_once(self):
+        # Daily values, each matched by every window it overlaps
+        days = [('2023-01-0{}T00:00:00Z'.format(day), '2023-01-0{}T00:00:00Z'.format(day + 1)) for day in range(1, 5)]
+
+        def get(url, params=None, stream=False, deadline=None):
+            start, end = parse_interval(params['datetime'])
+            matched = [
+                (day_from, day_to) for day_from, day_to in days
+                if parse_datetime(day_from) <= end and parse_datetime(day_to) >= start
+            ]
+            page = matched[params['offset']:params['offset'] + params['limit']]
+            return FakeResponse([{'properties': {'from': day_from, 'to': day_to}} for day_from, day_to in page],
+                                len(matched))
+
+        schema = [Column('from', 'properties.from', ColumnType.STRING), Column('to', 'properties.to', ColumnType.STRING)]
+        with mock.patch.object(client, 'get', side_effect=get):
+            _, columns = fetch_features(
+                'https://example.com/items', {'datetime': '2023-01-01T00:00:00Z/2023-01-05T00:00:00Z'}, schema,
+                shard_size=1, page_size=1
+            )
+        self.assertEqual(list(columns.to_arrays()['from']), [day_from for day_from, _ in days])
+
+    def test_shard_boundaries_are_whole_hours(self):
+        shards = split_interval(*parse_interval('2023-01-01T00:00:00Z/2023-01-01T05:00:00Z'), 3)
+        self.assertEqual([shard.split('/')[0] for shard in shards],
+                         ['2023-01-01T00:00:00Z', '2023-01-01T01:00:00Z', '2023-01-01T03:00:00Z'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import json
+import time
+import unittest
+from tempfile import mkdtemp
+from unittest import mock
+
+from ..api import station
+from ..api.station import Station, StationApi, StationCache, StationCatalogue, get_stations, \
+    get_stations_stale_while_revalidate, get_stations_concurrently, StationAPIGenericException, \
+    StationCatalogueBuilder
+
+
+def station_feature(station_id, name, valid_from, parameters, valid_to=None):
+    return {'properties': {'stationId': station_id, 'name': name, 'validFrom': valid_from, 'validTo': valid_to,
+                           'parameterId': parameters}}
+
+
+class FakeResponse:
+    def __init__(self, status_code, features=(), headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._features = list(features)
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        yield json.dumps({'type': 'FeatureCollection', 'features': self._features}).encode()
+
+    def close(self):
+        self.closed = True
+
+
+class TestStationCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = StationCache(mkdtemp(suffix='_station-cache'), ttl=60)
+
+    def test_store_and_load_round_trip(self):
+        stations = {'06180': Station('06180', 'Københavns Lufthavn', ['temp_dry', 'wind_speed'])}
+        self.cache.store(StationApi.MET_OBS, StationCatalogue(stations, 123.0, '"abc"', None))
+        cached = self.cache.load(StationApi.MET_OBS)
+        self.assertEqual(cached.etag, '"abc"')
+        self.assertEqual(cached.stations['06180'].station_name, 'Københavns Lufthavn')
+        self.assertEqual(cached.stations['06180'].parameters, ['temp_dry', 'wind_speed'])
+        self.assertIsNone(self.cache.load(StationApi.OCEAN_OBS))
+
+    def test_fresh_cache_is_used_without_network(self):
+        stations = {'06180': Station('06180', 'Københavns Lufthavn', ['temp_dry'])}
+        self.cache.store(StationApi.MET_OBS, StationCatalogue(stations, time.time()))
+        with mock.patch.object(station.client, 'get') as get:
+            self.assertEqual(list(get_stations(StationApi.MET_OBS, self.cache)), ['06180'])
+        get.assert_not_called()
+
+    def test_expired_cache_is_revalidated_conditionally(self):
+        stations = {'06180': Station('06180', 'Københavns Lufthavn', ['temp_dry'])}
+        self.cache.store(StationApi.MET_OBS, StationCatalogue(stations, time.time() - 120, '"abc"'))
+        response = FakeResponse(304)
+        with mock.patch.object(station.client, 'get', return_value=response) as get:
+            self.assertEqual(list(get_stations(StationApi.MET_OBS, self.cache)), ['06180'])
+        self.assertEqual(get.call_args.kwargs['headers'], {'If-None-Match': '"abc"'})
+        self.assertFalse(self.cache.load(StationApi.MET_OBS).is_expired(self.cache.ttl))
+        self.assertTrue(response.closed)
+
+    def test_cached_catalogue_is_returned_when_revalidation_fails(self):
+        stations = {'06180': Station('06180', 'Københavns Lufthavn', ['temp_dry'])}
+        self.cache.store(StationApi.MET_OBS, StationCatalogue(stations, time.time() - 120))
+        response = FakeResponse(503)
+        with mock.patch.object(station.client, 'get', return_value=response):
+            self.assertEqual(list(get_stations(StationApi.MET_OBS, self.cache)), ['06180'])
+        self.assertTrue(response.closed)
+
+    def test_stale_catalogue_is_returned_for_background_revalidation(self):
+        stations = {'06180': Station('06180', 'Københavns Lufthavn', ['temp_dry'])}
+        self.cache.store(StationApi.MET_OBS, StationCatalogue(stations, time.time() - 120))
+        with mock.patch.object(station.client, 'get') as get:
+            cached_stations, needs_revalidation = get_stations_stale_while_revalidate(StationApi.MET_OBS, self.cache)
+        get.assert_not_called()
+        self.assertTrue(needs_revalidation)
+        self.assertEqual(list(cached_stations), ['06180'])
+
+    def test_fetched_catalogue_is_stored(self):
+        features = [station_feature('06180', 'Kastrup', '2000-01-01T00:00:00Z', ['temp_dry']),
+                    station_feature('06180', 'Københavns Lufthavn', '2010-01-01T00:00:00Z', ['temp_dry'])]
+        response = FakeResponse(200, features, {'ETag': '"def"'})
+        with mock.patch.object(station.client, 'get', return_value=response):
+            stations = get_stations(StationApi.MET_OBS, self.cache)
+        self.assertEqual(stations['06180'].station_name, 'Københavns Lufthavn')
+        self.assertEqual(self.cache.load(StationApi.MET_OBS).etag, '"def"')
+
+
+class TestGetStationsConcurrently(unittest.TestCase):
+    def test_failing_api_does_not_affect_the_others(self):
+        def fetch(station_api, cache):
+            if station_api is StationApi.OCEAN_OBS:
+                raise StationAPIGenericException()
+            return {station_api.value: Station(station_api.value, 'name', [])}
+
+        catalogues, failures = get_stations_concurrently(StationApi, fetch=fetch)
+        self.assertEqual(set(catalogues), {StationApi.MET_OBS, StationApi.CLIMATE_STATION_VALUE})
+        self.assertIsInstance(failures[StationApi.OCEAN_OBS], StationAPIGenericException)
+
+
+class TestStationCatalogueBuilder(unittest.TestCase):
+    features = [
+        station_feature('06180', 'Københavns Lufthavn', '2010-01-01T00:00:00Z', ['temp_dry', 'wind_speed']),
+        station_feature('06030', 'Flyvestation Aalborg', '2001-01-01T00:00:00Z', ['temp_dry']),
+        station_feature('06180', 'Kastrup', '2000-01-01T00:00:00Z', ['temp_dry'], '2010-01-01T00:00:00Z'),
+    ]
+
+    def test_latest_record_is_chosen_from_unsorted_features(self):
+        builder = StationCatalogueBuilder()
+        for feature in self.features:
+            builder.add(feature)
+        stations = builder.build()
+        self.assertEqual(stations['06180'].station_name, 'Københavns Lufthavn')
+        self.assertEqual(stations['06180'].parameters, ['temp_dry', 'wind_speed'])
+        self.assertEqual(stations['06030'].station_name, 'Flyvestation Aalborg')
+        self.assertIsNone(stations['06180'].history)
+
+    def test_history_is_kept_in_validity_order(self):
+        builder = StationCatalogueBuilder(keep_history=True)
+        for feature in self.features:
+            builder.add(feature)
+        history = builder.build()['06180'].history
+        self.assertEqual(history, [('2000-01-01T00:00:00Z', '2010-01-01T00:00:00Z', ('temp_dry',)),
+                                   ('2010-01-01T00:00:00Z', None, ('temp_dry', 'wind_speed'))])
+        # Records measuring the same parameters share the parameter tuple
+        self.assertIs(history[0][2], builder.build()['06030'].history[0][2])
+
+    def test_coordinates_of_the_latest_record_are_kept(self):
+        builder = StationCatalogueBuilder()
+        for feature in self.features:
+            builder.add({**feature, 'geometry': {'type': 'Point', 'coordinates': [12.65, 55.61]}})
+        builder.add({**station_feature('06030', 'Aalborg', '2020-01-01T00:00:00Z', []), 'geometry': None})
+        stations = builder.build()
+        self.assertEqual(stations['06180'].coordinates, (12.65, 55.61))
+        self.assertIsNone(stations['06030'].coordinates)
+        cache = StationCache(mkdtemp(suffix='_station-cache'))
+        cache.store(StationApi.MET_OBS, StationCatalogue(stations, time.time()))
+        self.assertEqual(cache.load(StationApi.MET_OBS).stations['06180'].coordinates, (12.65, 55.61))
+
+    def test_cache_without_history_is_ignored_when_history_is_wanted(self):
+        cache = StationCache(mkdtemp(suffix='_station-cache'))
+        cache.store(StationApi.MET_OBS, StationCatalogue({'06180': Station('06180', 'Kastrup', [])}, time.time()))
+        self.assertIsNotNone(cache.load(StationApi.MET_OBS))
+        self.assertIsNone(cache.load(StationApi.MET_OBS, keep_history=True))
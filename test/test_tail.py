@@ -0,0 +1,46 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from ..api.tail import LayerQuery
+
+URL = 'https://example.com/v2/metObs/collections/observation/items'
+
+
+class TestLayerQuery(unittest.TestCase):
+    def setUp(self):
+        self.query = LayerQuery(URL, {'stationId': '06180'}, ['temp_dry', 'wind_speed'], 'observed')
+        # Wind is reported less often than temperature
+        self.query.advance(pd.DataFrame({
+            'observed': pd.DatetimeIndex(['2023-01-01T00:00:00', '2023-01-01T00:10:00']).tz_localize('UTC'),
+            'stationId': ['06180', '06180'],
+            'temp_dry': [1.5, 1.7],
+            'wind_speed': [4.0, np.nan],
+        }))
+
+    def test_latest_value_of_each_parameter(self):
+        self.assertEqual(self.query.latest, {'temp_dry': '2023-01-01T00:10:00Z', 'wind_speed': '2023-01-01T00:00:00Z'})
+        self.assertEqual(self.query.latest_time(), '2023-01-01T00:10:00Z')
+
+    def test_only_values_after_the_latest_are_queried(self):
+        self.assertEqual(self.query.tail_params(), {
+            'temp_dry': {'stationId': '06180', 'parameterId': 'temp_dry', 'datetime': '2023-01-01T00:10:00.000001Z/..'},
+            'wind_speed': {'stationId': '06180', 'parameterId': 'wind_speed', 'datetime': '2023-01-01T00:00:00.000001Z/..'},
+        })
+
+    def test_advance_keeps_later_times(self):
+        self.query.advance(pd.DataFrame({
+            'observed': pd.DatetimeIndex(['2023-01-01T00:10:00']).tz_localize('UTC'),
+            'wind_speed': [4.2],
+        }))
+        self.assertEqual(self.query.latest['wind_speed'], '2023-01-01T00:10:00Z')
+        self.assertEqual(self.query.latest['temp_dry'], '2023-01-01T00:10:00Z')
+
+    def test_json_round_trip(self):
+        query = LayerQuery.from_json(self.query.to_json())
+        self.assertEqual(query.to_json(), self.query.to_json())
+
+
+if __name__ == '__main__':
+    unittest.main()